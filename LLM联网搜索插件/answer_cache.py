@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from metrics import record_cache
+
+# 每写入这么多条就清理一次 SQLite 中过期的条目 | Purge expired SQLite rows once every this many writes
+_PURGE_EVERY = 100
+
+
+def normalize_prompt(text: str) -> str:
+    """合并连续空白并去掉首尾空白，只有排版不同的提示词得到相同的键。 | Collapse whitespace runs and trim, so prompts that differ only in layout share a key."""
+    return " ".join((text or "").split())
+
+
+class AnswerCache:
+    """
+    LLM 回答缓存：按规范化请求的哈希保存回答，内存中为有 TTL 的 LRU，可选写透到 SQLite 以便重启后继续使用。
+    Cache of LLM answers keyed by a hash of the normalised request: an in-memory LRU with a TTL,
+    optionally written through to SQLite so entries survive restarts.
+
+    只应写入模型成功返回的回答，错误信息不缓存。
+    Only answers the model actually produced should be stored; error messages are never cached.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, path: Optional[str] = None,
+                 deterministic_only: bool = False, name: str = "llm_answers"):
+        """
+        参数 | Args:
+            max_entries: 内存中最多保存的条目数 | Most entries kept in memory
+            ttl: 条目的有效期（秒） | Seconds an entry stays valid
+            path: SQLite 持久化文件路径，None 表示只缓存在内存中 | SQLite file for persistence; None keeps entries in memory only
+            deterministic_only: 为 True 时 temperature > 0 的请求不读也不写缓存（采样结果不可复现） |
+                                When True, requests with temperature > 0 bypass the cache (sampled answers are not reproducible)
+            name: 指标中的缓存名 | Cache name used in metrics
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self.name = name
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def should_cache(self, temperature: Optional[float]) -> bool:
+        """该温度下的请求是否使用缓存。 | Whether a request at this temperature may use the cache."""
+        return not (self.deterministic_only and temperature and temperature > 0)
+
+    @staticmethod
+    def make_key(kind: str, **params: Any) -> str:
+        """
+        由请求类型和参数生成缓存键；字符串参数先规范化空白，浮点数保留 4 位小数。
+        Build a cache key from the request kind and its parameters; strings are whitespace-normalised
+        and floats rounded to 4 places first.
+        """
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                value = normalize_prompt(value)
+            elif isinstance(value, float):
+                value = round(value, 4)
+            normalized[name] = value
+        payload = json.dumps([kind, normalized], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """返回未过期的缓存值，没有时返回 None。 | Return the cached value if it has not expired, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created_at, value FROM answers WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember(key, entry)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache(self.name, entry is not None)
+        return entry[1] if entry is not None else None
+
+    def put(self, key: str, value: Any):
+        """保存一个 JSON 可序列化的值。 | Store a JSON-serialisable value."""
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), entry[0])
+                )
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM answers WHERE created_at < ?", (entry[0] - self.ttl,))
+                self._conn.commit()
+
+    def _remember(self, key: str, entry: Tuple[float, Any]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空内存和 SQLite 中的所有条目。 | Drop every entry from memory and SQLite."""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,50 +1,270 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, request, jsonify, render_template, redirect, url_for, Response, stream_with_context, g
+import contextvars
 import json
 import os
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import pytz
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+import deadline
 from search_engine import WebSearch
-from response_processor import ResponseProcessor
+from local_search import LocalSearchIndex
+from page_store import PageStore
+from dedupe import NearDuplicateFilter
+from url_resolver import RedirectResolver
+from response_processor import ResponseProcessor, estimate_tokens
+from answer_cache import AnswerCache
+from model_warmup import ModelWarmer, parse_active_hours
+from singleflight import SingleFlight
+from page_condenser import PageCondenser
+from llm_queue import LLMQueue, QueueRejected, JobCancelled, connection_closed
+from time_service import TimeService
+from response_encoding import json_response, parse_fields, select_fields
+from metrics import registry, time_stage, IN_FLIGHT, REQUEST_LATENCY
+from request_timing import begin_request_timings, end_request_timings, record_timing
 import traceback
 import time
+import logging
 
 # 加载环境变量
 load_dotenv()
 
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # 全局配置变量
 config = {
     'default_search_engine': 'google',
+    # 熔断器打开或搜索失败时使用的备用引擎（留空表示直接返回模拟结果）
+    'fallback_search_engine': os.environ.get('FALLBACK_SEARCH_ENGINE', ''),
+    'breaker_failure_threshold': 3,
+    'breaker_recovery_timeout': 60,
+    # "local" 搜索引擎使用的 SQLite FTS5 索引文件，抓取过的网页会自动写入
+    'local_index_path': os.environ.get('LOCAL_INDEX_PATH', 'local_search_index.db'),
+    # 抓取网页的持久化存储（压缩、追加写入），以及复用已存网页的有效期（秒，0 表示总是重新抓取）
+    'page_store_path': os.environ.get('PAGE_STORE_PATH', 'page_store.dat'),
+    'page_store_max_mb': int(os.environ.get('PAGE_STORE_MAX_MB', 512)),
+    'page_store_max_age_days': int(os.environ.get('PAGE_STORE_MAX_AGE_DAYS', 30)),
+    'page_cache_ttl': int(os.environ.get('PAGE_CACHE_TTL', 3600)),
+    # 百度跳转链接解析结果的持久化缓存（解析在线程池中并发进行）
+    'redirect_cache_path': os.environ.get('REDIRECT_CACHE_PATH', 'redirect_cache.db'),
+    'redirect_max_workers': 8,
+    # 正文提取方式: density（文本密度，单次遍历）或 selectors（常见正文选择器）
+    'content_extractor': os.environ.get('CONTENT_EXTRACTOR', 'density'),
+    # 近似重复结果过滤（SimHash 汉明距离阈值）：抓取前按标题+摘要，构建提示词前按正文
+    'dedupe_enabled': True,
+    'dedupe_snippet_threshold': 6,
+    'dedupe_content_threshold': 4,
     'default_num_results': 5,
     'default_fetch_content': False,
+    # 提示词中搜索结果的格式: markdown（原有格式）、compact（编号纯文本，预填充最少）或 jsonl
+    'prompt_format': os.environ.get('PROMPT_FORMAT', 'markdown'),
+    # 提示词布局: classic（原有顺序）或 cache_friendly（固定说明在前，查询、结果和时间在后，便于命中模型的前缀缓存）
+    'prompt_layout': os.environ.get('PROMPT_LAYOUT', 'classic'),
+    # /search 抓取网页的线程数：搜索结果逐条到达时立即开始抓取，与 SERP 解析并行
+    'prefetch_max_workers': int(os.environ.get('PREFETCH_MAX_WORKERS', 8)),
+    # /search 的整体截止时间（毫秒，0 表示不限时），可用请求参数 deadline_ms 覆盖；到时返回已完成的部分结果
+    'request_deadline_ms': int(os.environ.get('REQUEST_DEADLINE_MS', 20000)),
+    # 合并同时进行的相同搜索和网页抓取：热门查询只搜索、抓取一次，其余请求共享结果
+    'coalesce_requests': os.environ.get('COALESCE_REQUESTS', 'true').lower() != 'false',
+    # 网页正文超出上下文预算（估算 token 数）时，用 LLM 把过长的网页并发压缩成与查询相关的要点再放进提示词
+    # （默认关闭，可用请求参数 condense 覆盖）；condense_model 留空表示使用 default_llm_model
+    'condense_pages': os.environ.get('CONDENSE_PAGES', 'false').lower() == 'true',
+    'condense_context_tokens': int(os.environ.get('CONDENSE_CONTEXT_TOKENS', 4000)),
+    'condense_model': os.environ.get('CONDENSE_MODEL', ''),
+    'condense_max_workers': int(os.environ.get('CONDENSE_MAX_WORKERS', 4)),
+    'condense_chunk_chars': 6000,
+    # 客户端支持时压缩较大的 JSON 响应（gzip，安装 brotli 后支持 br）
+    'compress_responses': os.environ.get('COMPRESS_RESPONSES', 'true').lower() != 'false',
     'time_sources': [
         "https://www.timeanddate.com/worldclock/china/beijing",
         "https://www.worldtimeserver.com/current_time_in_CN.aspx",
         "https://time.is/Beijing"
     ],
     'default_timezone': 'Asia/Shanghai',
+    # /llm 中只是询问当前时间或日期的问题直接用本地时钟回答，不调用模型也不访问网络
+    'time_fast_path': os.environ.get('TIME_FAST_PATH', 'true').lower() != 'false',
+    # 每隔该秒数用 time_sources 的 HTTP Date 响应头校准一次本地时钟偏差（0 表示直接使用系统时钟）
+    'time_offset_refresh_interval': int(os.environ.get('TIME_OFFSET_REFRESH_INTERVAL', 3600)),
     'enable_detailed_logging': False,
+    # 超过该耗时（毫秒）的 /search 请求会把完整耗时明细写入慢请求日志
+    'slow_request_threshold_ms': int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 5000)),
+    'slow_request_log_file': os.environ.get('SLOW_REQUEST_LOG_FILE', 'slow_requests.log'),
     'max_content_length': 1000,
     'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     # LLM配置
     'default_llm_model': 'deepseek-r1:1.5b',
     'default_temperature': 0.7,
-    'default_max_tokens': 2048
+    'default_max_tokens': 2048,
+    # Ollama 在请求后保持模型驻留的时间（如 30m、24h；-1 表示一直驻留，0 表示立即卸载），避免稀疏请求之间模型被卸载后重新加载
+    'ollama_keep_alive': os.environ.get('OLLAMA_KEEP_ALIVE', '30m'),
+    # LLM 准入队列：同时运行的生成数、最多排队的请求数（超过时 /llm 返回 429）和最长排队时间（秒）
+    'llm_max_concurrency': int(os.environ.get('LLM_MAX_CONCURRENCY', 2)),
+    'llm_queue_max_depth': int(os.environ.get('LLM_QUEUE_MAX_DEPTH', 16)),
+    'llm_queue_max_wait': float(os.environ.get('LLM_QUEUE_MAX_WAIT', 30)),
+    'llm_retry_after': 5,
+    # 启动时预热 default_llm_model，并在后台每隔 model_warmup_interval 秒重新预热，保持模型驻留（仅 Ollama）
+    'model_warmup_enabled': os.environ.get('MODEL_WARMUP', 'true').lower() != 'false',
+    'model_warmup_interval': int(os.environ.get('MODEL_WARMUP_INTERVAL', 300)),
+    # 保持驻留的本地时段，如 "8-22"（留空表示全天），时段外模型按 keep_alive 自然卸载
+    'model_warmup_hours': os.environ.get('MODEL_WARMUP_HOURS', ''),
+    # LLM 回答缓存：相同的 (模型, 提示词, 温度, 最大 token 数) 在有效期内直接返回缓存的回答
+    'answer_cache_enabled': os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() != 'false',
+    'answer_cache_ttl': int(os.environ.get('ANSWER_CACHE_TTL', 3600)),
+    'answer_cache_max_entries': int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 512)),
+    # 回答缓存的 SQLite 文件（留空表示只缓存在内存中）
+    'answer_cache_path': os.environ.get('ANSWER_CACHE_PATH', ''),
+    # 为 true 时 temperature > 0 的请求不使用缓存，保证每次都重新采样
+    'answer_cache_deterministic_only': os.environ.get('ANSWER_CACHE_DETERMINISTIC_ONLY', 'false').lower() == 'true',
+    # 批量搜索配置（线程池在所有批量请求之间共享，即全局并发上限）
+    'batch_max_queries': 500,
+    'batch_max_search_workers': 4,
+    'batch_max_fetch_workers': 8
 }
 
 # 初始化组件
 # 从环境变量获取搜索引擎设置，默认为 google
 search_engine_name = os.environ.get('SEARCH_ENGINE', config['default_search_engine']).lower()
-if search_engine_name not in ['google', 'bing', 'baidu']:
+if search_engine_name not in WebSearch.SUPPORTED_ENGINES:
     print(f"警告：不支持的搜索引擎 '{search_engine_name}'，使用默认的 'google'")
     search_engine_name = 'google'
 
-search_engine = WebSearch(search_engine=search_engine_name)
-response_processor = ResponseProcessor()
+local_index = LocalSearchIndex(config['local_index_path'])
+page_store = PageStore(
+    config['page_store_path'],
+    max_bytes=config['page_store_max_mb'] * 1024 * 1024,
+    max_age=config['page_store_max_age_days'] * 86400
+)
+url_resolver = RedirectResolver(
+    config['redirect_cache_path'],
+    max_workers=config['redirect_max_workers'],
+    headers={'User-Agent': config['user_agent']}
+)
+search_engine = WebSearch(
+    search_engine=search_engine_name,
+    fallback_engine=config['fallback_search_engine'] or None,
+    breaker_failure_threshold=config['breaker_failure_threshold'],
+    breaker_recovery_timeout=config['breaker_recovery_timeout'],
+    local_index=local_index,
+    page_store=page_store,
+    page_cache_ttl=config['page_cache_ttl'] or None,
+    url_resolver=url_resolver,
+    content_extractor=config['content_extractor']
+)
+if config['prompt_format'] not in ResponseProcessor.OUTPUT_FORMATS:
+    print(f"警告：不支持的提示词格式 '{config['prompt_format']}'，使用默认的 'markdown'")
+    config['prompt_format'] = 'markdown'
+if config['prompt_layout'] not in ResponseProcessor.PROMPT_LAYOUTS:
+    print(f"警告：不支持的提示词布局 '{config['prompt_layout']}'，使用默认的 'classic'")
+    config['prompt_layout'] = 'classic'
+response_processor = ResponseProcessor(output_format=config['prompt_format'], layout=config['prompt_layout'])
+duplicate_filter = NearDuplicateFilter(
+    snippet_threshold=config['dedupe_snippet_threshold'],
+    content_threshold=config['dedupe_content_threshold']
+)
+# /llm 每次请求都会创建新的客户端，回答缓存在所有客户端之间共享
+answer_cache = AnswerCache(
+    max_entries=config['answer_cache_max_entries'],
+    ttl=config['answer_cache_ttl'],
+    path=config['answer_cache_path'] or None,
+    deterministic_only=config['answer_cache_deterministic_only']
+) if config['answer_cache_enabled'] else None
+
+# 所有 /llm 请求共享的准入队列
+llm_queue = LLMQueue(
+    max_concurrency=config['llm_max_concurrency'],
+    max_depth=config['llm_queue_max_depth'],
+    max_wait=config['llm_queue_max_wait'] or None
+)
+
+model_warmer = ModelWarmer(
+    os.environ.get('OLLAMA_API_URL', 'http://localhost:11434'),
+    config['default_llm_model'],
+    keep_alive=config['ollama_keep_alive'],
+    refresh_interval=config['model_warmup_interval'],
+    active_hours=parse_active_hours(config['model_warmup_hours'])
+)
+if config['model_warmup_enabled']:
+    model_warmer.start()
+
+time_service = TimeService(
+    config['default_timezone'],
+    sources=config['time_sources'],
+    refresh_interval=config['time_offset_refresh_interval'],
+    user_agent=config['user_agent']
+)
+time_service.start()
+
+# 慢请求日志，每行一个 JSON 对象 | Slow-request log, one JSON object per line
+slow_request_logger = logging.getLogger('slow_requests')
+slow_request_logger.setLevel(logging.INFO)
+slow_request_logger.propagate = False
+if config['slow_request_log_file']:
+    _slow_handler = logging.FileHandler(config['slow_request_log_file'], encoding='utf-8')
+    _slow_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_request_logger.addHandler(_slow_handler)
+
+def apply_logging_config():
+    """根据 enable_detailed_logging 调整搜索模块的日志级别"""
+    level = logging.DEBUG if config.get('enable_detailed_logging') else logging.INFO
+    logging.getLogger('search_engine').setLevel(level)
+
+apply_logging_config()
+
+# 批量搜索使用的全局线程池 | Global worker pools shared by all batch requests
+batch_search_executor = ThreadPoolExecutor(max_workers=config['batch_max_search_workers'], thread_name_prefix='batch-search')
+batch_fetch_executor = ThreadPoolExecutor(max_workers=config['batch_max_fetch_workers'], thread_name_prefix='batch-fetch')
+# /search 预抓取网页的全局线程池 | Global pool for /search page prefetching
+page_fetch_executor = ThreadPoolExecutor(max_workers=config['prefetch_max_workers'], thread_name_prefix='prefetch')
+# 网页压缩的 LLM 调用线程池；调用同样经过 LLM 准入队列（batch 优先级）| Pool for page-condensing LLM calls, which also go through the admission queue as batch jobs
+condense_executor = ThreadPoolExecutor(max_workers=config['condense_max_workers'], thread_name_prefix='condense')
+
+condense_clients = {}
+
+def condense_generate(prompt, model):
+    """用于网页压缩的 LLM 调用（温度为 0，结果可缓存），失败时返回 None"""
+    client = condense_clients.get(model)
+    if client is None:
+        from llm_client_example import LLMWebSearchClient
+        client = LLMWebSearchClient(
+            model_name=model, temperature=0, max_tokens=512, llm_type='ollama',
+            keep_alive=config['ollama_keep_alive'], llm_queue=llm_queue, priority='batch'
+        )
+        condense_clients[model] = client
+    answer, answered = client.try_query_llm(prompt)
+    return answer if answered else None
+
+page_condenser = PageCondenser(
+    condense_generate,
+    condense_executor,
+    cache=AnswerCache(max_entries=2048, ttl=config['answer_cache_ttl'], path=config['answer_cache_path'] or None,
+                      name='page_notes'),
+    context_tokens=config['condense_context_tokens'],
+    min_chars=response_processor.max_content_per_source,
+    chunk_chars=config['condense_chunk_chars']
+)
+
+@app.before_request
+def _track_request_start():
+    """记录请求开始时间和进行中的请求数"""
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.teardown_request
+def _track_request_end(exc=None):
+    """请求结束时更新进行中的请求数和端点耗时"""
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is None:
+        return
+    IN_FLIGHT.dec(endpoint=endpoint)
+    REQUEST_LATENCY.observe(time.perf_counter() - g.pop('metrics_start'), endpoint=endpoint)
 
 def get_system_time():
     current_time = datetime.now()
@@ -52,81 +272,410 @@ def get_system_time():
     timezone_name = current_time.astimezone().tzname()
     return f"当前系统时间是：{formatted_time} {timezone_name}"
 
+def mock_page_content(url, query):
+    """为模拟 URL (example.com) 生成模拟内容"""
+    if 'search-results' in url:
+        return f"这是关于 '{query}' 的模拟搜索结果页面。"
+    elif 'weather' in url:
+        return f"模拟天气信息：无法提供 '{query}' 的准确天气信息。"
+    elif 'time' in url:
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return f"当前时间是 {current_time}。"
+    else:
+        return f"这是一个模拟内容页面。查询: {query}"
+
+# 同时进行的相同搜索（引擎、规范化后的查询、结果数相同）和相同 URL 的抓取只执行一次
+search_flights = SingleFlight("search")
+page_flights = SingleFlight("page_fetch")
+
+def coalesced_search(query, num_results, engine):
+    """逐条产出搜索结果；已有相同的搜索在进行时跟随它的结果，而不是再请求一次搜索引擎"""
+    if not config['coalesce_requests']:
+        return search_engine.iter_search(query, num_results, engine=engine)
+    key = (engine, " ".join(query.split()).casefold(), num_results)
+    return search_flights.stream(key, lambda: search_engine.iter_search(query, num_results, engine=engine))
+
+def fetch_page(url):
+    """抓取网页；同一 URL 正在被其他请求抓取时等待并共享其结果"""
+    if not config['coalesce_requests']:
+        return search_engine.fetch_content(url)
+    # 截止时间只属于发起抓取的请求，其余请求遇到时自己重新抓取
+    return page_flights.do(url, lambda: search_engine.fetch_content(url), retry_on=(deadline.DeadlineExceeded,))[0]
+
+def fetch_detailed_content(url, query):
+    """获取单个搜索结果的详细内容，模拟 URL 直接返回模拟内容"""
+    # 检查是否为模拟 URL (example.com)
+    if 'example.com' in url:
+        return mock_page_content(url, query)
+    # 正常获取实际 URL 的内容
+    try:
+        return fetch_page(url)
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        return f"无法获取内容: {str(e)}"
+
 @app.route('/search', methods=['POST'])
 def search():
     """基于查询执行网络搜索并返回格式化结果的端点"""
+    timings = begin_request_timings()
+    try:
+        return _search(timings)
+    finally:
+        end_request_timings(timings)
+
+def log_slow_request(endpoint, params, timings):
+    """请求耗时超过阈值时，把完整耗时明细写入慢请求日志"""
+    threshold = config.get('slow_request_threshold_ms', 0)
+    breakdown = timings.to_dict()
+    if threshold and breakdown['total_ms'] >= threshold:
+        slow_request_logger.info(json.dumps({
+            "endpoint": endpoint,
+            "params": params,
+            "timings": breakdown
+        }, ensure_ascii=False))
+
+def _search(timings):
+    deadline_token = None
     try:
         data = request.json
         
         if not data or 'query' not in data:
             return jsonify({"error": "Missing required parameter: query"}), 400
         
+        try:
+            deadline_ms = float(data.get('deadline_ms', config.get('request_deadline_ms', 0)) or 0)
+        except (TypeError, ValueError):
+            return jsonify({"error": "deadline_ms 必须是数字"}), 400
+        # 截止时间随上下文传给搜索重试和抓取线程 | The deadline follows the context into engine retries and fetch threads
+        deadline_token = deadline.begin_deadline(deadline_ms / 1000)
+        
         query = data['query']
         num_results = data.get('num_results', config.get('default_num_results', 5))
+        try:
+            num_results = int(num_results)
+        except (TypeError, ValueError):
+            num_results = 0
+        if num_results < 1:
+            return jsonify({"error": f"num_results 必须是不小于 1 的整数: {data.get('num_results')}"}), 400
         fetch_content = data.get('fetch_content', config.get('default_fetch_content', False))
         search_engine_name = data.get('search_engine', config.get('default_search_engine', 'google'))
+        include_timings = data.get('timings', False)
+        dedupe = data.get('dedupe', config.get('dedupe_enabled', True))
+        # 只返回指定的顶层字段，例如 fields=search_results,formatted_response
+        fields = parse_fields(data.get('fields', request.args.get('fields')))
+        prompt_format = data.get('prompt_format', config.get('prompt_format', 'markdown'))
+        if prompt_format not in ResponseProcessor.OUTPUT_FORMATS:
+            return jsonify({"error": f"不支持的提示词格式: {prompt_format}"}), 400
+        prompt_layout = data.get('prompt_layout', config.get('prompt_layout', 'classic'))
+        if prompt_layout not in ResponseProcessor.PROMPT_LAYOUTS:
+            return jsonify({"error": f"不支持的提示词布局: {prompt_layout}"}), 400
+        # 网页正文超出上下文预算时先用 LLM 压缩成要点
+        condense = data.get('condense', config.get('condense_pages', False))
         
         # 获取LLM配置
         llm_model = data.get('llm_model', config.get('default_llm_model', 'deepseek-r1:1.5b'))
         temperature = data.get('temperature', config.get('default_temperature', 0.7))
         max_tokens = data.get('max_tokens', config.get('default_max_tokens', 2048))
         
-        # 如果需要，更新搜索引擎
-        if search_engine.search_engine != search_engine_name:
-            search_engine.search_engine = search_engine_name
-        
-        # 执行搜索
+        # 执行搜索（显式传入引擎，避免并发请求互相修改共享实例）
+        # 结果逐条到达：先折叠镜像/转载的重复结果，再立即提交网页抓取，使抓取与 SERP 解析、跳转解析重叠
+        search_results = []
+        duplicates = []
+        fetch_futures = {}
+        fetch_start = None
+        # 截止时间到时没有开始抓取的 URL 和抓取未完成的 URL | URLs never fetched and fetches cut off by the deadline
+        skipped_urls = []
+        timed_out_urls = []
+        deduper = duplicate_filter.result_deduper() if dedupe else None
         try:
-            search_results = search_engine.search(query, num_results)
+            search_start = time.perf_counter()
+            for result in coalesced_search(query, num_results, search_engine_name):
+                if deduper:
+                    duplicate = deduper.add(result)
+                    if duplicate:
+                        duplicates.append(duplicate)
+                        continue
+                search_results.append(result)
+                if fetch_content:
+                    if deadline.expired():
+                        skipped_urls.append(result['link'])
+                        continue
+                    if fetch_start is None:
+                        fetch_start = time.perf_counter()
+                    # 复制上下文，使抓取线程中的耗时计入本请求 | Copy the context so fetch timings land in this request
+                    fetch_futures[result['link']] = page_fetch_executor.submit(
+                        contextvars.copy_context().run, fetch_detailed_content, result['link'], query
+                    )
+            record_timing("search_total", time.perf_counter() - search_start)
+            search_incomplete = deadline.expired()
         except Exception as e:
             return jsonify({"error": f"搜索时出错: {str(e)}"}), 500
         
-        # 如果请求，获取详细内容
+        # 如果请求，在截止时间内等待所有搜索结果的详细内容
         detailed_content = {}
         if fetch_content and search_results:
-            # 获取所有搜索结果的详细内容，而不是限制为前3个
-            for result in search_results:
-                url = result['link']
-                
-                # 检查是否为模拟 URL (example.com)
-                if 'example.com' in url:
-                    # 为模拟 URL 创建模拟内容
-                    if 'search-results' in url:
-                        detailed_content[url] = f"这是关于 '{query}' 的模拟搜索结果页面。"
-                    elif 'weather' in url:
-                        detailed_content[url] = f"模拟天气信息：无法提供 '{query}' 的准确天气信息。"
-                    elif 'time' in url:
-                        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        detailed_content[url] = f"当前时间是 {current_time}。"
-                    else:
-                        detailed_content[url] = f"这是一个模拟内容页面。查询: {query}"
-                else:
-                    # 正常获取实际 URL 的内容
-                    try:
-                        content = search_engine.fetch_content(url)
-                        detailed_content[url] = content
-                    except Exception as e:
-                        detailed_content[url] = f"无法获取内容: {str(e)}"
+            for url, future in fetch_futures.items():
+                try:
+                    detailed_content[url] = future.result(timeout=deadline.remaining())
+                except FutureTimeoutError:
+                    # 还在排队的抓取直接取消 | Fetches still queued are cancelled
+                    (skipped_urls if future.cancel() else timed_out_urls).append(url)
+                except deadline.DeadlineExceeded:
+                    timed_out_urls.append(url)
+                except Exception as e:
+                    detailed_content[url] = f"无法获取内容: {str(e)}"
+            if fetch_start is not None:
+                record_timing("fetch_total", time.perf_counter() - fetch_start)
+            
+            # 构建提示词前再按正文去重
+            if dedupe:
+                search_results, detailed_content, content_duplicates = duplicate_filter.filter_content(
+                    search_results, detailed_content
+                )
+                duplicates.extend(content_duplicates)
         
-        # 格式化结果供LLM使用
-        try:
-            formatted_response = response_processor.create_prompt_with_search_results(
-                query, search_results, detailed_content if fetch_content else None
-            )
-        except Exception as e:
-            return jsonify({"error": f"格式化结果时出错: {str(e)}"}), 500
+        # 格式化结果供LLM使用（客户端不需要时跳过）
+        formatted_response = None
+        condensed_content = {}
+        if fields is None or 'formatted_response' in fields:
+            prompt_content = detailed_content if fetch_content else None
+            if condense and prompt_content:
+                # map：过长的网页由 LLM 并发压缩成要点；reduce：要点代替截断的原文放进提示词
+                condense_start = time.perf_counter()
+                condensed_content = page_condenser.condense(
+                    query, prompt_content, config['condense_model'] or llm_model,
+                    titles={r['link']: r.get('title', '') for r in search_results}
+                )
+                record_timing("condense_total", time.perf_counter() - condense_start)
+                prompt_content = {
+                    url: dict(content, content=condensed_content[url]) if url in condensed_content else content
+                    for url, content in prompt_content.items()
+                }
+            try:
+                with time_stage("format", search_engine_name):
+                    formatted_response = response_processor.create_prompt_with_search_results(
+                        query, search_results, prompt_content,
+                        output_format=prompt_format, layout=prompt_layout
+                    )
+            except Exception as e:
+                return jsonify({"error": f"格式化结果时出错: {str(e)}"}), 500
         
-        return jsonify({
+        response_data = {
             "query": query,
             "search_results": search_results,
             "detailed_content": detailed_content if fetch_content else {},
             "formatted_response": formatted_response,
+            "prompt_format": prompt_format,
+            "prompt_layout": prompt_layout,
+            # 提示词 token 数的粗略估计，用于比较不同格式的预填充开销
+            "prompt_tokens": estimate_tokens(formatted_response),
+            "duplicates": duplicates,
+            # 压缩后放进提示词的网页要点 {URL: 要点} | Notes that replaced oversized pages in the prompt
+            "condensed_content": condensed_content,
+            # 截止时间到时搜索或抓取未完成，结果只包含已完成的部分
+            "partial": bool(search_incomplete or skipped_urls or timed_out_urls),
             "llm_config": {
                 "model": llm_model,
                 "temperature": temperature,
                 "max_tokens": max_tokens
             }
-        })
+        }
+        if deadline_ms > 0:
+            response_data["deadline"] = {
+                "budget_ms": deadline_ms,
+                "exceeded": deadline.expired(),
+                "search_incomplete": search_incomplete,
+                "skipped": skipped_urls,
+                "timed_out": timed_out_urls
+            }
+        
+        log_slow_request('/search', {
+            "query": query,
+            "search_engine": search_engine_name,
+            "num_results": num_results,
+            "fetch_content": fetch_content,
+            "deadline_ms": deadline_ms
+        }, timings)
+        
+        if include_timings:
+            response_data["timings"] = timings.to_dict()
+        
+        return json_response(
+            select_fields(response_data, fields),
+            accept_encoding=request.headers.get('Accept-Encoding'),
+            compress_responses=config.get('compress_responses', True)
+        )
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if deadline_token is not None:
+            deadline.end_deadline(deadline_token)
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    批量搜索端点。相同的 (search_engine, query) 只搜索一次，相同 URL 只抓取一次，
+    搜索和网页抓取在全局线程池中并发执行。stream=true 时按完成顺序以 NDJSON 逐条返回。
+    """
+    try:
+        data = request.json
+        
+        if not data or not isinstance(data.get('queries'), list) or not data['queries']:
+            return jsonify({"error": "Missing required parameter: queries"}), 400
+        
+        max_queries = config.get('batch_max_queries', 500)
+        if len(data['queries']) > max_queries:
+            return jsonify({"error": f"批量查询数量超过上限 {max_queries}"}), 400
+        
+        # 规范化每个查询，未指定的参数使用批次级别或全局默认值
+        specs = []
+        for i, item in enumerate(data['queries']):
+            if isinstance(item, str):
+                item = {'query': item}
+            if not isinstance(item, dict) or not str(item.get('query', '')).strip():
+                return jsonify({"error": f"queries[{i}] 缺少 query 参数"}), 400
+            
+            engine = str(item.get('search_engine', data.get('search_engine', config.get('default_search_engine', 'google')))).lower()
+            if engine not in WebSearch.SUPPORTED_ENGINES:
+                return jsonify({"error": f"queries[{i}] 不支持的搜索引擎: {engine}"}), 400
+            
+            prompt_format = item.get('prompt_format', data.get('prompt_format', config.get('prompt_format', 'markdown')))
+            if prompt_format not in ResponseProcessor.OUTPUT_FORMATS:
+                return jsonify({"error": f"queries[{i}] 不支持的提示词格式: {prompt_format}"}), 400
+            prompt_layout = item.get('prompt_layout', data.get('prompt_layout', config.get('prompt_layout', 'classic')))
+            if prompt_layout not in ResponseProcessor.PROMPT_LAYOUTS:
+                return jsonify({"error": f"queries[{i}] 不支持的提示词布局: {prompt_layout}"}), 400
+            
+            num_results = item.get('num_results', data.get('num_results', config.get('default_num_results', 5)))
+            try:
+                num_results = int(num_results)
+            except (TypeError, ValueError):
+                num_results = 0
+            if num_results < 1:
+                return jsonify({"error": f"queries[{i}] num_results 必须是不小于 1 的整数: {item.get('num_results', data.get('num_results'))}"}), 400
+            
+            specs.append({
+                'query': str(item['query']).strip(),
+                'num_results': num_results,
+                'fetch_content': bool(item.get('fetch_content', data.get('fetch_content', config.get('default_fetch_content', False)))),
+                'search_engine': engine,
+                'dedupe': bool(item.get('dedupe', data.get('dedupe', config.get('dedupe_enabled', True)))),
+                'prompt_format': prompt_format,
+                'prompt_layout': prompt_layout
+            })
+        
+        # 批内去重：相同 (引擎, 查询, 是否过滤重复结果) 只执行一次搜索
+        groups = {}
+        for i, spec in enumerate(specs):
+            groups.setdefault((spec['search_engine'], spec['query'], spec['dedupe']), []).append(i)
+        
+        # 批内 URL 去重：每个 URL 只抓取一次
+        fetch_futures = {}
+        fetch_lock = threading.Lock()
+        
+        def fetch_once(url):
+            with fetch_lock:
+                future = fetch_futures.get(url)
+                if future is None:
+                    future = batch_fetch_executor.submit(fetch_page, url)
+                    fetch_futures[url] = future
+            return future
+        
+        def run_group(key, indexes):
+            engine, query, dedupe = key
+            num_results = max(specs[i]['num_results'] for i in indexes)
+            fetch_count = max((specs[i]['num_results'] for i in indexes if specs[i]['fetch_content']), default=0)
+            
+            # 结果逐条到达时立即去重并提交抓取 | Dedupe and start fetching as each result arrives
+            results = []
+            duplicates = []
+            pending = {}
+            contents = {}
+            deduper = duplicate_filter.result_deduper() if dedupe else None
+            for result in coalesced_search(query, num_results, engine):
+                if deduper:
+                    duplicate = deduper.add(result)
+                    if duplicate:
+                        duplicates.append(duplicate)
+                        continue
+                results.append(result)
+                if len(results) > fetch_count:
+                    continue
+                url = result['link']
+                if 'example.com' in url:
+                    contents[url] = mock_page_content(url, query)
+                else:
+                    pending[url] = fetch_once(url)
+            for url, future in pending.items():
+                try:
+                    contents[url] = future.result()
+                except Exception as e:
+                    contents[url] = f"无法获取内容: {str(e)}"
+            return results, contents, duplicates
+        
+        def build_item(i, results, contents, duplicates):
+            spec = specs[i]
+            items = results[:spec['num_results']]
+            duplicates = list(duplicates)
+            detailed_content = {}
+            if spec['fetch_content']:
+                detailed_content = {r['link']: contents[r['link']] for r in items if r['link'] in contents}
+                if spec['dedupe']:
+                    items, detailed_content, content_duplicates = duplicate_filter.filter_content(items, detailed_content)
+                    duplicates.extend(content_duplicates)
+            with time_stage("format", spec['search_engine']):
+                formatted_response = response_processor.create_prompt_with_search_results(
+                    spec['query'], items, detailed_content if spec['fetch_content'] else None,
+                    output_format=spec['prompt_format'], layout=spec['prompt_layout']
+                )
+            return {
+                "index": i,
+                "query": spec['query'],
+                "search_engine": spec['search_engine'],
+                "search_results": items,
+                "detailed_content": detailed_content,
+                "formatted_response": formatted_response,
+                "prompt_tokens": estimate_tokens(formatted_response),
+                "duplicates": duplicates
+            }
+        
+        group_futures = {
+            batch_search_executor.submit(run_group, key, indexes): (key, indexes)
+            for key, indexes in groups.items()
+        }
+        
+        def iter_items():
+            for future in as_completed(group_futures):
+                (engine, query, _dedupe), indexes = group_futures[future]
+                try:
+                    results, contents, duplicates = future.result()
+                except Exception as e:
+                    for i in indexes:
+                        yield {"index": i, "query": query, "search_engine": engine, "error": f"搜索时出错: {str(e)}"}
+                    continue
+                for i in indexes:
+                    try:
+                        yield build_item(i, results, contents, duplicates)
+                    except Exception as e:
+                        yield {"index": i, "query": query, "search_engine": engine, "error": f"格式化结果时出错: {str(e)}"}
+        
+        if data.get('stream', False):
+            def generate():
+                for item in iter_items():
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        items = sorted(iter_items(), key=lambda item: item['index'])
+        return json_response({
+            "results": items,
+            "total_queries": len(specs),
+            "unique_searches": len(groups),
+            "deduplicated": len(specs) - len(groups),
+            "fetched_urls": len(fetch_futures)
+        }, accept_encoding=request.headers.get('Accept-Encoding'),
+            compress_responses=config.get('compress_responses', True))
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -226,8 +775,63 @@ def get_current_time():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """简单的健康检查端点"""
-    return jsonify({"status": "healthy"})
+    """简单的健康检查端点，附带各搜索引擎的熔断器状态"""
+    return jsonify({
+        "status": "healthy",
+        "fallback_search_engine": search_engine.fallback_engine,
+        "circuit_breakers": search_engine.get_circuit_breaker_status(),
+        "local_index": {
+            "path": config['local_index_path'],
+            "documents": local_index.count()
+        },
+        "page_store": page_store.stats(),
+        "llm_model": dict(model_warmer.status(), warmup_enabled=config['model_warmup_enabled']),
+        "llm_queue": llm_queue.stats(),
+        "clock": time_service.status()
+    })
+
+@app.route('/page_store/compact', methods=['POST'])
+def page_store_compact():
+    """压缩网页存储：删除旧版本和过期页面，并按大小上限丢弃最旧的页面"""
+    try:
+        return jsonify(page_store.compact())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/local_index/documents', methods=['POST'])
+def local_index_documents():
+    """批量导入文档到本地全文索引（"local" 搜索引擎）"""
+    try:
+        data = request.json
+        
+        # 从网页存储重建索引，可用 since / until（Unix 时间戳）限定抓取时间范围
+        if data and data.get('from_page_store'):
+            indexed = local_index.add_documents(page_store.scan(data.get('since'), data.get('until')))
+            return jsonify({
+                "indexed": indexed,
+                "total_documents": local_index.count()
+            })
+        
+        if not data or not isinstance(data.get('documents'), list):
+            return jsonify({"error": "Missing required parameter: documents"}), 400
+        
+        for i, doc in enumerate(data['documents']):
+            if not isinstance(doc, dict) or not doc.get('url') or not doc.get('content'):
+                return jsonify({"error": f"documents[{i}] 缺少 url 或 content"}), 400
+        
+        indexed = local_index.add_documents(data['documents'])
+        return jsonify({
+            "indexed": indexed,
+            "total_documents": local_index.count()
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """以 Prometheus 文本格式导出进程内指标"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/config', methods=['GET', 'POST'])
 def config_page():
@@ -238,21 +842,46 @@ def config_page():
     if request.method == 'POST':
         # 更新配置
         config['default_search_engine'] = request.form.get('default_search_engine', 'google')
+        fallback_engine = request.form.get('fallback_search_engine', '')
+        if fallback_engine in WebSearch.SUPPORTED_ENGINES or fallback_engine == '':
+            config['fallback_search_engine'] = fallback_engine
+            search_engine.fallback_engine = fallback_engine or None
         config['default_num_results'] = int(request.form.get('default_num_results', 5))
         config['default_fetch_content'] = request.form.get('default_fetch_content') == 'on'
+        prompt_format = request.form.get('prompt_format', config['prompt_format'])
+        if prompt_format in ResponseProcessor.OUTPUT_FORMATS:
+            config['prompt_format'] = prompt_format
+            response_processor.output_format = prompt_format
+        prompt_layout = request.form.get('prompt_layout', config['prompt_layout'])
+        if prompt_layout in ResponseProcessor.PROMPT_LAYOUTS:
+            config['prompt_layout'] = prompt_layout
+            response_processor.layout = prompt_layout
+        config['dedupe_enabled'] = request.form.get('dedupe_enabled') == 'on'
+        config['dedupe_snippet_threshold'] = int(request.form.get('dedupe_snippet_threshold', config['dedupe_snippet_threshold']))
+        config['dedupe_content_threshold'] = int(request.form.get('dedupe_content_threshold', config['dedupe_content_threshold']))
+        duplicate_filter.snippet_threshold = config['dedupe_snippet_threshold']
+        duplicate_filter.content_threshold = config['dedupe_content_threshold']
         config['default_timezone'] = request.form.get('default_timezone', 'Asia/Shanghai')
+        time_service.set_timezone(config['default_timezone'])
         config['enable_detailed_logging'] = request.form.get('enable_detailed_logging') == 'on'
+        apply_logging_config()
+        config['page_cache_ttl'] = int(request.form.get('page_cache_ttl', config['page_cache_ttl']))
+        config['request_deadline_ms'] = int(request.form.get('request_deadline_ms', config['request_deadline_ms']))
+        search_engine.page_cache_ttl = config['page_cache_ttl'] or None
         config['max_content_length'] = int(request.form.get('max_content_length', 1000))
         config['user_agent'] = request.form.get('user_agent', config['user_agent'])
         
         # 更新LLM配置
         config['default_llm_model'] = request.form.get('default_llm_model', 'deepseek-r1:1.5b')
+        # 新选择的默认模型立即在后台预热
+        model_warmer.set_model(config['default_llm_model'])
         config['default_temperature'] = float(request.form.get('default_temperature', 0.7))
         config['default_max_tokens'] = int(request.form.get('default_max_tokens', 2048))
         
         # 处理时间源
         time_sources = request.form.get('time_sources', '').strip().split('\n')
         config['time_sources'] = [source.strip() for source in time_sources if source.strip()]
+        time_service.sources = list(config['time_sources'])
         
         return redirect(url_for('config_page'))
     
@@ -289,6 +918,7 @@ def llm_page():
     num_results = config.get('default_num_results', 5)
     search_engine = config.get('default_search_engine', 'google')
     llm_type = "ollama"  # 默认使用Ollama
+    status = 200
     
     # 获取可用的LLM模型
     api_models = ["gpt-3.5-turbo", "gpt-4", "claude-instant-1", "claude-2", "gemini-pro"]
@@ -304,6 +934,10 @@ def llm_page():
             num_results = int(request.form.get('num_results', 5))
             search_engine = request.form.get('search_engine', 'google')
             llm_type = request.form.get('llm_type', 'api')
+            # 准入队列的优先级: interactive（默认）或 batch，也可以用 X-LLM-Priority 请求头指定
+            priority = request.form.get('priority') or request.headers.get('X-LLM-Priority', 'interactive')
+            if priority not in LLMQueue.PRIORITIES:
+                priority = 'interactive'
             
             if not query:
                 error_message = "请输入查询内容 | Please enter a query"
@@ -313,45 +947,28 @@ def llm_page():
                                      num_results=num_results, search_engine=search_engine, llm_type=llm_type,
                                      search_results=search_results, current_year=datetime.now().year)
             
-            # 处理时间查询的特殊情况
-            time_keywords = ["current time", "current date", "what time", "what date", "今天日期", "现在时间", "当前时间"]
-            if any(keyword in query.lower() for keyword in time_keywords):
-                # 尝试通过网络获取时间
-                try:
-                    # 使用百度搜索获取时间
-                    from llm_client_example import LLMWebSearchClient
-                    client = LLMWebSearchClient(llm_type=llm_type)
-                    time_search_results = client.search_web("current time and date", 3, True, "baidu")
-                    
-                    if time_search_results and len(time_search_results) > 0:
-                        # 从搜索结果中提取时间信息
-                        time_info = "\n".join([
-                            f"{result['title']}: {result['snippet']}"
-                            for result in time_search_results
-                            if "title" in result and "snippet" in result
-                        ])
-                        
-                        response_text = f"根据网络搜索结果，当前的时间和日期信息如下：\n\n{time_info}"
-                        processing_time = 1.0
-                    else:
-                        # 如果网络搜索失败，回退到系统时间
-                        response_text = get_system_time()
-                        processing_time = 0.5
-                except Exception as e:
-                    # 如果出现异常，回退到系统时间
-                    response_text = get_system_time()
-                    processing_time = 0.5
+            start_time = time.time()
+            # 只是询问当前时间或日期的问题直接用校准后的本地时钟回答，不创建客户端、不调用模型也不访问网络
+            time_answer = time_service.answer(query) if config['time_fast_path'] else None
+            if time_answer is not None:
+                response_text = time_answer
+                processing_time = time.time() - start_time
             else:
                 # 常规查询处理
-                start_time = time.time()
-                
                 from llm_client_example import LLMWebSearchClient
+                # 调用模型前在准入队列中按优先级排队；客户端断开时放弃排队
+                environ = request.environ
+                client_options = dict(
+                    answer_cache=answer_cache, keep_alive=config['ollama_keep_alive'],
+                    llm_queue=llm_queue, priority=priority, cancelled=lambda: connection_closed(environ)
+                )
                 # 如果model为None或为空字符串，将使用自动检测的最佳模型
                 if not model:
-                    client = LLMWebSearchClient(temperature=temperature, max_tokens=max_tokens, llm_type=llm_type)
+                    client = LLMWebSearchClient(temperature=temperature, max_tokens=max_tokens, llm_type=llm_type, **client_options)
                     print(f"使用自动检测的模型: {client.model_name}")
                 else:
-                    client = LLMWebSearchClient(model_name=model, temperature=temperature, max_tokens=max_tokens, llm_type=llm_type)
+                    client = LLMWebSearchClient(model_name=model, temperature=temperature, max_tokens=max_tokens, llm_type=llm_type,
+                                                **client_options)
                     print(f"使用指定的模型: {model}")
                 
                 if use_web_search:
@@ -365,16 +982,27 @@ def llm_page():
                 
                 processing_time = time.time() - start_time
                 
+        except JobCancelled as error:
+            # 客户端已经离开，没有人会收到响应 | The client is gone; nobody will read the response
+            logger.info(str(error))
+            return Response(status=499)
+        except QueueRejected as error:
+            # 过载时快速拒绝，而不是让请求排队直到超时
+            error_message = f"服务繁忙，请稍后再试 | The LLM backend is busy, please retry later: {str(error)}"
+            status = 429
         except Exception as error:
             error_message = f"发生错误 | An error occurred: {str(error)}"
             print(error_message)
             print(traceback.format_exc())
     
-    return render_template('llm.html', response_text=response_text, query=query, error_message=error_message, 
+    response = Response(render_template('llm.html', response_text=response_text, query=query, error_message=error_message, 
                          api_models=api_models, ollama_models=ollama_models, model=model, temperature=temperature, max_tokens=max_tokens, 
                          processing_time=processing_time, use_web_search=use_web_search, 
                          num_results=num_results, search_engine=search_engine, llm_type=llm_type,
-                         search_results=search_results, current_year=datetime.now().year)
+                         search_results=search_results, current_year=datetime.now().year), status=status)
+    if status == 429:
+        response.headers['Retry-After'] = str(config['llm_retry_after'])
+    return response
 
 @app.route('/search_demo', methods=['GET', 'POST'])
 def search_demo():
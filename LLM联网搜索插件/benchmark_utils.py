@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM联网搜索插件性能基准工具集
+
+该文件提供离线性能基准测试，不需要网络连接：
+1. parse: 使用仓库中保存的搜索结果页 HTML（*_search_debug_*.html）测试各搜索引擎解析器的吞吐量
+2. extract: 在 benchmark_fixtures/extract 的网页上比较正文提取方式（density / selectors）的速度和提取质量
+   （与同名 .txt 标注正文比较的词级 precision / recall / F1）
+3. payload: 用 benchmark_fixtures/extract 的正文构造 fetch_content=true 的 /search 响应，比较各序列化方式
+   （Flask jsonify 等价的标准库 json / orjson）、压缩方式（gzip / br）和 fields 字段选择的响应大小与耗时
+4. prompt: 用同样的数据比较 ResponseProcessor 各输出格式（markdown / compact / jsonl）的提示词长度、
+   估算 token 数和构建耗时
+5. prefix: 比较提示词布局（classic / cache_friendly）在连续请求之间共享的前缀长度；指定 --ollama-url 时
+   把同样的请求序列发给 Ollama，读取 prompt_eval_duration 得到实际的预填充耗时
+6. time: 比较 /llm 回答时间问题的两种方式：本地时钟（TimeService）与原来的做法（创建 LLMWebSearchClient
+   探测 Ollama 模型、再向 /search 发送 "current time and date" 的百度搜索，需要 --search-url 指向运行中的服务）
+
+每项结果包括每秒解析次数、p50/p99 耗时和内存分配情况，可以保存为 JSON 基线并与之前的基线比较。
+
+使用方法:
+    python benchmark_utils.py --mode parse [--iterations 50] [--save-baseline FILE] [--compare FILE]
+    python benchmark_utils.py --mode extract [--extract-dir DIR]
+    python benchmark_utils.py --mode payload [--num-results 10]
+    python benchmark_utils.py --mode prompt [--num-results 10]
+    python benchmark_utils.py --mode prefix [--ollama-url http://localhost:11434 --model deepseek-r1:1.5b]
+    python benchmark_utils.py --mode time [--search-url http://localhost:5005/search --ollama-url http://localhost:11434]
+
+示例:
+    # 运行解析器基准并保存基线
+    python benchmark_utils.py --mode parse --save-baseline benchmark_baselines/parse.json
+
+    # 修改解析代码后与基线比较，性能下降超过 10% 时返回非零退出码
+    python benchmark_utils.py --mode parse --compare benchmark_baselines/parse.json --fail-on-regression
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+import requests
+
+from bs4 import BeautifulSoup
+
+from search_engine import WebSearch
+from content_extractor import extract_main_text
+from response_processor import ResponseProcessor, estimate_tokens
+import response_encoding
+
+# 调试 HTML 文件名格式: <engine>_search_debug_<n>.html
+SERP_FIXTURE_PATTERN = re.compile(r'^(google|bing|baidu)_search_debug_\d+\.html$')
+
+# 正文提取测试网页，<name>.html 旁边的 <name>.txt 为人工标注的正文
+EXTRACT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_fixtures", "extract")
+
+# 质量评估的分词：中文按字，其他按单词
+_QUALITY_TOKEN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]|[^\W_]+')
+
+
+def percentile(sorted_values, pct):
+    """计算已排序数据的百分位数（线性插值）"""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def benchmark_function(fn, iterations=50, warmup=3):
+    """
+    多次运行 fn 并统计耗时和内存分配。
+    内存分配在计时之外单独运行一次，避免 tracemalloc 影响耗时结果。
+    """
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(durations)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / total, 2) if total else 0.0,
+        "mean_ms": round(total / iterations * 1000, 3),
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "peak_alloc_kib": round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1)
+    }
+
+
+def discover_serp_fixtures(fixtures_dir):
+    """查找目录中的搜索结果页 HTML，返回 (引擎, 路径) 列表"""
+    fixtures = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        match = SERP_FIXTURE_PATTERN.match(name)
+        if match:
+            fixtures.append((match.group(1), os.path.join(fixtures_dir, name)))
+    return fixtures
+
+
+def benchmark_serp_parsers(fixtures_dir=".", iterations=50, num_results=10):
+    """对每个搜索结果页 HTML 运行对应引擎的解析器"""
+    fixtures = discover_serp_fixtures(fixtures_dir)
+    if not fixtures:
+        print(f"在 {fixtures_dir} 中没有找到 *_search_debug_*.html 文件")
+        return {}
+
+    engine = WebSearch()
+    results = {}
+
+    for engine_name, path in fixtures:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        parsed = engine.parse_serp(engine_name, html, num_results)
+        stats = benchmark_function(lambda: engine.parse_serp(engine_name, html, num_results), iterations)
+        stats.update({
+            "engine": engine_name,
+            "html_kib": round(len(html.encode("utf-8")) / 1024, 1),
+            "results_found": len(parsed)
+        })
+        results[os.path.basename(path)] = stats
+
+        print(f"{os.path.basename(path):32s} {engine_name:7s} {stats['html_kib']:8.1f} KiB  "
+              f"{stats['ops_per_sec']:8.2f} 次/秒  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  "
+              f"峰值分配 {stats['peak_alloc_kib']:9.1f} KiB  结果 {stats['results_found']}")
+
+    return results
+
+
+def extraction_quality(extracted, expected):
+    """按词袋计算提取文本相对标注正文的 precision / recall / F1"""
+    got = Counter(_QUALITY_TOKEN.findall(extracted.lower()))
+    want = Counter(_QUALITY_TOKEN.findall(expected.lower()))
+    overlap = sum((got & want).values())
+    precision = overlap / sum(got.values()) if got else 0.0
+    recall = overlap / sum(want.values()) if want else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return round(precision, 3), round(recall, 3), round(f1, 3)
+
+
+def benchmark_extractors(extract_dir=EXTRACT_FIXTURES_DIR, iterations=50):
+    """
+    比较各正文提取方式。每次迭代都重新解析 HTML（selectors 方式会修改 soup），
+    parse_only 给出单纯解析的耗时，两者之差即为提取本身的耗时。
+    """
+    fixtures = sorted(name for name in os.listdir(extract_dir) if name.endswith(".html")) if os.path.isdir(extract_dir) else []
+    if not fixtures:
+        print(f"在 {extract_dir} 中没有找到 *.html 文件")
+        return {}
+
+    selector_engine = WebSearch(content_extractor="selectors")
+    extractors = {
+        "density": extract_main_text,
+        "selectors": selector_engine._extract_main_text_selectors
+    }
+    results = {}
+
+    for name in fixtures:
+        with open(os.path.join(extract_dir, name), encoding="utf-8") as f:
+            html = f.read()
+        expected = None
+        expected_path = os.path.join(extract_dir, name[:-len(".html")] + ".txt")
+        if os.path.exists(expected_path):
+            with open(expected_path, encoding="utf-8") as f:
+                expected = f.read()
+
+        parse_stats = benchmark_function(lambda: BeautifulSoup(html, "html.parser"), iterations)
+        results[f"{name}:parse_only"] = parse_stats
+        print(f"{name:28s} {'parse_only':10s} p50 {parse_stats['p50_ms']:8.2f} ms")
+
+        for extractor_name, extract in extractors.items():
+            run = lambda: extract(BeautifulSoup(html, "html.parser"))
+            stats = benchmark_function(run, iterations)
+            text = run()
+            stats.update({"extractor": extractor_name, "chars": len(text)})
+            quality = ""
+            if expected is not None:
+                stats["precision"], stats["recall"], stats["f1"] = extraction_quality(text, expected)
+                quality = f"  P {stats['precision']:.3f}  R {stats['recall']:.3f}  F1 {stats['f1']:.3f}"
+            results[f"{name}:{extractor_name}"] = stats
+            print(f"{name:28s} {extractor_name:10s} p50 {stats['p50_ms']:8.2f} ms  "
+                  f"提取 {stats['p50_ms'] - parse_stats['p50_ms']:8.2f} ms  "
+                  f"峰值分配 {stats['peak_alloc_kib']:9.1f} KiB  {stats['chars']:6d} 字{quality}")
+
+    return results
+
+
+def build_search_payload(extract_dir=EXTRACT_FIXTURES_DIR, num_results=10, content_chars=5000, seed=0):
+    """
+    构造一个 fetch_content=true 的 /search 响应。每个结果的正文从标注正文的词汇中按固定种子随机抽取，
+    长度与 fetch_content 的截断长度相当；不直接重复标注正文，否则 gzip 会把重复部分压得过小，压缩率失真。
+    """
+    tokens = []
+    if os.path.isdir(extract_dir):
+        for name in sorted(os.listdir(extract_dir)):
+            if name.endswith(".txt"):
+                with open(os.path.join(extract_dir, name), encoding="utf-8") as f:
+                    tokens.extend(_QUALITY_TOKEN.findall(f.read()))
+    if not tokens:
+        tokens = _QUALITY_TOKEN.findall("这是一段用于基准测试的正文 This is filler text for the benchmark")
+
+    rng = random.Random(seed)
+
+    def make_text(chars):
+        parts = []
+        length = 0
+        while length < chars:
+            token = rng.choice(tokens)
+            piece = token if len(token) == 1 and ord(token) > 0x3000 else " " + token
+            parts.append(piece)
+            length += len(piece)
+            if rng.random() < 0.05:
+                parts.append("。\n")
+        return "".join(parts).strip()
+
+    engine = WebSearch()
+    search_results = []
+    detailed_content = {}
+    for i in range(num_results):
+        text = make_text(content_chars)
+        url = f"https://example-{i}.org/article/{i}"
+        title = text[:30]
+        search_results.append({"title": title, "link": url, "snippet": text[:160]})
+        detailed_content[url] = engine._build_page_result(url, title, None, None, text, False, content_chars)
+
+    query = "基准测试查询"
+    return {
+        "query": query,
+        "search_results": search_results,
+        "detailed_content": detailed_content,
+        "formatted_response": ResponseProcessor().create_prompt_with_search_results(query, search_results, detailed_content),
+        "duplicates": [],
+        "partial": False,
+        "llm_config": {"model": "deepseek-r1:1.5b", "temperature": 0.7, "max_tokens": 2048}
+    }
+
+
+def benchmark_payload(extract_dir=EXTRACT_FIXTURES_DIR, iterations=50, num_results=10):
+    """
+    比较 /search 大响应的序列化、压缩和字段选择：jsonify_stdlib 等价于 Flask jsonify 的默认行为
+    （ensure_ascii、sort_keys），压缩和字段选择都在 response_encoding.dumps 的输出上进行。
+    """
+    payload = build_search_payload(extract_dir, num_results)
+    results = {}
+
+    def add(name, fn, extra=""):
+        stats = benchmark_function(fn, iterations)
+        stats["bytes"] = len(fn())
+        results[name] = stats
+        print(f"{name:42s} {stats['bytes'] / 1024:9.1f} KiB  p50 {stats['p50_ms']:8.3f} ms  "
+              f"p99 {stats['p99_ms']:8.3f} ms  峰值分配 {stats['peak_alloc_kib']:9.1f} KiB{extra}")
+
+    serializers = {
+        "jsonify_stdlib": lambda: json.dumps(payload, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+        "stdlib_utf8": lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    }
+    if response_encoding.orjson is not None:
+        serializers["orjson"] = lambda: response_encoding.orjson.dumps(payload, option=response_encoding.orjson.OPT_NON_STR_KEYS)
+    else:
+        print("未安装 orjson，跳过 orjson 序列化")
+    for name, fn in serializers.items():
+        add(f"serialize:{name}", fn)
+
+    body = response_encoding.dumps(payload)
+    for encoding in response_encoding.supported_encodings():
+        add(f"compress:{encoding}", lambda: response_encoding.compress(body, encoding),
+            f"  压缩率 {len(response_encoding.compress(body, encoding)) / len(body):.1%}")
+    if response_encoding.brotli is None:
+        print("未安装 brotli，跳过 br 压缩")
+
+    for fields in ("search_results,formatted_response", "search_results,detailed_content", "search_results"):
+        selected = response_encoding.select_fields(payload, response_encoding.parse_fields(fields))
+        add(f"fields:{fields}", lambda: response_encoding.dumps(selected))
+
+    return results
+
+
+def benchmark_prompt_formats(extract_dir=EXTRACT_FIXTURES_DIR, iterations=50, num_results=10):
+    """
+    比较各提示词格式：只有搜索结果，以及带抓取正文（fetch_content=true）两种情况。
+    token 数为 estimate_tokens 的估计值，节省比例相对 markdown 计算。
+    """
+    payload = build_search_payload(extract_dir, num_results)
+    processor = ResponseProcessor()
+    cases = {
+        "snippets": (payload["search_results"], None),
+        "content": (payload["search_results"], payload["detailed_content"])
+    }
+    results = {}
+
+    for case, (search_results, detailed_content) in cases.items():
+        baseline_tokens = None
+        for output_format in ResponseProcessor.OUTPUT_FORMATS:
+            build = lambda: processor.create_prompt_with_search_results(
+                payload["query"], search_results, detailed_content, output_format=output_format
+            )
+            stats = benchmark_function(build, iterations)
+            prompt = build()
+            stats.update({"format": output_format, "chars": len(prompt), "tokens": estimate_tokens(prompt)})
+            if baseline_tokens is None:
+                baseline_tokens = stats["tokens"]
+            saving = 1 - stats["tokens"] / baseline_tokens if baseline_tokens else 0.0
+            results[f"{case}:{output_format}"] = stats
+            print(f"{case:9s} {output_format:9s} {stats['chars']:8d} 字符  约 {stats['tokens']:7d} tokens "
+                  f"(节省 {saving:5.1%})  p50 {stats['p50_ms']:8.3f} ms")
+
+    return results
+
+
+def common_prefix_length(a, b):
+    """两个字符串的公共前缀长度"""
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def ollama_prefill(ollama_url, model, prompt):
+    """只生成 1 个 token，返回 Ollama 报告的预填充 token 数和耗时（毫秒）"""
+    response = requests.post(
+        f"{ollama_url.rstrip('/')}/api/generate",
+        json={"model": model, "prompt": prompt, "stream": False,
+              "options": {"num_predict": 1, "temperature": 0}},
+        timeout=600
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data.get("prompt_eval_count", 0), data.get("prompt_eval_duration", 0) / 1e6
+
+
+def benchmark_prompt_prefix(extract_dir=EXTRACT_FIXTURES_DIR, num_results=10, ollama_url=None,
+                            model="deepseek-r1:1.5b", output_format="markdown"):
+    """
+    模拟连续三次请求：查询 A、30 秒后重复查询 A（结果相同，例如重新生成回答）、再查询 B。
+    对每种布局统计每次请求与上一次请求的公共前缀（估算 token 数），即模型前缀缓存最多可以复用的部分。
+    指定 ollama_url 时把同样的序列发给 Ollama，记录实际的预填充 token 数和耗时；
+    每种布局开始前先发送一个无关的提示词，清掉上一种布局留下的缓存。
+    """
+    payload_a = build_search_payload(extract_dir, num_results, content_chars=1500, seed=1)
+    payload_b = build_search_payload(extract_dir, num_results, content_chars=1500, seed=2)
+    start = datetime(2025, 1, 1, 12, 0, 0)
+    sequence = [
+        ("first", "量子计算最新进展", payload_a, start),
+        ("repeat", "量子计算最新进展", payload_a, start + timedelta(seconds=30)),
+        ("new_query", "固态电池量产时间", payload_b, start + timedelta(seconds=60))
+    ]
+    processor = ResponseProcessor(output_format=output_format)
+    results = {}
+
+    for layout in ResponseProcessor.PROMPT_LAYOUTS:
+        prompts = [
+            (name, processor.create_prompt_with_search_results(
+                query, payload["search_results"], payload["detailed_content"], layout=layout, now=now
+            ))
+            for name, query, payload, now in sequence
+        ]
+
+        if ollama_url:
+            ollama_prefill(ollama_url, model, f"预热 {layout}")
+
+        previous = ""
+        for name, prompt in prompts:
+            shared = prompt[:common_prefix_length(previous, prompt)]
+            stats = {
+                "layout": layout,
+                "tokens": estimate_tokens(prompt),
+                "shared_prefix_tokens": estimate_tokens(shared)
+            }
+            stats["reusable_ratio"] = round(stats["shared_prefix_tokens"] / stats["tokens"], 3) if stats["tokens"] else 0.0
+            line = (f"{layout:15s} {name:10s} 约 {stats['tokens']:6d} tokens  "
+                    f"共享前缀约 {stats['shared_prefix_tokens']:6d} tokens ({stats['reusable_ratio']:.1%})")
+            if ollama_url:
+                stats["prompt_eval_count"], stats["prefill_ms"] = ollama_prefill(ollama_url, model, prompt)
+                line += f"  Ollama 预填充 {stats['prompt_eval_count']:6d} tokens {stats['prefill_ms']:9.1f} ms"
+            results[f"{layout}:{name}"] = stats
+            print(line)
+            previous = prompt
+
+    if ollama_url:
+        for name, _query, _payload, _now in sequence[1:]:
+            classic = results[f"classic:{name}"]["prefill_ms"]
+            friendly = results[f"cache_friendly:{name}"]["prefill_ms"]
+            if classic:
+                print(f"{name:10s} cache_friendly 节省预填充 {classic - friendly:9.1f} ms ({1 - friendly / classic:.1%})")
+
+    return results
+
+
+# 时间问题的常见问法，最后几个不是在问当前时间，应交给模型回答
+TIME_QUERIES = [
+    "现在几点了？", "请问现在几点", "当前时间", "现在的时间是多少", "今天几号", "今天是几月几号",
+    "今天星期几", "今天的日期", "现在的日期和时间",
+    "What time is it?", "what's the time now", "current time", "What's the date today?",
+    "today's date", "What day is it today?", "current date and time",
+    "What time does the Louvre open?", "纽约现在几点", "what date is the next full moon"
+]
+
+
+def legacy_time_answer(search_url, ollama_url=None, llm_type="ollama"):
+    """原来 /llm 回答时间问题的做法：创建客户端（探测 Ollama 模型），再通过 /search 搜索当前时间"""
+    from llm_client_example import LLMWebSearchClient
+
+    if ollama_url:
+        os.environ["OLLAMA_API_URL"] = ollama_url
+    client = LLMWebSearchClient(search_api_url=search_url, llm_type=llm_type)
+    return client.search_web("current time and date", 3, True, "baidu")
+
+
+def benchmark_time_queries(iterations=50, search_url=None, ollama_url=None):
+    """
+    统计 TimeService 对常见问法的识别结果和回答耗时；指定 search_url 时同样测量原来的搜索做法
+    （每次都要经过网络，迭代次数最多为 5）。
+    """
+    from time_service import TimeService, classify_time_query
+
+    service = TimeService("Asia/Shanghai", refresh_interval=0)
+    results = {}
+    for query in TIME_QUERIES:
+        kind = classify_time_query(query)
+        print(f"{query:36s} -> {kind or '交给模型'}")
+
+    answered = [query for query in TIME_QUERIES if classify_time_query(query)]
+    stats = benchmark_function(lambda: [service.answer(query) for query in answered], iterations)
+    stats["per_query_ms"] = round(stats["mean_ms"] / len(answered), 4)
+    results["local_clock"] = stats
+    print(f"\n{'local_clock':14s} 每个问题 {stats['per_query_ms']:10.4f} ms  ({len(answered)} 个问题 p99 {stats['p99_ms']:.3f} ms)")
+    print(f"示例回答: {service.answer(answered[0])}")
+
+    if search_url:
+        stats = benchmark_function(lambda: legacy_time_answer(search_url, ollama_url), min(iterations, 5), warmup=1)
+        stats["per_query_ms"] = stats["mean_ms"]
+        results["search_web"] = stats
+        print(f"{'search_web':14s} 每个问题 {stats['per_query_ms']:10.1f} ms  (p99 {stats['p99_ms']:.1f} ms)")
+        print(f"本地时钟快 {stats['per_query_ms'] / results['local_clock']['per_query_ms']:.0f} 倍")
+    else:
+        print("未指定 --search-url，跳过原来的搜索做法")
+    return results
+
+
+def save_baseline(mode, results, path):
+    """把基准结果保存为 JSON 基线"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    baseline = {
+        "mode": mode,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    print(f"\n基线已保存到 {path}")
+
+
+def compare_with_baseline(results, path, tolerance=0.10):
+    """
+    与已保存的基线比较 p50 耗时。
+    返回性能下降超过 tolerance 的条目列表。
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\n=== 与基线比较 ({path}, {baseline.get('created_at', '未知时间')}) ===")
+    regressions = []
+    for name, stats in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            print(f"{name:32s} 基线中没有该条目")
+            continue
+        if not old.get("p50_ms"):
+            continue
+        change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"]
+        flag = ""
+        if change > tolerance:
+            flag = "  <-- 变慢"
+            regressions.append(name)
+        elif change < -tolerance:
+            flag = "  <-- 变快"
+        print(f"{name:32s} p50 {old['p50_ms']:8.2f} -> {stats['p50_ms']:8.2f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM联网搜索插件性能基准工具")
+    parser.add_argument("--mode", type=str, default="parse", choices=["parse", "extract", "payload", "prompt", "prefix", "time"],
+                        help="基准模式: parse(搜索结果页解析器), extract(正文提取), payload(/search 响应序列化与压缩), "
+                             "prompt(提示词格式), prefix(提示词布局与前缀缓存), time(时间问题的本地回答与搜索)")
+    parser.add_argument("--fixtures-dir", type=str, default=os.path.dirname(os.path.abspath(__file__)),
+                        help="测试数据目录 (默认: 本文件所在目录)")
+    parser.add_argument("--extract-dir", type=str, default=EXTRACT_FIXTURES_DIR,
+                        help="正文提取测试网页目录 (默认: benchmark_fixtures/extract)")
+    parser.add_argument("--iterations", type=int, default=50, help="每项测试的迭代次数 (默认: 50)")
+    parser.add_argument("--num-results", type=int, default=10, help="解析的最大结果数量 (默认: 10)")
+    parser.add_argument("--ollama-url", type=str, default=None,
+                        help="prefix 模式下用于测量实际预填充耗时的 Ollama 地址，例如 http://localhost:11434；"
+                             "time 模式下为原来做法探测模型使用的 Ollama 地址")
+    parser.add_argument("--search-url", type=str, default=None,
+                        help="time 模式下原来做法使用的 /search 地址，例如 http://localhost:5005/search")
+    parser.add_argument("--model", type=str, default="deepseek-r1:1.5b", help="prefix 模式使用的 Ollama 模型")
+    parser.add_argument("--save-baseline", type=str, default=None, help="把结果保存为 JSON 基线文件")
+    parser.add_argument("--compare", type=str, default=None, help="与指定的 JSON 基线文件比较")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="判定性能变化的阈值 (默认: 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="性能下降超过阈值时返回非零退出码")
+    args = parser.parse_args()
+
+    if args.mode == "parse":
+        results = benchmark_serp_parsers(args.fixtures_dir, args.iterations, args.num_results)
+    elif args.mode == "extract":
+        results = benchmark_extractors(args.extract_dir, args.iterations)
+    elif args.mode == "payload":
+        results = benchmark_payload(args.extract_dir, args.iterations, args.num_results)
+    elif args.mode == "prompt":
+        results = benchmark_prompt_formats(args.extract_dir, args.iterations, args.num_results)
+    elif args.mode == "prefix":
+        results = benchmark_prompt_prefix(args.extract_dir, args.num_results, args.ollama_url, args.model)
+    elif args.mode == "time":
+        results = benchmark_time_queries(args.iterations, args.search_url, args.ollama_url)
+
+    if args.compare:
+        regressions = compare_with_baseline(results, args.compare, args.tolerance)
+        if regressions and args.fail_on_regression:
+            print(f"\n{len(regressions)} 项性能下降超过 {args.tolerance:.0%}")
+            sys.exit(1)
+
+    if args.save_baseline:
+        save_baseline(args.mode, results, args.save_baseline)
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class CircuitBreaker:
+    """
+    搜索引擎熔断器（关闭 / 打开 / 半开）。
+    Circuit breaker for a search engine (closed / open / half-open).
+
+    连续失败（请求出错或解析结果为空）达到阈值后熔断器打开，在冷却时间内所有请求直接失败；
+    冷却结束后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    试探请求既没有成功也没有失败（例如截止时间已到）时应调用 release_probe()；
+    超过 probe_timeout 仍未结束的试探视为丢失，放行下一个试探请求。
+    After `failure_threshold` consecutive failures (request errors or empty parses) the breaker
+    opens and every call fails fast until `recovery_timeout` has elapsed. It then goes half-open
+    and lets a single trial call through: success closes it, failure opens it again.
+    A trial call that ends with neither outcome (e.g. the deadline expired) should call
+    release_probe(); a trial still unfinished after `probe_timeout` is treated as lost and the
+    next call becomes the trial.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: float = 60.0,
+                 probe_timeout: Optional[float] = None):
+        """
+        参数 | Args:
+            name: 熔断器名称（通常是搜索引擎名） | Breaker name (usually the engine name)
+            failure_threshold: 触发熔断的连续失败次数 | Consecutive failures that trip the breaker
+            recovery_timeout: 打开状态持续的秒数 | Seconds to stay open before half-open
+            probe_timeout: 半开试探请求的最长时间（秒），默认等于 recovery_timeout |
+                           Seconds a half-open trial call may take before it counts as lost; defaults to recovery_timeout
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_timeout = recovery_timeout if probe_timeout is None else probe_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_in_flight = False
+        self._probe_started_at: Optional[float] = None
+        self._total_failures = 0
+        self._total_short_circuits = 0
+        self._last_failure_reason: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """计算当前状态（调用方需持有锁）。 | Compute the current state (caller holds the lock)."""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        判断是否允许本次请求通过。
+        Decide whether a call may go through right now.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and (
+                    not self._half_open_in_flight
+                    or time.monotonic() - self._probe_started_at >= self.probe_timeout):
+                self._half_open_in_flight = True
+                self._probe_started_at = time.monotonic()
+                return True
+            self._total_short_circuits += 1
+            return False
+
+    def record_success(self):
+        """记录一次成功调用。 | Record a successful call."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._half_open_in_flight = False
+
+    def record_failure(self, reason: Optional[str] = None):
+        """记录一次失败调用。 | Record a failed call."""
+        with self._lock:
+            self._consecutive_failures += 1
+            self._total_failures += 1
+            self._last_failure_reason = reason
+            state = self._current_state()
+            if state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_in_flight = False
+
+    def release_probe(self):
+        """
+        半开试探请求没有得出结果（没有成功也没有失败）时释放它，下一个请求重新试探。
+        Release a half-open trial call that ended with neither a success nor a failure, so the next
+        call becomes the trial.
+        """
+        with self._lock:
+            self._half_open_in_flight = False
+
+    def reset(self):
+        """手动重置为关闭状态。 | Manually reset the breaker to closed."""
+        self.record_success()
+
+    def status(self) -> Dict[str, Any]:
+        """返回可序列化的状态信息。 | Return a JSON-serializable status snapshot."""
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = round(max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                "retry_in_seconds": retry_in,
+                "total_failures": self._total_failures,
+                "total_short_circuits": self._total_short_circuits,
+                "last_failure_reason": self._last_failure_reason
+            }
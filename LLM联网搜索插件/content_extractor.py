@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.element import Comment, Declaration, Doctype, ProcessingInstruction
+
+# 整个子树都不包含正文的标签 | Tags whose whole subtree never holds main content
+SKIP_TAGS = {
+    "script", "style", "svg", "noscript", "iframe", "template", "canvas",
+    "nav", "footer", "header", "aside", "form", "button", "select", "textarea"
+}
+# 段落类标签：得分计入父节点和祖父节点 | Paragraph-like tags: their score goes to the parent and grandparent
+PARAGRAPH_TAGS = {"p", "pre", "blockquote", "li", "td", "dd", "h2", "h3", "h4"}
+# class / id 中表示模板内容的词 | Words in class / id that mark boilerplate
+BOILERPLATE_PATTERN = re.compile(
+    r"(?:^|[\s_-])(?:nav|navbar|menu|footer|sidebar|side-bar|comments?|related|share|social|"
+    r"ads?|advert|advertisement|banner|cookie|breadcrumbs?|recommend|copyright|hot-?list|toolbar|popup|modal)(?:$|[\s_-])",
+    re.IGNORECASE
+)
+# 统计逗号数时使用的标点，中英文都算 | Punctuation counted as commas, Chinese and English
+_COMMAS = re.compile(r"[,，、；;。]")
+
+_NON_TEXT_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+
+def _is_boilerplate(node: Tag) -> bool:
+    attrs = node.attrs
+    if not attrs:
+        return False
+    classes = attrs.get("class")
+    if classes:
+        if isinstance(classes, list):
+            classes = " ".join(classes)
+        if BOILERPLATE_PATTERN.search(classes):
+            return True
+    node_id = attrs.get("id")
+    return bool(node_id and BOILERPLATE_PATTERN.search(node_id))
+
+
+def _paragraph_score(chars: int, commas: int) -> float:
+    """段落得分：1 + 逗号数 + 每 100 字 1 分（最多 3 分）。 | Paragraph score: 1 + commas + 1 per 100 chars (max 3)."""
+    return 1.0 + commas + min(chars / 100.0, 3.0)
+
+
+def extract_main_text(soup: BeautifulSoup, min_paragraph_chars: int = 25) -> str:
+    """
+    按文本密度和链接密度在一次 DOM 遍历中找出正文所在的节点，返回其文本。
+    Find the node holding the main content by text density and link density in a single DOM
+    traversal and return its text.
+
+    遍历时跳过脚本、导航等模板子树，并记录每个元素的文本范围、字符数和链接字符数；
+    每个段落（或直接包含足够文本的元素）按长度和标点打分，分数累加到容器节点上，
+    最后选出 得分 ×（1 - 链接密度）最高的容器。不会修改 soup。
+    The walk skips script/navigation subtrees and records each element's text range, character
+    count and link-character count. Every paragraph (or element with enough direct text) is scored
+    by length and punctuation, the score is credited to its containers, and the container with the
+    best score × (1 - link density) wins. The soup is not modified.
+
+    参数 | Args:
+        soup: 已解析的网页 | Parsed page
+        min_paragraph_chars: 非段落标签的元素直接包含的文本至少多少字才计分 |
+                             Direct text an element needs before it is scored as a paragraph
+
+    返回 | Returns:
+        正文文本，各文本片段以空格连接 | Main text with text fragments joined by spaces
+    """
+    root = soup.body or soup
+    pieces: List[str] = []
+    # 字符数、链接字符数和逗号数的前缀和，元素的统计为进入与离开时之差
+    # Running totals; an element's stats are the difference between entering and leaving it
+    total_chars = 0
+    link_chars = 0
+    total_commas = 0
+
+    # id(节点) -> [片段起点, 片段终点, 字符数, 链接字符数] | id(node) -> [piece start, piece end, chars, link chars]
+    spans: Dict[int, List[int]] = {}
+    scores: Dict[int, float] = {}
+    nodes: Dict[int, Tag] = {}
+
+    # 栈元素: (节点, 是否在链接内, 退出时的记录) | stack items: (node, inside a link, exit record)
+    stack = [(root, False, None)]
+    while stack:
+        node, in_link, record = stack.pop()
+
+        if record is not None:
+            # 离开元素：计算统计并给容器计分 | Leaving an element: finish its stats and credit containers
+            start, chars_before, links_before, commas_before, direct_chars = record
+            chars = total_chars - chars_before
+            links = link_chars - links_before
+            spans[id(node)] = [start, len(pieces), chars, links]
+            if chars < min_paragraph_chars:
+                continue
+
+            if node.name in PARAGRAPH_TAGS:
+                targets = ((node.parent, 1.0), (node.parent.parent if node.parent else None, 0.5))
+            elif direct_chars >= min_paragraph_chars:
+                targets = ((node, 1.0), (node.parent, 0.5))
+            else:
+                continue
+
+            score = _paragraph_score(chars, total_commas - commas_before) * (1.0 - links / chars)
+            for target, weight in targets:
+                if isinstance(target, Tag):
+                    scores[id(target)] = scores.get(id(target), 0.0) + score * weight
+                    nodes[id(target)] = target
+            continue
+
+        if isinstance(node, NavigableString):
+            if isinstance(node, _NON_TEXT_STRINGS):
+                continue
+            text = node.strip()
+            if text:
+                pieces.append(text)
+                total_chars += len(text)
+                total_commas += len(_COMMAS.findall(text))
+                if in_link:
+                    link_chars += len(text)
+            continue
+
+        if not isinstance(node, Tag):
+            continue
+        if node is not root and (node.name in SKIP_TAGS or _is_boilerplate(node)):
+            continue
+
+        direct_chars = 0
+        for child in node.contents:
+            if isinstance(child, NavigableString) and not isinstance(child, _NON_TEXT_STRINGS):
+                direct_chars += len(child.strip())
+
+        stack.append((node, in_link, (len(pieces), total_chars, link_chars, total_commas, direct_chars)))
+        child_in_link = in_link or node.name == "a"
+        for child in reversed(node.contents):
+            stack.append((child, child_in_link, None))
+
+    best: Optional[Tag] = None
+    best_score = 0.0
+    for node_id, score in scores.items():
+        start, end, chars, links = spans.get(node_id, (0, 0, 0, 0))
+        if not chars:
+            continue
+        adjusted = score * (1.0 - links / chars)
+        if adjusted > best_score:
+            best_score = adjusted
+            best = nodes[node_id]
+
+    if best is None:
+        return " ".join(pieces)
+    start, end = spans[id(best)][:2]
+    return " ".join(pieces[start:end])
@@ -0,0 +1,62 @@
+"""
+请求级别的截止时间。
+Request-scoped deadline.
+
+/search 在请求开始时设置截止时间，搜索引擎的重试、跳转链接的等待和网页抓取都从当前上下文读取剩余时间，
+把各自的超时缩短到不超过截止时间。抓取线程通过 contextvars.copy_context() 继承截止时间。
+/search sets a deadline when the request starts; engine retries, redirect waits and page fetches
+read the remaining time from the current context and shrink their own timeouts to fit. Fetch
+threads inherit the deadline through contextvars.copy_context().
+"""
+
+import time
+from contextvars import ContextVar, Token
+from typing import Optional
+
+# time.monotonic() 下的截止时刻 | Deadline on the time.monotonic() clock
+_current_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """当前请求的截止时间已到。 | The current request's deadline has passed."""
+
+
+def begin_deadline(seconds: Optional[float]) -> Token:
+    """
+    为当前上下文设置 seconds 秒后的截止时间；None 或不大于 0 表示不限时。
+    Set a deadline `seconds` from now for the current context; None or <= 0 means no deadline.
+    """
+    deadline = time.monotonic() + seconds if seconds and seconds > 0 else None
+    return _current_deadline.set(deadline)
+
+
+def end_deadline(token: Token):
+    """恢复设置截止时间之前的状态。 | Restore the state from before begin_deadline()."""
+    _current_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """剩余秒数（不小于 0），没有截止时间时为 None。 | Seconds left (never negative), or None without a deadline."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired() -> bool:
+    """截止时间是否已到。 | Whether the deadline has passed."""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def bounded_timeout(timeout: float) -> float:
+    """
+    返回不超过剩余时间的超时；截止时间已到时抛出 DeadlineExceeded。
+    Return `timeout` capped at the time left; raises DeadlineExceeded once the deadline has passed.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("请求截止时间已到")
+    return min(timeout, left)
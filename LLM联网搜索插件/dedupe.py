@@ -0,0 +1,203 @@
+import hashlib
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import DUPLICATES_DROPPED
+
+# 归一化时去掉的字符：空白和标点 | Characters dropped during normalisation: whitespace and punctuation
+_NOISE = re.compile(r'[\W_]+', re.UNICODE)
+
+FINGERPRINT_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    """小写并去掉空白和标点，使转载时的排版差异不影响指纹。 | Lowercase and strip whitespace/punctuation so layout changes don't affect fingerprints."""
+    return _NOISE.sub('', (text or '').lower())
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(text: str, shingle_size: int = 4) -> Optional[int]:
+    """
+    计算文本基于字符 shingle 的 64 位 SimHash。文本为空时返回 None。
+    64-bit SimHash over character shingles of the normalised text; None for empty text.
+
+    按字符而不是按词切分，中文和英文都不需要分词。
+    Character shingles work for Chinese and English alike without word segmentation.
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return None
+    if len(normalized) <= shingle_size:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + shingle_size] for i in range(len(normalized) - shingle_size + 1)}
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        h = _shingle_hash(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹之间不同的位数。 | Number of differing bits between two fingerprints."""
+    return bin(a ^ b).count('1')
+
+
+def collapse_near_duplicates(items: List[Any], text_of: Callable[[Any], str], threshold: int = 3,
+                             shingle_size: int = 4) -> Tuple[List[int], List[Tuple[int, int, int]]]:
+    """
+    按顺序保留每组近似重复中的第一个（排名最高的）条目。
+    Keep the first (highest-ranked) item of each group of near-duplicates, preserving order.
+
+    参数 | Args:
+        items: 待去重的条目 | Items to deduplicate
+        text_of: 从条目取出用于比较的文本 | Returns the text compared for an item
+        threshold: SimHash 汉明距离不超过该值即视为重复 | Hamming distance at or below which items are duplicates
+
+    返回 | Returns:
+        (保留条目的下标, [(被丢弃下标, 保留下标, 距离), ...]) |
+        (indexes kept, [(dropped index, kept index it duplicates, distance), ...])
+    """
+    kept_indexes: List[int] = []
+    fingerprints: List[Tuple[int, int]] = []
+    dropped: List[Tuple[int, int, int]] = []
+    for i, item in enumerate(items):
+        fingerprint = simhash(text_of(item), shingle_size)
+        if fingerprint is None:
+            # 空文本不参与比较，但仍然保留 | Items with no text are never compared but are kept
+            kept_indexes.append(i)
+            continue
+        match = None
+        for kept_index, kept_fingerprint in fingerprints:
+            distance = hamming_distance(fingerprint, kept_fingerprint)
+            if distance <= threshold:
+                match = (kept_index, distance)
+                break
+        if match:
+            dropped.append((i, match[0], match[1]))
+            continue
+        kept_indexes.append(i)
+        fingerprints.append((i, fingerprint))
+    return kept_indexes, dropped
+
+
+class NearDuplicateFilter:
+    """
+    搜索结果近似重复过滤器：抓取网页前按标题和摘要去重，构建提示词前按正文去重。
+    Near-duplicate filter for search results: collapses mirrored copies by title + snippet before
+    fetching pages, and by extracted content before building the prompt.
+    """
+
+    def __init__(self, snippet_threshold: int = 6, content_threshold: int = 4, shingle_size: int = 4):
+        """
+        参数 | Args:
+            snippet_threshold: 摘要指纹的汉明距离阈值；摘要很短，来源后缀等少量差异就会改变较多位 |
+                               Hamming threshold for title + snippet fingerprints; snippets are short, so a
+                               source suffix alone flips several bits
+            content_threshold: 正文指纹的汉明距离阈值 | Hamming threshold for content fingerprints
+            shingle_size: 字符 shingle 长度 | Character shingle length
+        """
+        self.snippet_threshold = snippet_threshold
+        self.content_threshold = content_threshold
+        self.shingle_size = shingle_size
+
+    def result_deduper(self) -> "ResultDeduper":
+        """
+        创建逐条去重器，用于结果逐条到达的流水线。
+        Create an incremental deduper for pipelines where results arrive one at a time.
+        """
+        return ResultDeduper(self)
+
+    def filter_results(self, results: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        按 URL 和标题+摘要去重搜索结果。
+        Collapse search results with the same URL or a near-identical title + snippet.
+
+        返回 | Returns:
+            (保留的结果, 被丢弃的重复项报告) | (kept results, report of dropped duplicates)
+        """
+        deduper = self.result_deduper()
+        unique = []
+        report = []
+        for result in results:
+            duplicate = deduper.add(result)
+            if duplicate:
+                report.append(duplicate)
+            else:
+                unique.append(result)
+        return unique, report
+
+    def filter_content(self, results: List[Dict[str, str]],
+                       detailed_content: Dict[str, Any]) -> Tuple[List[Dict[str, str]], Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        按抓取到的正文去重；没有成功抓取正文的结果保持不变。
+        Collapse results whose fetched content is near-identical; results without fetched content are kept.
+
+        返回 | Returns:
+            (保留的结果, 保留的详细内容, 被丢弃的重复项报告) | (kept results, kept detailed content, report of dropped duplicates)
+        """
+        def content_of(result):
+            content = detailed_content.get(result.get('link'))
+            if isinstance(content, dict) and not content.get('error'):
+                return content.get('content', '')
+            return ''
+
+        kept, dropped = collapse_near_duplicates(results, content_of, self.content_threshold, self.shingle_size)
+        kept_results = [results[i] for i in kept]
+        kept_links = {r.get('link') for r in kept_results}
+        kept_content = {url: content for url, content in detailed_content.items() if url in kept_links}
+        report = [self._report(results[i], results[j], "content", distance) for i, j, distance in dropped]
+        return kept_results, kept_content, report
+
+    @staticmethod
+    def _report(dropped: Dict[str, str], kept: Dict[str, str], stage: str, distance: int) -> Dict[str, Any]:
+        DUPLICATES_DROPPED.inc(stage=stage)
+        return {
+            "link": dropped.get('link'),
+            "title": dropped.get('title'),
+            "duplicate_of": kept.get('link'),
+            "stage": stage,
+            "distance": distance
+        }
+
+
+class ResultDeduper:
+    """
+    逐条判断搜索结果是否与之前保留的结果重复（先比较 URL，再比较标题+摘要）。
+    Checks each incoming search result against the ones kept so far (URL first, then title + snippet).
+    """
+
+    def __init__(self, duplicate_filter: NearDuplicateFilter):
+        self._filter = duplicate_filter
+        self._by_link: Dict[str, Dict[str, str]] = {}
+        self._fingerprints: List[Tuple[Dict[str, str], int]] = []
+
+    def add(self, result: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        保留结果并返回 None；如果是重复项则返回报告，调用方应丢弃该结果。
+        Keep the result and return None, or return a report if it is a duplicate the caller should drop.
+        """
+        link = result.get('link')
+        if link in self._by_link:
+            return self._filter._report(result, self._by_link[link], "url", 0)
+
+        fingerprint = simhash(f"{result.get('title', '')} {result.get('snippet', '')}", self._filter.shingle_size)
+        if fingerprint is not None:
+            for kept, kept_fingerprint in self._fingerprints:
+                distance = hamming_distance(fingerprint, kept_fingerprint)
+                if distance <= self._filter.snippet_threshold:
+                    return self._filter._report(result, kept, "snippet", distance)
+            self._fingerprints.append((result, fingerprint))
+
+        self._by_link[link] = result
+        return None
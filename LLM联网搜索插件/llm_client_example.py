@@ -1,22 +1,80 @@
 import requests
 import json
 import os
+import threading
 import time
+from contextlib import nullcontext
 from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional, Union
 
+from answer_cache import AnswerCache
+from llm_queue import JobCancelled, QueueRejected
+from metrics import LLM_LOAD_LATENCY, LLM_MODEL_RELOADS
+from singleflight import SingleFlight
+
 # 加载环境变量
 load_dotenv()
 
+# Ollama 报告的 load_duration 超过该秒数即视为重新加载了模型（已驻留时只有几十毫秒）
+RELOAD_THRESHOLD_SECONDS = 0.5
+
+# 每个后端（ollama、api、search）一个共享的连接池会话，/llm 每次请求新建的客户端也复用已建立的连接
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# 同一进程内所有客户端共享：相同的 LLM 请求同时只调用一次模型
+_llm_flights = SingleFlight("llm")
+
+
+def backend_session(backend, pool_size=8):
+    """返回指定后端共享的 requests.Session（保持连接，按后端分开连接池）"""
+    with _sessions_lock:
+        session = _sessions.get(backend)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[backend] = session
+        return session
+
+
+def parse_keep_alive(value):
+    """
+    解析 Ollama 的 keep_alive 设置：数字表示秒（负数表示一直驻留，0 表示立即卸载），
+    "30m"、"24h" 等时长字符串原样传递，空值表示使用 Ollama 服务端的默认值（5 分钟）
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
 class LLMWebSearchClient:
     """
     连接本地LLM与网络搜索插件的客户端。
     这是一个示例实现，可以适配不同的LLM API。
     """
     
-    def __init__(self, llm_api_url=None, search_api_url=None, model_name=None, temperature=0.7, max_tokens=2048, llm_type="ollama"):
-        """初始化LLM Web搜索客户端"""
+    def __init__(self, llm_api_url=None, search_api_url=None, model_name=None, temperature=0.7, max_tokens=2048, llm_type="ollama",
+                 answer_cache=None, keep_alive=None, llm_queue=None, priority="interactive", cancelled=None):
+        """
+        初始化LLM Web搜索客户端（answer_cache 为可选的 AnswerCache，多个客户端可以共享同一个缓存；
+        keep_alive 为 Ollama 在请求后保持模型驻留的时间，默认取 OLLAMA_KEEP_ALIVE 环境变量；
+        llm_queue 为可选的 LLMQueue，调用模型前按 priority 排队，cancelled() 返回 True 时放弃排队，
+        队列拒绝时抛出 QueueRejected）
+        """
         # 默认API URL
         self.llm_api_url = llm_api_url or os.environ.get("LLM_API_URL", "http://localhost:5000/api/llm")
         self.search_api_url = search_api_url or os.environ.get("SEARCH_API_URL", "http://localhost:5005/search")
@@ -26,6 +84,11 @@ class LLMWebSearchClient:
         self.llm_type = llm_type  # 可以是 "api" 或 "ollama"
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.answer_cache = answer_cache
+        self.llm_queue = llm_queue
+        self.priority = priority
+        self.cancelled = cancelled
+        self.keep_alive = parse_keep_alive(keep_alive if keep_alive is not None else os.environ.get("OLLAMA_KEEP_ALIVE", "30m"))
         
         # 如果没有指定模型，自动检测并选择合适的模型
         if model_name is None:
@@ -42,7 +105,7 @@ class LLMWebSearchClient:
         
         try:
             # 获取Ollama可用模型列表
-            response = requests.get(f"{self.ollama_api_url}/api/tags")
+            response = backend_session("ollama").get(f"{self.ollama_api_url}/api/tags", timeout=10)
             if response.status_code != 200:
                 print("无法获取Ollama模型列表，使用默认模型")
                 return "deepseek-r1:1.5b"
@@ -101,7 +164,7 @@ class LLMWebSearchClient:
             
             print(f"发送搜索请求到: {self.search_api_url}")
             # 发送搜索请求
-            response = requests.post(
+            response = backend_session("search").post(
                 self.search_api_url,
                 json=search_request,
                 headers={"Content-Type": "application/json"},
@@ -137,57 +200,128 @@ class LLMWebSearchClient:
             print(error_msg)
             return {"search_results": [], "error": error_msg}
     
-    def query_llm(self, prompt, model=None, temperature=None, max_tokens=None):
-        """直接查询LLM并返回响应"""
-        try:
-            # 使用提供的参数或默认参数
-            model = model or self.model_name
-            temperature = temperature if temperature is not None else self.temperature
-            max_tokens = max_tokens if max_tokens is not None else self.max_tokens
-            
-            # 根据LLM类型选择不同的查询方法
-            if self.llm_type == "ollama":
-                # Ollama API调用
-                try:
-                    response = requests.post(
-                        f"{self.ollama_api_url}/api/generate",
-                        json={
-                            "model": model,
-                            "prompt": prompt,
-                            "stream": False,
-                            "options": {
-                                "temperature": temperature,
-                                "num_predict": max_tokens
-                            }
-                        },
-                        timeout=60
-                    )
-                    response.raise_for_status()  # 如果状态码不是200，会抛出异常
-                    return response.json().get("response", "无法获取LLM回答")
-                except requests.exceptions.RequestException as e:
-                    if "404" in str(e):
-                        return "抱歉，无法连接到Ollama服务。请确保Ollama已安装并运行在端口11434上。\n\n错误详情: 404 Not Found - Ollama服务未找到。"
-                    else:
-                        return f"抱歉，连接到Ollama服务时出错: {str(e)}"
-            else:  # 默认使用API
-                response = requests.post(
-                    self.llm_api_url,
-                    json={
-                        "model": model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": temperature,
-                        "max_tokens": max_tokens
-                    },
-                    timeout=60
-                )
-                response.raise_for_status()
-                return response.json().get("choices", [{}])[0].get("message", {}).get("content", "无法获取LLM回答")
-        except Exception as e:
-            return f"查询LLM时出错: {str(e)}"
+    def query_llm(self, prompt, model=None, temperature=None, max_tokens=None, use_cache=True):
+        """直接查询LLM并返回响应（配置了回答缓存时，相同的请求直接返回缓存的回答；同时进行的相同请求只调用一次模型）"""
+        return self.try_query_llm(prompt, model, temperature, max_tokens, use_cache)[0]
+    
+    def try_query_llm(self, prompt, model=None, temperature=None, max_tokens=None, use_cache=True):
+        """查询LLM，返回 (回答, 是否为模型成功返回的回答)；出错时回答为错误信息，调用方可据此区分回答和错误"""
+        # 使用提供的参数或默认参数
+        model = model or self.model_name
+        temperature = temperature if temperature is not None else self.temperature
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        request_key = AnswerCache.make_key(
+            "llm", llm_type=self.llm_type, model=model, prompt=prompt,
+            temperature=float(temperature), max_tokens=max_tokens
+        )
+        
+        # 查找回答缓存
+        cacheable = use_cache and self.answer_cache is not None and self.answer_cache.should_cache(temperature)
+        if cacheable:
+            cached = self.answer_cache.get(request_key)
+            if cached is not None:
+                return cached, True
+        
+        def call():
+            answer, answered = self._call_llm(prompt, model, temperature, max_tokens)
+            # 只缓存模型成功返回的回答
+            if answered and cacheable:
+                self.answer_cache.put(request_key, answer)
+            return answer, answered
+        
+        if not use_cache:
+            return call()
+        # 相同的请求正在进行时等待并共享它的回答；排队中被取消的只是发起者自己，其余请求重新调用
+        backend = self.ollama_api_url if self.llm_type == "ollama" else self.llm_api_url
+        return _llm_flights.do((backend, request_key), call, retry_on=(JobCancelled,))[0]
+    
+    def _call_llm(self, prompt, model, temperature, max_tokens):
+        """经准入队列（如果有）调用LLM，返回 (回答, 是否为模型成功返回的回答)"""
+        # 配置了准入队列时先排队，QueueRejected 交给调用方处理
+        admission = self.llm_queue.slot(self.priority, self.cancelled) if self.llm_queue is not None else nullcontext()
+        with admission:
+            try:
+                answer = self._generate(prompt, model, temperature, max_tokens)
+            except requests.exceptions.RequestException as e:
+                if self.llm_type != "ollama":
+                    return f"查询LLM时出错: {str(e)}", False
+                if "404" in str(e):
+                    return "抱歉，无法连接到Ollama服务。请确保Ollama已安装并运行在端口11434上。\n\n错误详情: 404 Not Found - Ollama服务未找到。", False
+                return f"抱歉，连接到Ollama服务时出错: {str(e)}", False
+            except Exception as e:
+                return f"查询LLM时出错: {str(e)}", False
+        
+        if answer is None:
+            return "无法获取LLM回答", False
+        return answer, True
     
-    def answer_with_web_search(self, query, num_results=5, fetch_content=True, search_engine="google"):
-        """使用网络搜索增强LLM回答"""
+    def _generate(self, prompt, model, temperature, max_tokens):
+        """调用LLM生成回答，响应中没有回答时返回 None，请求失败时抛出异常"""
+        # 根据LLM类型选择不同的查询方法
+        if self.llm_type == "ollama":
+            # Ollama API调用
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {
+                    "temperature": temperature,
+                    "num_predict": max_tokens
+                }
+            }
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
+            response = backend_session("ollama").post(
+                f"{self.ollama_api_url}/api/generate",
+                json=payload,
+                timeout=60
+            )
+            response.raise_for_status()  # 如果状态码不是200，会抛出异常
+            data = response.json()
+            self._record_load(model, data)
+            return data.get("response")
+        else:  # 默认使用API
+            response = backend_session("api").post(
+                self.llm_api_url,
+                json={
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                },
+                timeout=60
+            )
+            response.raise_for_status()
+            return response.json().get("choices", [{}])[0].get("message", {}).get("content")
+    
+    @staticmethod
+    def _record_load(model, data):
+        """根据 Ollama 返回的 load_duration（纳秒）记录模型加载耗时，并统计重新加载的次数"""
+        load_duration = data.get("load_duration")
+        if not isinstance(load_duration, (int, float)):
+            return
+        seconds = load_duration / 1e9
+        LLM_LOAD_LATENCY.observe(seconds, model=model)
+        if seconds >= RELOAD_THRESHOLD_SECONDS:
+            LLM_MODEL_RELOADS.inc(model=model)
+            print(f"Ollama 重新加载了模型 {model}，耗时 {seconds:.2f}秒")
+    
+    def answer_with_web_search(self, query, num_results=5, fetch_content=True, search_engine="google", use_cache=True):
+        """使用网络搜索增强LLM回答（命中回答缓存时连搜索也跳过）"""
         try:
+            # 相同的问题和搜索参数在缓存有效期内直接返回之前的回答和搜索结果
+            cache_key = None
+            if use_cache and self.answer_cache is not None and self.answer_cache.should_cache(self.temperature):
+                cache_key = self.answer_cache.make_key(
+                    "web_answer", llm_type=self.llm_type, model=self.model_name, query=query.casefold(),
+                    num_results=num_results, fetch_content=fetch_content, search_engine=search_engine,
+                    temperature=float(self.temperature), max_tokens=self.max_tokens
+                )
+                cached = self.answer_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
             # 执行网络搜索
             search_result = self.search_web(query, num_results, fetch_content, search_engine)
             
@@ -225,13 +359,18 @@ class LLMWebSearchClient:
 请提供详细、准确的回答，并确保引用相关信息的来源。如果搜索结果中没有足够的信息来回答问题，请说明这一点。"""
             
             # 查询LLM
-            answer = self.query_llm(prompt)
+            answer, answered = self.try_query_llm(prompt, use_cache=use_cache)
             
             # 返回答案和搜索结果
-            return {
+            result = {
                 "answer": answer,
                 "search_results": search_result["search_results"]
             }
+            if answered and cache_key is not None:
+                self.answer_cache.put(cache_key, result)
+            return result
+        except QueueRejected:
+            raise
         except Exception as e:
             error_message = str(e)
             print(f"使用网络搜索回答时出错: {error_message}")
@@ -255,17 +394,28 @@ def main():
                         help='LLM API URL (仅在llm-type为api时使用)')
     parser.add_argument('--search-api-url', type=str, default='http://localhost:5005/search',
                         help='搜索API URL')
-    parser.add_argument('--search-engine', type=str, default='google', choices=['google', 'bing', 'baidu'],
-                        help='搜索引擎: google, bing, baidu')
+    parser.add_argument('--search-engine', type=str, default='google', choices=['google', 'bing', 'baidu', 'local'],
+                        help='搜索引擎: google, bing, baidu, local')
     parser.add_argument('--temperature', type=float, default=0.7,
                         help='生成文本的温度，控制随机性，值越高结果越多样')
     parser.add_argument('--max-tokens', type=int, default=2048,
                         help='生成的最大token数量')
     parser.add_argument('--interactive', action='store_true',
                         help='启用交互模式，可以连续提问')
+    parser.add_argument('--answer-cache', type=str, default=os.environ.get('ANSWER_CACHE_PATH', ''),
+                        help='回答缓存的 SQLite 文件，不指定则只缓存在内存中')
+    parser.add_argument('--no-answer-cache', action='store_true',
+                        help='禁用回答缓存，每次都查询LLM')
+    parser.add_argument('--keep-alive', type=str, default=None,
+                        help='Ollama 在请求后保持模型驻留的时间，如 30m、24h、-1（一直驻留）、0（立即卸载），默认取 OLLAMA_KEEP_ALIVE 或 30m')
     
     args = parser.parse_args()
     
+    # 回答缓存：重复的问题直接返回之前的回答
+    answer_cache = None
+    if not args.no_answer_cache:
+        answer_cache = AnswerCache(path=args.answer_cache or None)
+    
     # 初始化客户端
     client = LLMWebSearchClient(
         search_api_url=args.search_api_url,
@@ -273,7 +423,9 @@ def main():
         llm_type=args.llm_type,
         model_name=args.model_name,
         temperature=args.temperature,
-        max_tokens=args.max_tokens
+        max_tokens=args.max_tokens,
+        answer_cache=answer_cache,
+        keep_alive=args.keep_alive
     )
     
     def process_query(query):
@@ -0,0 +1,194 @@
+"""
+LLM 后端前的准入队列。
+Admission queue in front of the LLM backend.
+
+本地 Ollama 或 CPU 模型同时只能跑少量生成。超过并发上限的请求按优先级（interactive 先于 batch）排队，
+队列已满时立即拒绝（/llm 返回 429），而不是让所有人一起等到超时；客户端断开的排队请求会被取消。
+A local Ollama or CPU model can only run a few generations at once. Jobs beyond the concurrency
+limit wait in priority order (interactive before batch); when the queue is full they are rejected
+immediately (/llm answers 429) instead of everyone timing out together, and queued jobs whose
+client has disconnected are cancelled.
+"""
+
+import heapq
+import itertools
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_REJECTED, LLM_QUEUE_WAIT
+
+
+class QueueRejected(Exception):
+    """任务没有获得执行机会。 | The job was not admitted."""
+
+    reason = "rejected"
+
+
+class QueueFull(QueueRejected):
+    """队列已满。 | The queue is full."""
+
+    reason = "full"
+
+
+class QueueTimeout(QueueRejected):
+    """排队时间超过上限。 | The job waited longer than allowed."""
+
+    reason = "timeout"
+
+
+class JobCancelled(QueueRejected):
+    """客户端已断开，任务被取消。 | The client went away and the job was cancelled."""
+
+    reason = "cancelled"
+
+
+def connection_closed(environ: Mapping[str, Any]) -> bool:
+    """
+    检查 WSGI 请求的客户端连接是否已关闭（支持 Werkzeug 开发服务器和 gunicorn 暴露的套接字）。
+    Whether the client of a WSGI request has closed its connection (works with the sockets the
+    Werkzeug dev server and gunicorn expose in environ).
+
+    无法取得套接字时返回 False。 | Returns False when no socket is available.
+    """
+    sock = environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+    if sock is None:
+        return False
+    # Windows 没有 MSG_DONTWAIT，改为临时把套接字设为非阻塞 | Windows lacks MSG_DONTWAIT, so make the socket non-blocking for the peek
+    flags = socket.MSG_PEEK | getattr(socket, "MSG_DONTWAIT", 0)
+    try:
+        previous_timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            # 对端关闭时非阻塞窥探读到 b"" | A non-blocking peek reads b"" once the peer has closed
+            return sock.recv(1, flags) == b""
+        finally:
+            sock.settimeout(previous_timeout)
+    except (BlockingIOError, socket.timeout):
+        return False
+    except OSError:
+        return True
+
+
+class LLMQueue:
+    """
+    带优先级和有界深度的 LLM 准入队列。
+    Bounded priority admission queue for LLM generations.
+
+    同一优先级内先到先服务；较低优先级的任务只有在没有更高优先级任务等待时才会开始。
+    First come, first served within a priority class; a lower class only starts when no higher-class
+    job is waiting.
+    """
+
+    PRIORITIES = {"interactive": 0, "batch": 1}
+
+    def __init__(self, max_concurrency: int = 2, max_depth: int = 16, max_wait: Optional[float] = 30,
+                 poll_interval: float = 0.25):
+        """
+        参数 | Args:
+            max_concurrency: 同时运行的生成数 | Generations allowed to run at once
+            max_depth: 最多排队的任务数，超过时立即拒绝 | Jobs allowed to wait; beyond this jobs are rejected at once
+            max_wait: 最长排队秒数，None 表示不限 | Longest a job may wait in seconds, None for no limit
+            poll_interval: 排队时检查客户端是否断开的间隔（秒） | Seconds between client-disconnect checks while waiting
+        """
+        self.max_concurrency = max_concurrency
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._waiting: List[Tuple[int, int]] = []
+        self._depth: Dict[str, int] = {name: 0 for name in self.PRIORITIES}
+        self._running = 0
+        self._seq = itertools.count()
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", cancelled: Optional[Callable[[], bool]] = None):
+        """
+        排队直到获得执行名额，退出时释放名额。
+        Wait for a slot and release it on exit.
+
+        参数 | Args:
+            priority: "interactive" 或 "batch" | "interactive" or "batch"
+            cancelled: 返回 True 表示客户端已离开、应放弃排队 | Returns True once the client is gone and the job should be dropped
+
+        抛出 | Raises:
+            QueueFull / QueueTimeout / JobCancelled
+        """
+        self._acquire(priority, cancelled)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, priority: str, cancelled: Optional[Callable[[], bool]]):
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"不支持的优先级: {priority}")
+        start = time.monotonic()
+        with self._cond:
+            if self._running < self.max_concurrency and not self._waiting:
+                self._running += 1
+                LLM_IN_FLIGHT.set(self._running)
+                LLM_QUEUE_WAIT.observe(0.0, priority=priority)
+                return
+            if len(self._waiting) >= self.max_depth:
+                LLM_QUEUE_REJECTED.inc(priority=priority, reason=QueueFull.reason)
+                raise QueueFull(f"LLM 请求队列已满（{self.max_depth} 个请求在排队）")
+
+            ticket = (self.PRIORITIES[priority], next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            self._set_depth(priority, 1)
+            try:
+                while not (self._waiting[0] == ticket and self._running < self.max_concurrency):
+                    waited = time.monotonic() - start
+                    if self.max_wait is not None and waited >= self.max_wait:
+                        raise QueueTimeout(f"LLM 请求排队超过 {self.max_wait} 秒")
+                    if cancelled is not None and cancelled():
+                        raise JobCancelled("客户端已断开，取消排队中的 LLM 请求")
+                    timeout = self.poll_interval
+                    if self.max_wait is not None:
+                        timeout = min(timeout, self.max_wait - waited)
+                    self._cond.wait(timeout)
+            except BaseException as e:
+                # 任何异常（包括 cancelled() 自身出错）都要撤下这张票，否则后面的任务会一直排在它后面
+                # Any exception, including one raised by cancelled() itself, must withdraw the ticket,
+                # or every later job would wait behind it forever
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._set_depth(priority, -1)
+                if isinstance(e, QueueRejected):
+                    LLM_QUEUE_REJECTED.inc(priority=priority, reason=e.reason)
+                # 排在后面的任务可能因此可以开始 | Jobs behind this one may now be able to start
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._waiting)
+            self._set_depth(priority, -1)
+            self._running += 1
+            LLM_IN_FLIGHT.set(self._running)
+            # 下一个排队的任务可能也有空余名额 | The next waiter may have a free slot too
+            self._cond.notify_all()
+        LLM_QUEUE_WAIT.observe(time.monotonic() - start, priority=priority)
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            LLM_IN_FLIGHT.set(self._running)
+            self._cond.notify_all()
+
+    def _set_depth(self, priority: str, delta: int):
+        # 调用方需持有锁 | Caller holds the lock
+        self._depth[priority] += delta
+        LLM_QUEUE_DEPTH.set(self._depth[priority], priority=priority)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前运行和排队的任务数。 | Jobs currently running and waiting."""
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": dict(self._depth),
+                "max_concurrency": self.max_concurrency,
+                "max_depth": self.max_depth
+            }
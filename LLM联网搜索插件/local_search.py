@@ -0,0 +1,220 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional
+
+# 中日韩统一表意文字范围 | CJK unified ideograph ranges
+_CJK_RANGES = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_RUN = re.compile('[' + _CJK_RANGES + ']+')
+_TERM = re.compile('[' + _CJK_RANGES + r']+|[^\W_]+')
+
+
+def _cjk_bigrams(run: str) -> List[str]:
+    """把一段连续的中文切分为重叠的二元组。 | Split a run of CJK characters into overlapping bigrams."""
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def segment_text(text: str) -> str:
+    """
+    为 FTS5 的 unicode61 分词器预处理文本：中文按二元组切分，其他文字保持不变。
+    Prepare text for FTS5's unicode61 tokenizer: CJK runs become overlapping bigrams,
+    everything else is left as is.
+    """
+    if not text:
+        return ""
+    return _CJK_RUN.sub(lambda m: ' ' + ' '.join(_cjk_bigrams(m.group(0))) + ' ', text)
+
+
+def query_terms(query: str) -> List[str]:
+    """提取查询词（中文为二元组），去重并保持顺序。 | Extract de-duplicated query terms (CJK as bigrams)."""
+    terms = []
+    for token in _TERM.findall(query.lower()):
+        parts = _cjk_bigrams(token) if _CJK_RUN.fullmatch(token) else [token]
+        for part in parts:
+            if part not in terms:
+                terms.append(part)
+    return terms
+
+
+class LocalSearchIndex:
+    """
+    基于 SQLite FTS5 的本地全文索引，用 BM25 排序。
+    Local full-text index backed by SQLite FTS5 and ranked with BM25.
+
+    用于 "local" 搜索引擎：内容来自 fetch_content 抓取过的网页，或通过 add_documents 批量导入。
+    Backs the "local" search engine. Documents come from pages fetched by fetch_content or
+    from bulk loading through add_documents.
+    """
+
+    # BM25 列权重：标题比正文更重要 | BM25 column weights: title matters more than body
+    TITLE_WEIGHT = 5.0
+    CONTENT_WEIGHT = 1.0
+
+    def __init__(self, db_path: str = "local_search_index.db", snippet_length: int = 160):
+        """
+        参数 | Args:
+            db_path: SQLite 数据库文件路径 | Path of the SQLite database file
+            snippet_length: 生成摘要的最大字符数 | Maximum snippet length in characters
+        """
+        self.db_path = db_path
+        self.snippet_length = snippet_length
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT,
+                content TEXT,
+                fetched_at REAL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, content, tokenize='unicode61'
+            );
+        """)
+        self._conn.commit()
+
+    def _upsert(self, url: str, title: str, content: str, fetched_at: float):
+        """插入或更新一个文档（调用方需持有锁并负责提交）。 | Insert or replace one document (caller holds the lock and commits)."""
+        row = self._conn.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+        if row:
+            doc_id = row[0]
+            self._conn.execute(
+                "UPDATE documents SET title = ?, content = ?, fetched_at = ? WHERE id = ?",
+                (title, content, fetched_at, doc_id)
+            )
+            self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+        else:
+            cursor = self._conn.execute(
+                "INSERT INTO documents (url, title, content, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, title, content, fetched_at)
+            )
+            doc_id = cursor.lastrowid
+        self._conn.execute(
+            "INSERT INTO documents_fts (rowid, title, content) VALUES (?, ?, ?)",
+            (doc_id, segment_text(title), segment_text(content))
+        )
+
+    def add_document(self, url: str, title: str, content: str, fetched_at: Optional[float] = None):
+        """
+        添加或更新单个文档。
+        Add or replace a single document.
+        """
+        self.add_documents([{"url": url, "title": title, "content": content, "fetched_at": fetched_at}])
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        在一个事务中批量添加或更新文档。
+        Bulk-load documents in a single transaction.
+
+        参数 | Args:
+            documents: 包含 url、title、content，可选 fetched_at（Unix 时间戳）的字典 |
+                       Dicts with url, title, content and optional fetched_at (Unix timestamp)
+
+        返回 | Returns:
+            写入的文档数量 | Number of documents written
+        """
+        count = 0
+        with self._lock:
+            try:
+                for doc in documents:
+                    url = doc.get("url")
+                    content = doc.get("content") or ""
+                    if not url or not content:
+                        continue
+                    title = doc.get("title") or url
+                    fetched_at = doc.get("fetched_at") or time.time()
+                    self._upsert(url, title, content, fetched_at)
+                    count += 1
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return count
+
+    def index_page(self, url: str, title: Optional[str], text: str):
+        """
+        索引一个由 fetch_content 抓取的网页。
+        Index a page extracted by fetch_content.
+        """
+        if text:
+            self.add_document(url, title or url, text)
+
+    def remove_document(self, url: str) -> bool:
+        """删除一个文档。 | Remove a document by URL."""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+            if not row:
+                return False
+            self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+            self._conn.commit()
+            return True
+
+    def count(self) -> int:
+        """返回索引中的文档数量。 | Number of indexed documents."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
+        """
+        在本地索引中搜索，返回与其他搜索引擎相同格式的结果。
+        Search the local index; results use the same {title, link, snippet} format as the web engines.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        # 每个词作为带引号的短语，避免 FTS5 语法字符；任一词命中即可，由 BM25 排序
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT d.url, d.title, d.content
+                FROM documents_fts
+                JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY bm25(documents_fts, ?, ?)
+                LIMIT ?
+                """,
+                (match, self.TITLE_WEIGHT, self.CONTENT_WEIGHT, num_results)
+            ).fetchall()
+
+        return [
+            {
+                "title": title,
+                "link": url,
+                "snippet": self._make_snippet(content, terms)
+            }
+            for url, title, content in rows
+        ]
+
+    def _make_snippet(self, content: str, terms: List[str]) -> str:
+        """截取第一个命中词附近的原文作为摘要。 | Cut the original text around the first matching term."""
+        if not content:
+            return ""
+        lowered = content.lower()
+        positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+        start = max(0, min(positions) - self.snippet_length // 4) if positions else 0
+        snippet = content[start:start + self.snippet_length].strip()
+        if start > 0:
+            snippet = "..." + snippet
+        if start + self.snippet_length < len(content):
+            snippet += "..."
+        return snippet
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
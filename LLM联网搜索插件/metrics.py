@@ -0,0 +1,351 @@
+"""
+进程内指标注册表，以 Prometheus 文本格式导出。
+In-process metrics registry with Prometheus text exposition.
+
+用法 | Usage:
+    from metrics import time_stage, BYTES_DOWNLOADED
+
+    with time_stage("serp_fetch", "google"):
+        response = requests.get(url)
+    BYTES_DOWNLOADED.inc(len(response.content), kind="serp")
+
+    text = registry.render()  # 由 /metrics 端点返回 | served by the /metrics endpoint
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from request_timing import record_timing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra.items())
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签值保存样本。 | Base class keeping one sample per label-value tuple."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器。 | Monotonically increasing counter."""
+
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的测量值。 | Value that can go up and down."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图。 | Cumulative bucketed histogram."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 每组标签: [各桶计数..., 总和, 样本数] | per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表。
+    Registry that owns metrics and renders them in Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同类型或标签注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式导出所有指标。 | Render every metric in Prometheus text format."""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表及常用指标 | Global registry and the metrics shared across modules
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.histogram(
+    "search_stage_duration_seconds",
+    "Latency of each /search pipeline stage (serp_fetch, serp_parse, resolve_redirects, page_fetch, page_parse, clean_text, summarize, condense, format, serialize, compress).",
+    ["stage", "engine"]
+)
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds",
+    "End-to-end latency of HTTP requests per endpoint.",
+    ["endpoint"]
+)
+IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight",
+    "Number of HTTP requests currently being served per endpoint.",
+    ["endpoint"]
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss).",
+    ["cache", "result"]
+)
+CACHE_HIT_RATIO = registry.gauge(
+    "cache_hit_ratio",
+    "Fraction of cache lookups that were hits since startup.",
+    ["cache"]
+)
+SEARCH_RETRIES = registry.counter(
+    "search_retries_total",
+    "Retried SERP requests per engine.",
+    ["engine"]
+)
+MOCK_FALLBACKS = registry.counter(
+    "search_mock_fallbacks_total",
+    "Searches answered with placeholder results because the engine failed.",
+    ["engine"]
+)
+BREAKER_SHORT_CIRCUITS = registry.counter(
+    "search_circuit_breaker_short_circuits_total",
+    "Searches skipped because the engine's circuit breaker was open.",
+    ["engine"]
+)
+BYTES_DOWNLOADED = registry.counter(
+    "http_downloaded_bytes_total",
+    "Bytes downloaded from remote sites (kind is serp or page).",
+    ["kind"]
+)
+RESPONSE_BYTES = registry.counter(
+    "http_response_bytes_total",
+    "Bytes of JSON response bodies sent, after compression (encoding is identity, gzip or br).",
+    ["encoding"]
+)
+DUPLICATES_DROPPED = registry.counter(
+    "search_duplicates_dropped_total",
+    "Near-duplicate search results dropped (stage is url, snippet or content).",
+    ["stage"]
+)
+COALESCED_REQUESTS = registry.counter(
+    "singleflight_requests_total",
+    "Calls to coalesced operations (group is search, page_fetch or llm; role is leader, which ran it, or follower, which shared the leader's result).",
+    ["group", "role"]
+)
+LLM_LOAD_LATENCY = registry.histogram(
+    "llm_model_load_duration_seconds",
+    "Model load time reported by Ollama (load_duration) for each generate call.",
+    ["model"]
+)
+LLM_MODEL_RELOADS = registry.counter(
+    "llm_model_reloads_total",
+    "Ollama generate calls that had to load the model into memory first.",
+    ["model"]
+)
+LLM_QUEUE_WAIT = registry.histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM jobs spent in the admission queue before running (priority is interactive or batch).",
+    ["priority"]
+)
+LLM_QUEUE_DEPTH = registry.gauge(
+    "llm_queue_depth",
+    "LLM jobs currently waiting in the admission queue.",
+    ["priority"]
+)
+LLM_IN_FLIGHT = registry.gauge(
+    "llm_in_flight",
+    "LLM generations currently running."
+)
+LLM_QUEUE_REJECTED = registry.counter(
+    "llm_queue_rejected_total",
+    "LLM jobs that never ran (reason is full, timeout or cancelled).",
+    ["priority", "reason"]
+)
+CLOCK_OFFSET = registry.gauge(
+    "clock_offset_seconds",
+    "Time sources' clock minus the local clock, as last measured from their HTTP Date headers."
+)
+
+
+def observe_stage(stage: str, engine: str, seconds: float, url: Optional[str] = None):
+    """
+    记录一个阶段的耗时，同时计入当前请求的耗时明细。
+    Record the duration of one pipeline stage, also feeding the current request's timings.
+    """
+    STAGE_LATENCY.observe(seconds, stage=stage, engine=engine or "")
+    record_timing(stage, seconds, url=url)
+
+
+@contextmanager
+def time_stage(stage: str, engine: str = "", url: Optional[str] = None):
+    """
+    计时上下文管理器，退出时记录阶段耗时（包括异常退出）。
+    Context manager that records the stage duration on exit, including on exceptions.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, engine, time.perf_counter() - start, url=url)
+
+
+def timed_iter(iterable: Iterable, stage: str, engine: str = "", url: Optional[str] = None) -> Iterator:
+    """
+    转发迭代器的元素，只把迭代器自身花费的时间（不含调用方处理每个元素的时间）记为阶段耗时。
+    Re-yield items and record only the time spent inside the iterator, not the caller's time per item.
+    """
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe_stage(stage, engine, elapsed, url=url)
+
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存查找并更新命中率。 | Record a cache lookup and refresh its hit ratio."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+    misses = CACHE_REQUESTS.get(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from llm_client_example import RELOAD_THRESHOLD_SECONDS, backend_session, parse_keep_alive
+
+logger = logging.getLogger(__name__)
+
+
+def parse_active_hours(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    解析 "8-22" 形式的驻留时段（本地时间，含起点不含终点，可跨午夜如 "22-6"）；空值表示全天。
+    Parse an "8-22" residency window in local hours (start inclusive, end exclusive, may wrap past
+    midnight like "22-6"); empty means all day.
+    """
+    if not value or not value.strip():
+        return None
+    start, _, end = value.strip().partition("-")
+    hours = (int(start), int(end))
+    if not all(0 <= hour <= 24 for hour in hours):
+        raise ValueError(f"无效的驻留时段: {value}")
+    return hours
+
+
+class ModelWarmer:
+    """
+    Ollama 模型预热与驻留管理：启动时预加载模型，之后在驻留时段内定期重新预热，并从 /api/ps 读取驻留状态。
+    Warmup and residency manager for the Ollama backend: preloads the model at startup, re-warms it
+    periodically during the residency window and reads residency from /api/ps.
+
+    预热请求不带提示词，Ollama 只加载模型而不生成内容；模型已在内存中时只会刷新 keep_alive，开销只有几毫秒。
+    Warmup requests carry no prompt, so Ollama only loads the model and generates nothing; when the
+    model is already loaded the request just renews keep_alive and costs a few milliseconds.
+    """
+
+    def __init__(self, ollama_url: str, model: str, keep_alive: Any = "30m", refresh_interval: float = 300,
+                 active_hours: Optional[Tuple[int, int]] = None, timeout: float = 120):
+        """
+        参数 | Args:
+            ollama_url: Ollama 服务地址 | Ollama base URL
+            model: 需要保持驻留的模型 | Model to keep resident
+            keep_alive: 每次预热后模型的驻留时间，应长于 refresh_interval | Residency granted by each warmup; should exceed refresh_interval
+            refresh_interval: 后台检查间隔（秒） | Seconds between background checks
+            active_hours: 保持驻留的本地时段，None 表示全天；时段外不再预热，模型按 keep_alive 自然卸载 |
+                          Local hours during which the model is kept resident, None for all day; outside
+                          them the warmer stops and the model unloads once keep_alive runs out
+            timeout: 加载模型的超时（秒） | Timeout for loading the model in seconds
+        """
+        self.ollama_url = ollama_url.rstrip("/")
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.refresh_interval = refresh_interval
+        self.active_hours = active_hours
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._model = model
+        self._resident = False
+        self._expires_at: Optional[str] = None
+        self._last_warmed_at: Optional[float] = None
+        self._last_load_seconds: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def model(self) -> str:
+        with self._lock:
+            return self._model
+
+    def set_model(self, model: str):
+        """切换需要驻留的模型，并立即在后台预热。 | Switch the resident model and warm it in the background right away."""
+        with self._lock:
+            if model == self._model:
+                return
+            self._model = model
+            self._resident = False
+            self._expires_at = None
+        logger.info(f"切换驻留模型为 {model}，开始预热")
+        self._wake.set()
+
+    def in_active_hours(self, now: Optional[datetime] = None) -> bool:
+        """当前是否处于驻留时段。 | Whether the current local time falls in the residency window."""
+        if self.active_hours is None:
+            return True
+        hour = (now or datetime.now()).hour
+        start, end = self.active_hours
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def _loaded_models(self) -> Dict[str, Dict[str, Any]]:
+        response = backend_session("ollama").get(f"{self.ollama_url}/api/ps", timeout=10)
+        response.raise_for_status()
+        return {entry.get("name") or entry.get("model"): entry for entry in response.json().get("models", [])}
+
+    @staticmethod
+    def _find(loaded: Dict[str, Dict[str, Any]], model: str) -> Optional[Dict[str, Any]]:
+        # 未写标签的模型名在 Ollama 中是 :latest | Untagged model names are ":latest" in Ollama
+        return loaded.get(model) or (loaded.get(f"{model}:latest") if ":" not in model else None)
+
+    def warm(self, model: Optional[str] = None) -> float:
+        """
+        加载模型并返回 Ollama 报告的加载耗时（秒），失败时抛出 requests 异常。
+        Load the model and return the load time Ollama reports in seconds; raises requests errors on failure.
+        """
+        model = model or self.model
+        payload: Dict[str, Any] = {"model": model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        response = backend_session("ollama").post(f"{self.ollama_url}/api/generate", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return (response.json().get("load_duration") or 0) / 1e9
+
+    def check(self):
+        """
+        在驻留时段内预热一次模型（刷新 keep_alive），然后读取驻留状态。
+        Warm the model once if inside the residency window (renewing keep_alive), then read residency.
+        """
+        model = self.model
+        try:
+            if self.in_active_hours():
+                seconds = self.warm(model)
+                if seconds >= RELOAD_THRESHOLD_SECONDS:
+                    logger.info(f"预热模型 {model} 完成，加载耗时 {seconds:.2f}秒")
+                with self._lock:
+                    self._last_warmed_at = time.time()
+                    self._last_load_seconds = seconds
+            entry = self._find(self._loaded_models(), model)
+            error = None
+        except Exception as e:
+            entry = None
+            error = str(e)
+            if error != self._last_error:
+                logger.warning(f"检查或预热模型 {model} 失败: {error}")
+
+        with self._lock:
+            if model != self._model:
+                return
+            self._resident = entry is not None
+            self._expires_at = entry.get("expires_at") if entry else None
+            self._last_error = error
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.clear()
+            self.check()
+            self._wake.wait(self.refresh_interval)
+
+    def start(self):
+        """启动后台线程，立即预热一次。 | Start the background thread, warming once immediately."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def status(self) -> Dict[str, Any]:
+        """返回驻留状态，用于 /health。 | Residency status for /health."""
+        with self._lock:
+            return {
+                "model": self._model,
+                "resident": self._resident,
+                "expires_at": self._expires_at,
+                "keep_alive": self.keep_alive,
+                "refresh_interval": self.refresh_interval,
+                "active_hours": "-".join(map(str, self.active_hours)) if self.active_hours else None,
+                "last_warmed_at": datetime.fromtimestamp(self._last_warmed_at).isoformat() if self._last_warmed_at else None,
+                "last_load_seconds": self._last_load_seconds,
+                "last_error": self._last_error
+            }
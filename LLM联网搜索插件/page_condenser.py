@@ -0,0 +1,158 @@
+"""
+超出上下文时的网页压缩（map-reduce）。
+Map-reduce condensation of fetched pages that do not fit the model's context.
+
+map：每个过长的网页切成若干段，每段由一次 LLM 调用提取与查询相关的要点，所有调用在有界线程池中并发进行；
+reduce：同一网页各段的要点按顺序合并，代替截断后的原文放进最终提示词。
+结果按 (URL, 正文哈希, 查询, 模型) 缓存，重复的请求不再调用模型。
+Map: every oversized page is split into chunks and each chunk is condensed to query-relevant notes
+by one LLM call, all running concurrently on a bounded pool. Reduce: each page's chunk notes are
+joined in order and go into the final prompt in place of the truncated page. Notes are cached by
+(url, content hash, query, model), so repeats cost nothing.
+"""
+
+import contextvars
+import hashlib
+import logging
+import re
+from concurrent.futures import Executor, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+import deadline
+from answer_cache import AnswerCache
+from metrics import time_stage
+from response_processor import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 推理模型（如 deepseek-r1）在回答前输出的思考过程 | Reasoning emitted before the answer by models such as deepseek-r1
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+CONDENSE_PROMPT = (
+    "Extract the information from the following web page excerpt that helps answer the question. "
+    "Write concise bullet-point notes that keep concrete facts, numbers, dates and names, and leave out "
+    "everything unrelated to the question. If nothing in the excerpt is relevant, reply with NONE.\n\n"
+    "Question: {query}\n"
+    "Source: {title} ({url})\n\n"
+    "Excerpt:\n{text}\n\n"
+    "Notes:"
+)
+
+# 网页与问题无关时的要点 | Notes for a page with nothing relevant to the question
+NO_RELEVANT_NOTES = "(no information relevant to the question)"
+
+
+def page_text(content: Any) -> str:
+    """取出抓取结果中的正文；抓取失败时返回空字符串。 | The text of a fetch result, or "" if the fetch failed."""
+    if isinstance(content, dict):
+        return "" if content.get("error") else (content.get("content") or "")
+    return ""
+
+
+class PageCondenser:
+    """
+    把超出上下文预算的网页压缩成与查询相关的要点。
+    Condenses pages that push the prompt past its context budget into query-relevant notes.
+    """
+
+    def __init__(self, generate: Callable[[str, str], Optional[str]], executor: Executor,
+                 cache: Optional[AnswerCache] = None, context_tokens: int = 4000,
+                 min_chars: int = 1500, chunk_chars: int = 6000, max_chunks: int = 4):
+        """
+        参数 | Args:
+            generate: generate(提示词, 模型) 调用 LLM 并返回回答，失败时返回 None |
+                      generate(prompt, model) calls the LLM and returns its answer, or None on failure
+            executor: 并发执行 LLM 调用的有界线程池 | Bounded pool the LLM calls run on
+            cache: 要点缓存 | Cache for page notes
+            context_tokens: 所有网页正文的 token 预算，未超出时不压缩 | Token budget for all page text; nothing is condensed below it
+            min_chars: 短于该字数的网页不压缩（原样放进提示词也不会被截断） |
+                       Pages shorter than this are left alone (they fit without truncation anyway)
+            chunk_chars: 每次 LLM 调用处理的最大字数 | Most characters sent in one LLM call
+            max_chunks: 每个网页最多处理的段数，超出部分丢弃 | Most chunks condensed per page; the rest is dropped
+        """
+        self.generate = generate
+        self.executor = executor
+        self.cache = cache
+        self.context_tokens = context_tokens
+        self.min_chars = min_chars
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+
+    def needs_condensing(self, detailed_content: Dict[str, Any]) -> bool:
+        """所有网页正文是否超出上下文预算。 | Whether the page text as a whole exceeds the context budget."""
+        return sum(estimate_tokens(page_text(content)) for content in detailed_content.values()) > self.context_tokens
+
+    def condense(self, query: str, detailed_content: Dict[str, Any], model: str,
+                 titles: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        压缩过长的网页，返回 {URL: 要点}；未超出预算、过短、失败或截止时间内没有完成的网页不在结果中。
+        Condense the oversized pages and return {url: notes}. Pages are left out when the budget is
+        not exceeded, when they are short, or when condensing fails or misses the deadline.
+
+        参数 | Args:
+            query: 用户查询 | The user's query
+            detailed_content: {URL: 抓取结果} | {url: fetch result}
+            model: 压缩使用的模型，也是缓存键的一部分 | Model that condenses the pages, also part of the cache key
+            titles: {URL: 标题}，用于提示词 | {url: title}, used in the prompt
+        """
+        if not self.needs_condensing(detailed_content):
+            return {}
+        titles = titles or {}
+
+        notes: Dict[str, str] = {}
+        pending: Dict[str, List[Future]] = {}
+        keys: Dict[str, str] = {}
+        for url, content in detailed_content.items():
+            text = page_text(content)
+            if len(text) < self.min_chars:
+                continue
+            key = AnswerCache.make_key(
+                "condense", url=url, content=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                query=query.casefold(), model=model
+            )
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                notes[url] = cached
+                continue
+            if deadline.expired():
+                continue
+            keys[url] = key
+            # map：每段一次 LLM 调用 | Map: one LLM call per chunk
+            chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)][:self.max_chunks]
+            pending[url] = [
+                self.executor.submit(contextvars.copy_context().run, self._condense_chunk,
+                                     query, titles.get(url, ""), url, chunk, model)
+                for chunk in chunks
+            ]
+
+        for url, futures in pending.items():
+            try:
+                parts = [future.result(timeout=deadline.remaining()) for future in futures]
+            except FutureTimeoutError:
+                for future in futures:
+                    future.cancel()
+                continue
+            if any(part is None for part in parts):
+                continue
+            # reduce：按顺序合并各段要点 | Reduce: join the chunk notes in order
+            relevant = [part for part in parts if part]
+            notes[url] = "\n".join(relevant) if relevant else NO_RELEVANT_NOTES
+            if self.cache is not None:
+                self.cache.put(keys[url], notes[url])
+        return notes
+
+    def _condense_chunk(self, query: str, title: str, url: str, text: str, model: str) -> Optional[str]:
+        """压缩一段正文；失败时返回 None，没有相关内容时返回空字符串。 | Condense one chunk: None on failure, "" if nothing is relevant."""
+        if deadline.expired():
+            return None
+        prompt = CONDENSE_PROMPT.format(query=query, title=title or url, url=url, text=text)
+        try:
+            with time_stage("condense", url=url):
+                answer = self.generate(prompt, model)
+        except Exception as e:
+            logger.debug(f"压缩网页失败 {url}: {e}")
+            return None
+        if answer is None:
+            return None
+        answer = _THINK_BLOCK.sub("", answer).strip()
+        return "" if answer.upper().startswith("NONE") else answer
@@ -0,0 +1,267 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd 是可选依赖，没有时退回 zlib | zstd is optional; fall back to zlib
+    zstandard = None
+
+# 记录格式 | Record layout:
+#   header = magic(2s) codec(B) url_len(I) payload_len(I) fetched_at(d)
+#   url (utf-8) + payload（压缩后的 JSON | compressed JSON）
+_MAGIC = b"PS"
+_HEADER = struct.Struct("<2sBIId")
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+_CODEC_NAMES = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# 存储的页面字段 | Page fields kept in the store
+PAGE_FIELDS = ("title", "author", "publish_date", "content")
+
+
+class PageStore:
+    """
+    追加写入的网页存储，保存 fetch_content 提取的正文和元数据。
+    Append-only store of pages extracted by fetch_content (text, title, author, publish date, fetch time).
+
+    每条记录的正文经 zstd（如已安装）或 zlib 压缩后追加到单个数据文件；内存中的 URL 索引在打开时
+    通过扫描记录头重建，只指向每个 URL 的最新版本。旧版本和过期记录由 compact() 清理。
+    Each record is compressed with zstd (when installed) or zlib and appended to a single data
+    file. The in-memory URL index is rebuilt on open by scanning record headers and points at the
+    newest version of each URL; superseded and expired records are dropped by compact().
+    """
+
+    # 因超出 max_bytes 压缩时保留的比例，避免每次写入都触发压缩 | Fraction of max_bytes kept when compacting, so appends don't compact every time
+    COMPACT_TARGET_RATIO = 0.8
+
+    def __init__(self, path: str = "page_store.dat", compression: str = "zstd",
+                 max_bytes: Optional[int] = None, max_age: Optional[float] = None,
+                 compression_level: int = 3):
+        """
+        参数 | Args:
+            path: 数据文件路径 | Path of the data file
+            compression: "zstd"、"zlib" 或 "none"，zstd 不可用时使用 zlib | "zstd", "zlib" or "none"; zstd falls back to zlib
+            max_bytes: 数据文件大小上限，超过后自动压缩并丢弃最旧的页面 | Size bound; exceeding it compacts and drops the oldest pages
+            max_age: 页面保留的最长秒数 | Seconds a page is retained
+            compression_level: 压缩级别 | Compression level
+        """
+        if compression not in _CODEC_NAMES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if compression == "zstd" and zstandard is None:
+            compression = "zlib"
+
+        self.path = path
+        self.compression = compression
+        self.codec = _CODEC_NAMES[compression]
+        self.compression_level = compression_level
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._lock = threading.RLock()
+        # url -> (偏移量, 记录长度, 抓取时间) | url -> (offset, record length, fetched_at)
+        self._index: Dict[str, Tuple[int, int, float]] = {}
+        self._size = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(path, "a+b")
+        self._rebuild_index()
+
+    # ----- 编解码 | encoding -----
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=self.compression_level).compress(data)
+        if self.codec == CODEC_ZLIB:
+            return zlib.compress(data, self.compression_level)
+        return data
+
+    @staticmethod
+    def _decompress(codec: int, data: bytes) -> bytes:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("该记录使用 zstd 压缩，但未安装 zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        return data
+
+    def _encode(self, url: str, page: Dict[str, Any], fetched_at: float) -> bytes:
+        url_bytes = url.encode("utf-8")
+        body = {field: page.get(field) for field in PAGE_FIELDS}
+        payload = self._compress(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        return _HEADER.pack(_MAGIC, self.codec, len(url_bytes), len(payload), fetched_at) + url_bytes + payload
+
+    # ----- 索引 | index -----
+
+    def _rebuild_index(self):
+        """扫描记录头重建 URL 索引，截掉末尾不完整的记录。 | Rebuild the URL index from record headers, truncating a torn tail."""
+        with self._lock:
+            self._index.clear()
+            self._file.seek(0, os.SEEK_END)
+            file_size = self._file.tell()
+            offset = 0
+            self._file.seek(0)
+            while offset + _HEADER.size <= file_size:
+                header = self._file.read(_HEADER.size)
+                magic, _codec, url_len, payload_len, fetched_at = _HEADER.unpack(header)
+                length = _HEADER.size + url_len + payload_len
+                if magic != _MAGIC or offset + length > file_size:
+                    break
+                url = self._file.read(url_len).decode("utf-8")
+                self._file.seek(payload_len, os.SEEK_CUR)
+                self._index[url] = (offset, length, fetched_at)
+                offset += length
+            if offset < file_size:
+                # 上次写入被中断，丢弃残缺的尾部 | A previous write was interrupted; drop the torn tail
+                self._file.truncate(offset)
+            self._size = offset
+
+    def _read_record(self, offset: int, length: int) -> Dict[str, Any]:
+        """读取并解码一条记录（调用方需持有锁）。 | Read and decode one record (caller holds the lock)."""
+        self._file.seek(offset)
+        data = self._file.read(length)
+        _magic, codec, url_len, _payload_len, fetched_at = _HEADER.unpack_from(data)
+        url = data[_HEADER.size:_HEADER.size + url_len].decode("utf-8")
+        page = json.loads(self._decompress(codec, data[_HEADER.size + url_len:]))
+        page["url"] = url
+        page["fetched_at"] = fetched_at
+        return page
+
+    def _is_expired(self, fetched_at: float, now: float) -> bool:
+        return self.max_age is not None and now - fetched_at > self.max_age
+
+    # ----- 公共接口 | public API -----
+
+    def put(self, page: Dict[str, Any], fetched_at: Optional[float] = None):
+        """
+        追加一个页面（需要 url 和 content 字段）。
+        Append a page; it must carry `url` and `content`.
+        """
+        url = page.get("url")
+        if not url or not page.get("content"):
+            return
+        fetched_at = fetched_at or page.get("fetched_at") or time.time()
+        record = self._encode(url, page, fetched_at)
+        with self._lock:
+            offset = self._size
+            self._file.seek(offset)
+            self._file.write(record)
+            self._file.flush()
+            self._size += len(record)
+            self._index[url] = (offset, len(record), fetched_at)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self.compact()
+
+    def get(self, url: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        按 URL 取最新版本，超过 max_age（或存储的保留期）时返回 None。
+        Return the newest version of a URL, or None if missing or older than `max_age` / the retention period.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return None
+            offset, length, fetched_at = entry
+            if self._is_expired(fetched_at, now) or (max_age is not None and now - fetched_at > max_age):
+                return None
+            return self._read_record(offset, length)
+
+    def scan(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按抓取时间顺序遍历 [start, end) 内每个 URL 的最新版本。
+        Iterate over the newest version of each URL fetched in [start, end), oldest first.
+        """
+        now = time.time()
+        with self._lock:
+            urls = [
+                url for url, entry in sorted(self._index.items(), key=lambda item: item[1][2])
+                if (start is None or entry[2] >= start) and (end is None or entry[2] < end)
+                and not self._is_expired(entry[2], now)
+            ]
+        for url in urls:
+            with self._lock:
+                # 按 URL 重新查找，扫描期间发生的压缩会移动偏移量 | Look up again: compaction may move offsets mid-scan
+                entry = self._index.get(url)
+                if entry is None:
+                    continue
+                page = self._read_record(entry[0], entry[1])
+            yield page
+
+    def compact(self) -> Dict[str, int]:
+        """
+        重写数据文件，只保留每个 URL 的最新且未过期的版本；有 max_bytes 时从最旧的页面开始丢弃。
+        Rewrite the data file keeping only the newest unexpired version per URL; with `max_bytes`,
+        the oldest pages are dropped until the live data fits in COMPACT_TARGET_RATIO of it.
+
+        返回 | Returns:
+            压缩前后的字节数和丢弃的页面数 | Bytes before/after and the number of pages dropped
+        """
+        now = time.time()
+        with self._lock:
+            before = self._size
+            live = sorted(
+                ((url, entry) for url, entry in self._index.items() if not self._is_expired(entry[2], now)),
+                key=lambda item: item[1][2]
+            )
+            if self.max_bytes is not None:
+                limit = self.max_bytes * self.COMPACT_TARGET_RATIO
+                total = sum(entry[1] for _url, entry in live)
+                while live and total > limit:
+                    total -= live.pop(0)[1][1]
+            dropped = len(self._index) - len(live)
+
+            tmp_path = self.path + ".compact"
+            new_index = {}
+            offset = 0
+            with open(tmp_path, "wb") as out:
+                for url, (old_offset, length, fetched_at) in live:
+                    self._file.seek(old_offset)
+                    out.write(self._file.read(length))
+                    new_index[url] = (offset, length, fetched_at)
+                    offset += length
+                out.flush()
+                os.fsync(out.fileno())
+
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a+b")
+            self._index = new_index
+            self._size = offset
+            return {"bytes_before": before, "bytes_after": offset, "pages_dropped": dropped}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return url in self._index
+
+    def stats(self) -> Dict[str, Any]:
+        """返回可序列化的存储状态。 | Return a JSON-serializable status snapshot."""
+        with self._lock:
+            live_bytes = sum(entry[1] for entry in self._index.values())
+            return {
+                "path": self.path,
+                "compression": self.compression,
+                "pages": len(self._index),
+                "file_bytes": self._size,
+                "live_bytes": live_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age
+            }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
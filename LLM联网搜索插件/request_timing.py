@@ -0,0 +1,87 @@
+"""
+请求级别的耗时明细。
+Request-scoped timing breakdown.
+
+metrics.observe_stage 在记录直方图的同时，会把阶段耗时写入当前请求的 RequestTimings
+（如果有的话），因此 /search 可以返回每个阶段和每个 URL 的毫秒级耗时，并在超过阈值时写入慢请求日志。
+metrics.observe_stage also feeds the active RequestTimings (if any), so /search can report
+per-stage and per-URL milliseconds and log the full breakdown for slow requests.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+_current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    收集单个请求内各阶段和各 URL 的耗时（毫秒）。
+    Collects per-stage and per-URL durations (milliseconds) for a single request.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.urls: Dict[str, Dict[str, float]] = {}
+        self._token = None
+
+    def add(self, stage: str, seconds: float, url: Optional[str] = None, aggregate: bool = True):
+        """
+        累加一个阶段的耗时；提供 url 时同时计入该 URL 的明细。
+        Accumulate a stage duration; with `url`, also attribute it to that URL.
+        aggregate=False 只记录到 URL 明细（例如单个 URL 的总耗时）。
+        With aggregate=False the value only goes to the per-URL breakdown (e.g. a URL's total).
+        """
+        ms = seconds * 1000.0
+        with self._lock:
+            if aggregate:
+                self.stages[stage] = self.stages.get(stage, 0.0) + ms
+            if url:
+                url_stages = self.urls.setdefault(url, {})
+                url_stages[stage] = url_stages.get(stage, 0.0) + ms
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回四舍五入到 0.1 毫秒的明细。 | Return the breakdown rounded to 0.1 ms."""
+        with self._lock:
+            return {
+                "total_ms": round(self.total_ms, 1),
+                "stages": {stage: round(ms, 1) for stage, ms in self.stages.items()},
+                "urls": {
+                    url: {stage: round(ms, 1) for stage, ms in url_stages.items()}
+                    for url, url_stages in self.urls.items()
+                }
+            }
+
+
+def begin_request_timings() -> RequestTimings:
+    """为当前上下文开始收集耗时。 | Start collecting timings in the current context."""
+    timings = RequestTimings()
+    timings._token = _current_timings.set(timings)
+    return timings
+
+
+def end_request_timings(timings: RequestTimings):
+    """停止为当前上下文收集耗时。 | Stop collecting timings in the current context."""
+    if timings._token is not None:
+        _current_timings.reset(timings._token)
+        timings._token = None
+
+
+def current_request_timings() -> Optional[RequestTimings]:
+    """返回当前上下文的 RequestTimings，没有则为 None。 | The active RequestTimings, or None."""
+    return _current_timings.get()
+
+
+def record_timing(stage: str, seconds: float, url: Optional[str] = None, aggregate: bool = True):
+    """如果当前上下文在收集耗时，则记录一个阶段。 | Record a stage if timings are being collected."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds, url=url, aggregate=aggregate)
@@ -0,0 +1,138 @@
+import gzip
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，没有时使用标准库 json | orjson is optional; fall back to stdlib json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有时只支持 gzip | brotli is optional; only gzip is offered without it
+    brotli = None
+
+from metrics import observe_stage, RESPONSE_BYTES
+
+# 小于该字节数的响应不压缩，压缩收益抵不过开销 | Bodies below this size are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(data: Any) -> bytes:
+    """
+    序列化为 UTF-8 JSON（不转义中文）；优先使用 orjson，orjson 不支持的类型退回标准库。
+    Serialize to UTF-8 JSON without escaping non-ASCII text, using orjson when it is installed and
+    falling back to stdlib json for types orjson rejects.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def supported_encodings() -> List[str]:
+    """按优先顺序返回可用的压缩编码。 | Available content codings, most preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    根据 Accept-Encoding 选择压缩编码：取 q 值最高的可用编码，q 相同时优先 br。不压缩时返回 None。
+    Pick a content coding from Accept-Encoding: the available coding with the highest q-value,
+    preferring br on ties. Returns None when the body should go out uncompressed.
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """用指定编码压缩响应体。 | Compress a body with the given content coding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+def parse_fields(value: Any) -> Optional[List[str]]:
+    """
+    解析 fields 参数（逗号分隔的字符串或字符串列表），没有指定时返回 None。
+    Parse a `fields` parameter given as a comma-separated string or a list; None when absent.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(field).strip() for field in value if str(field).strip()]
+
+
+def select_fields(data: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """
+    只保留指定的顶层字段；fields 为 None 时原样返回，未知字段忽略。
+    Keep only the requested top-level fields; None keeps everything and unknown names are ignored.
+    """
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def json_response(data: Any, status: int = 200, accept_encoding: Optional[str] = None,
+                  compress_responses: bool = True, min_size: int = MIN_COMPRESS_BYTES) -> Response:
+    """
+    构建 JSON 响应：快速序列化，并在客户端支持且响应足够大时压缩。
+    Build a JSON response: fast serialization, compressed when the client accepts it and the body is
+    large enough to benefit.
+
+    参数 | Args:
+        data: 响应数据 | Response data
+        status: HTTP 状态码 | HTTP status code
+        accept_encoding: 请求的 Accept-Encoding 头 | The request's Accept-Encoding header
+        compress_responses: 是否允许压缩 | Whether compression is allowed at all
+        min_size: 压缩的最小字节数 | Smallest body that gets compressed
+    """
+    start = time.perf_counter()
+    body = dumps(data)
+    observe_stage("serialize", "", time.perf_counter() - start)
+
+    encoding = None
+    if compress_responses and len(body) >= min_size:
+        encoding = choose_encoding(accept_encoding)
+    if encoding:
+        start = time.perf_counter()
+        body = compress(body, encoding)
+        observe_stage("compress", "", time.perf_counter() - start)
+    RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity")
+
+    response = Response(body, status=status, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
@@ -2,78 +2,265 @@ import json
 import re
 import textwrap
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import Any, Dict, Iterator, List, Optional
+
+# 中日韩统一表意文字及全角标点，估算 token 时按每字一个计 | CJK ideographs and full-width punctuation, one token each
+_CJK_CHAR = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_WORD_OR_SYMBOL = re.compile(r'[^\W_]+|[^\w\s]', re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数：中文每字约一个 token，其他单词每 4 个字符约一个 token，标点各一个。
+    Rough token estimate: about one token per CJK character, one per 4 characters of other words,
+    and one per punctuation mark. Good enough to compare prompt formats, not to enforce limits.
+    """
+    if not text:
+        return 0
+    tokens = len(_CJK_CHAR.findall(text))
+    for piece in _WORD_OR_SYMBOL.findall(_CJK_CHAR.sub(' ', text)):
+        tokens += (len(piece) + 3) // 4
+    return tokens
+
+
+class _MarkdownRenderer:
+    """原有的 Markdown 格式：标题、链接和代码块。 | The original Markdown layout: headings, links and fenced blocks."""
+
+    wrap_content = True
+
+    def header(self, query, current_time):
+        timestamp = f"*Search performed at: {current_time}*\n" if current_time else ""
+        return (f"# Search Results for: \"{query}\"\n"
+                f"{timestamp}\n"
+                "## Search Result Summaries\n\n")
+
+    def timestamp(self, current_time):
+        return f"*Search performed at: {current_time}*\n"
+
+    def no_results(self):
+        return "*No search results found*\n\n"
+
+    def result(self, number, result):
+        return (f"### {number}. {result['title']}\n"
+                f"**Source**: [{result['link']}]({result['link']})\n"
+                f"**Summary**: {result['snippet']}\n\n")
+
+    def content_section(self):
+        return "## Detailed Content\n\n"
+
+    def content(self, number, title, url, text):
+        return (f"### {title}\n"
+                f"**Source**: [{url}]({url})\n"
+                f"**Content**:\n```\n{text}\n```\n\n")
+
+    def instructions(self):
+        return ("## Instructions for LLM\n\n"
+                "Based on the search results above, please provide a comprehensive answer to the query. "
+                "Include relevant information from the search results and cite sources appropriately using the source numbers. "
+                "If the search results don't contain sufficient information to answer the query, "
+                "please acknowledge the limitations and provide the best possible answer based on available information.")
+
+
+class _CompactRenderer:
+    """
+    紧凑的编号纯文本：每个 URL 只出现一次，正文用结果编号引用，不换行、不加标记。
+    Compact numbered plain text: each URL appears once, page content refers back to the result
+    number, and there is no wrapping or markup.
+    """
+
+    wrap_content = False
+
+    def header(self, query, current_time):
+        if not current_time:
+            return f"Search results for \"{query}\":\n"
+        return f"Search results for \"{query}\" ({current_time}):\n"
+
+    def timestamp(self, current_time):
+        return f"Searched at {current_time}\n"
+
+    def no_results(self):
+        return "(no results)\n"
+
+    def result(self, number, result):
+        return f"[{number}] {result['title']}\n{result['link']}\n{result['snippet']}\n"
+
+    def content_section(self):
+        return "\nPage content:\n"
+
+    def content(self, number, title, url, text):
+        return f"[{number if number is not None else url}] {text}\n"
+
+    def instructions(self):
+        return ""
+
+
+class _JsonLinesRenderer:
+    """每行一个 JSON 对象（不转义中文）。 | One JSON object per line, non-ASCII left unescaped."""
+
+    wrap_content = False
+
+    @staticmethod
+    def _line(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def header(self, query, current_time):
+        if not current_time:
+            return self._line({"type": "search", "query": query})
+        return self._line({"type": "search", "query": query, "time": current_time})
+
+    def timestamp(self, current_time):
+        return self._line({"type": "time", "time": current_time})
+
+    def no_results(self):
+        return ""
+
+    def result(self, number, result):
+        return self._line({"type": "result", "n": number, "title": result['title'],
+                           "url": result['link'], "snippet": result['snippet']})
+
+    def content_section(self):
+        return ""
+
+    def content(self, number, title, url, text):
+        line = {"type": "content", "n": number, "text": text}
+        if number is None:
+            line["url"] = url
+        return self._line(line)
+
+    def instructions(self):
+        return ""
+
 
 class ResponseProcessor:
     """处理和格式化搜索结果供LLM使用。
     Process and format search results for LLM consumption."""
     
-    def __init__(self, max_tokens=4000, max_content_per_source=1500):
+    # 可选的搜索结果格式 | Available output formats
+    OUTPUT_FORMATS = {
+        "markdown": _MarkdownRenderer,
+        "compact": _CompactRenderer,
+        "jsonl": _JsonLinesRenderer
+    }
+    
+    # 提示词布局：classic 为原有顺序；cache_friendly 把系统提示词和所有固定说明放在前面，
+    # 查询、搜索结果和时间放在最后，使不同请求共享尽可能长的前缀，命中 Ollama / llama.cpp 的前缀缓存
+    # Prompt layouts: classic is the original order; cache_friendly keeps the system prompt and all
+    # static instructions in a stable prefix and puts query, results and timestamp last, so requests
+    # share the longest possible prefix and hit the Ollama / llama.cpp prefix cache
+    PROMPT_LAYOUTS = ("classic", "cache_friendly")
+    
+    DEFAULT_SYSTEM_PROMPT = (
+        "You are an AI assistant with access to web search results. "
+        "You specialize in providing accurate information based on recent web content. "
+        "When responding, always cite your sources by referring to the search result numbers. "
+        "If the search results contain contradictory information, acknowledge this and explain why. "
+        "If the search results don't provide sufficient information to fully answer the query, be transparent about these limitations."
+    )
+    
+    # cache_friendly 布局中位于固定前缀的回答说明 | Answer instructions kept in the cache_friendly prefix
+    STATIC_INSTRUCTIONS = (
+        "You will be given web search results, then the user's question. "
+        "Based on these search results, provide a comprehensive, accurate, and helpful response to the user's question. "
+        "Cite specific sources by their numbers when drawing information from them. "
+        "Format your response in a clear, structured way with appropriate headings and lists where helpful."
+    )
+    
+    def __init__(self, max_tokens=4000, max_content_per_source=1500, output_format="markdown", layout="classic"):
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        if layout not in self.PROMPT_LAYOUTS:
+            raise ValueError(f"不支持的提示词布局: {layout}")
         self.max_tokens = max_tokens
         self.max_content_per_source = max_content_per_source
+        self.output_format = output_format
+        self.layout = layout
     
-    def format_search_results(self, query: str, search_results: List[Dict[str, Any]], 
-                              detailed_content: Optional[Dict[str, str]] = None) -> str:
+    def iter_search_results(self, query: str, search_results: List[Dict[str, Any]],
+                            detailed_content: Optional[Dict[str, Any]] = None,
+                            output_format: Optional[str] = None, layout: Optional[str] = None,
+                            now: Optional[datetime] = None) -> Iterator[str]:
         """
-        将搜索结果格式化为结构化的LLM响应。
-        Format search results into a structured response for the LLM.
+        逐段产出格式化的搜索结果，所有输出格式共用这一个构建过程。
+        Yield the formatted search results piece by piece; every output format shares this builder.
         
         参数 | Args:
             query: 原始搜索查询 | The original search query
             search_results: 搜索结果字典列表 | List of search result dictionaries
             detailed_content: 特定网址的详细内容字典 | Dictionary of detailed content from specific URLs
-            
-        返回 | Returns:
-            格式化的LLM响应 | Formatted response for the LLM
+            output_format: "markdown"、"compact" 或 "jsonl"，默认为实例的 output_format |
+                           "markdown", "compact" or "jsonl"; defaults to the instance's output_format
+            layout: 见 PROMPT_LAYOUTS；cache_friendly 时时间放在最后，且不附带回答说明 |
+                    See PROMPT_LAYOUTS; cache_friendly puts the timestamp last and leaves out the answer instructions
+            now: 搜索时间，默认为当前时间 | Search time, defaults to now
         """
-        # 获取当前日期和时间 | Get current date and time
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        output_format = output_format or self.output_format
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        renderer = self.OUTPUT_FORMATS[output_format]()
+        cache_friendly = (layout or self.layout) == "cache_friendly"
         
-        # 开始构建响应 | Start building the response
-        response = f"# Search Results for: \"{query}\"\n"
-        response += f"*Search performed at: {current_time}*\n\n"
+        # 获取当前日期和时间 | Get current date and time
+        current_time = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        yield renderer.header(query, None if cache_friendly else current_time)
         
         # 添加搜索结果摘要 | Add search result summaries
-        response += "## Search Result Summaries\n\n"
-        
         if not search_results:
-            response += "*No search results found*\n\n"
-        else:
-            for i, result in enumerate(search_results, 1):
-                response += f"### {i}. {result['title']}\n"
-                response += f"**Source**: [{result['link']}]({result['link']})\n"
-                response += f"**Summary**: {result['snippet']}\n\n"
+            yield renderer.no_results()
+        numbers = {}
+        for number, result in enumerate(search_results, 1):
+            numbers.setdefault(result['link'], number)
+            yield renderer.result(number, result)
         
         # 如果可用，添加详细内容 | Add detailed content if available
-        if detailed_content and len(detailed_content) > 0:
-            response += "## Detailed Content\n\n"
-            
+        if detailed_content:
+            yield renderer.content_section()
             for url, content in detailed_content.items():
-                # Find the corresponding search result to get the title
-                title = next((r['title'] for r in search_results if r['link'] == url), "Content")
+                number = numbers.get(url)
+                title = search_results[number - 1]['title'] if number else "Content"
                 
                 # 清理和格式化内容 | Clean and format the content
                 cleaned_content = self._clean_content(content)
-                formatted_content = self._format_content_extract(cleaned_content)
-                
-                response += f"### {title}\n"
-                response += f"**Source**: [{url}]({url})\n"
-                response += f"**Content**:\n```\n{formatted_content}\n```\n\n"
+                formatted_content = self._format_content_extract(cleaned_content, wrap=renderer.wrap_content)
+                yield renderer.content(number, title, url, formatted_content)
+        
+        if cache_friendly:
+            # 时间每次都不同，放在最后才不会打断前缀缓存 | The timestamp always changes; last, it can't break the cached prefix
+            yield renderer.timestamp(current_time)
+            return
         
         # 为LLM添加提示 | Add a prompt for the LLM
-        response += "## Instructions for LLM\n\n"
-        response += "Based on the search results above, please provide a comprehensive answer to the query. "
-        response += "Include relevant information from the search results and cite sources appropriately using the source numbers. "
-        response += "If the search results don't contain sufficient information to answer the query, "
-        response += "please acknowledge the limitations and provide the best possible answer based on available information."
+        yield renderer.instructions()
+    
+    def format_search_results(self, query: str, search_results: List[Dict[str, Any]], 
+                              detailed_content: Optional[Dict[str, Any]] = None,
+                              output_format: Optional[str] = None, layout: Optional[str] = None,
+                              now: Optional[datetime] = None) -> str:
+        """
+        将搜索结果格式化为结构化的LLM响应。
+        Format search results into a structured response for the LLM.
         
-        return response
+        参数 | Args:
+            query: 原始搜索查询 | The original search query
+            search_results: 搜索结果字典列表 | List of search result dictionaries
+            detailed_content: 特定网址的详细内容字典 | Dictionary of detailed content from specific URLs
+            output_format: 输出格式，见 OUTPUT_FORMATS | Output format, see OUTPUT_FORMATS
+            layout: 提示词布局，见 PROMPT_LAYOUTS | Prompt layout, see PROMPT_LAYOUTS
+            now: 搜索时间，默认为当前时间 | Search time, defaults to now
+            
+        返回 | Returns:
+            格式化的LLM响应 | Formatted response for the LLM
+        """
+        return "".join(self.iter_search_results(query, search_results, detailed_content, output_format, layout, now))
     
     def _clean_content(self, content) -> str:
         """清理和标准化网页内容。 | Clean and normalize content from web pages."""
         if not content:
             return ""
             
+        # fetch_content 返回的字典只取正文 | Only the text of a fetch_content result goes into the prompt
+        if isinstance(content, dict):
+            content = content.get('content') or content.get('error') or ""
+        
         # 确保内容是字符串类型
         if not isinstance(content, str):
             try:
@@ -92,8 +279,8 @@ class ResponseProcessor:
         
         return content.strip()
     
-    def _format_content_extract(self, content: str) -> str:
-        """将内容提取格式化为合理的长度。 | Format a content extract to a reasonable length."""
+    def _format_content_extract(self, content: str, wrap: bool = True) -> str:
+        """将内容提取格式化为合理的长度，wrap 为 True 时按 100 列换行。 | Format a content extract to a reasonable length, wrapping at 100 columns if `wrap`."""
         if not content:
             return "No content available"
             
@@ -111,6 +298,9 @@ class ResponseProcessor:
         else:
             formatted_content = content
         
+        if not wrap:
+            return formatted_content
+        
         # 对长行进行换行以提高可读性 | Wrap long lines for better readability
         formatted_content = '\n'.join(textwrap.wrap(formatted_content, width=100, 
                                                     break_long_words=False, 
@@ -139,8 +329,11 @@ class ResponseProcessor:
         return key_points
     
     def create_prompt_with_search_results(self, user_query: str, search_results: List[Dict[str, Any]],
-                                          detailed_content: Optional[Dict[str, str]] = None,
-                                          system_prompt: Optional[str] = None) -> str:
+                                          detailed_content: Optional[Dict[str, Any]] = None,
+                                          system_prompt: Optional[str] = None,
+                                          output_format: Optional[str] = None,
+                                          layout: Optional[str] = None,
+                                          now: Optional[datetime] = None) -> str:
         """
         创建一个将用户查询与搜索结果结合的提示词。
         Create a prompt that combines the user's query with search results.
@@ -150,30 +343,51 @@ class ResponseProcessor:
             search_results: 搜索结果字典列表 | List of search result dictionaries
             detailed_content: 特定网址的详细内容字典 | Dictionary of detailed content from specific URLs
             system_prompt: 可选的自定义系统提示词 | Optional custom system prompt to use
+            output_format: 搜索结果的输出格式，见 OUTPUT_FORMATS | Output format of the search results, see OUTPUT_FORMATS
+            layout: 提示词布局，见 PROMPT_LAYOUTS，默认为实例的 layout | Prompt layout, see PROMPT_LAYOUTS; defaults to the instance's layout
+            now: 搜索时间，默认为当前时间 | Search time, defaults to now
             
         返回 | Returns:
             包含用户查询和搜索结果的LLM提示词 | A prompt for the LLM that includes the user query and search results
         """
-        formatted_results = self.format_search_results(user_query, search_results, detailed_content)
-        
+        return "".join(self.iter_prompt(user_query, search_results, detailed_content, system_prompt,
+                                        output_format, layout, now))
+    
+    def iter_prompt(self, user_query: str, search_results: List[Dict[str, Any]],
+                    detailed_content: Optional[Dict[str, Any]] = None,
+                    system_prompt: Optional[str] = None,
+                    output_format: Optional[str] = None,
+                    layout: Optional[str] = None,
+                    now: Optional[datetime] = None) -> Iterator[str]:
+        """create_prompt_with_search_results 的逐段产出版本。 | Streaming version of create_prompt_with_search_results."""
+        layout = layout or self.layout
+        if layout not in self.PROMPT_LAYOUTS:
+            raise ValueError(f"不支持的提示词布局: {layout}")
         # 如果未提供，使用默认系统提示词 | Default system prompt if none provided
-        if not system_prompt:
-            system_prompt = (
-                "You are an AI assistant with access to web search results. "
-                "You specialize in providing accurate information based on recent web content. "
-                "When responding, always cite your sources by referring to the search result numbers. "
-                "If the search results contain contradictory information, acknowledge this and explain why. "
-                "If the search results don't provide sufficient information to fully answer the query, be transparent about these limitations."
-            )
-        
-        prompt = (
+        system_prompt = system_prompt or self.DEFAULT_SYSTEM_PROMPT
+        
+        if layout == "cache_friendly":
+            yield self.static_prefix(system_prompt)
+            yield from self.iter_search_results(user_query, search_results, detailed_content, output_format, layout, now)
+            yield f"\nThe user asked: \"{user_query}\""
+            return
+        
+        yield (
             f"{system_prompt}\n\n"
             f"The user asked: \"{user_query}\"\n\n"
             "I've searched the web and found the following information to help answer this question:\n\n"
-            f"{formatted_results}\n\n"
+        )
+        yield from self.iter_search_results(user_query, search_results, detailed_content, output_format, layout, now)
+        yield (
+            "\n\n"
             "Based on these search results, provide a comprehensive, accurate, and helpful response to the user's question. "
             "Cite specific sources by their numbers when drawing information from them. "
             "Format your response in a clear, structured way with appropriate headings and lists where helpful."
         )
-        
-        return prompt
+    
+    def static_prefix(self, system_prompt: Optional[str] = None) -> str:
+        """
+        cache_friendly 布局中所有请求共享的固定前缀。
+        The prefix shared by every prompt in the cache_friendly layout.
+        """
+        return f"{system_prompt or self.DEFAULT_SYSTEM_PROMPT}\n\n{self.STATIC_INSTRUCTIONS}\n\n"
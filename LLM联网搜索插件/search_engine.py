@@ -7,9 +7,19 @@ import nltk
 from urllib.parse import quote_plus, urlparse
 import time
 import random
+import logging
 from typing import List, Dict, Any, Optional, Tuple
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import Future
 from datetime import datetime
+import deadline
+from circuit_breaker import CircuitBreaker
+from metrics import time_stage, timed_iter, observe_stage, record_cache, SEARCH_RETRIES, MOCK_FALLBACKS, BREAKER_SHORT_CIRCUITS, BYTES_DOWNLOADED
+from request_timing import record_timing
+from url_resolver import canonicalize_url
+from content_extractor import extract_main_text
+
+logger = logging.getLogger(__name__)
 
 # 在首次导入时下载所需的NLTK资源 | Download required NLTK resources on first import
 try:
@@ -28,20 +38,57 @@ class WebSearch:
     Class that provides internet search capabilities.
     """
     
-    def __init__(self, search_engine="google", timeout=10):
+    # 需要联网的搜索引擎，每个都有熔断器 | Network engines, each guarded by a circuit breaker
+    NETWORK_ENGINES = ["google", "bing", "baidu"]
+    SUPPORTED_ENGINES = NETWORK_ENGINES + ["local"]
+    CONTENT_EXTRACTORS = ["density", "selectors"]
+    
+    def __init__(self, search_engine="google", timeout=10, fallback_engine=None,
+                 breaker_failure_threshold=3, breaker_recovery_timeout=60,
+                 local_index=None, index_fetched_pages=True, page_store=None, page_cache_ttl=None,
+                 url_resolver=None, content_extractor="density"):
         """
         初始化 WebSearch 类。
         Initialize the WebSearch class.
         
         参数 | Args:
-            search_engine (str): 要使用的搜索引擎 ("google", "bing", "baidu") | Search engine to use ("google", "bing", "baidu")
+            search_engine (str): 要使用的搜索引擎 ("google", "bing", "baidu", "local") | Search engine to use ("google", "bing", "baidu", "local")
             timeout (int): 请求超时时间（秒） | Request timeout in seconds
+            fallback_engine (str): 熔断器打开或搜索失败时改用的引擎 | Engine to route to when the breaker is open or a search fails
+            breaker_failure_threshold (int): 触发熔断的连续失败次数 | Consecutive failures that trip an engine's breaker
+            breaker_recovery_timeout (float): 熔断器打开后的冷却时间（秒） | Seconds a tripped breaker stays open
+            local_index (LocalSearchIndex): "local" 引擎使用的本地全文索引 | Full-text index backing the "local" engine
+            index_fetched_pages (bool): 是否把 fetch_content 抓取的网页写入本地索引 | Whether fetch_content adds pages to the local index
+            page_store (PageStore): 保存抓取网页的持久化存储 | Persistent store that keeps every fetched page
+            page_cache_ttl (float): 存储中的网页在多少秒内直接复用，None 表示不复用 | Seconds a stored page is reused instead of refetched; None disables reuse
+            url_resolver (RedirectResolver): 解析百度等跳转链接，None 时只规范化 URL | Resolves Baidu-style redirect links; None only canonicalises URLs
+            content_extractor (str): 正文提取方式，"density"（文本密度，单次遍历）或 "selectors"（常见正文选择器） |
+                                     Main-text extractor: "density" (text density, single walk) or "selectors" (common content selectors)
         """
         self.search_engine = search_engine.lower()
         self.timeout = timeout
         
-        if self.search_engine not in ["google", "bing", "baidu"]:
-            raise ValueError(f"不支持的搜索引擎: {search_engine}。支持的引擎: google, bing, baidu")
+        if self.search_engine not in self.SUPPORTED_ENGINES:
+            raise ValueError(f"不支持的搜索引擎: {search_engine}。支持的引擎: {', '.join(self.SUPPORTED_ENGINES)}")
+        
+        self.fallback_engine = fallback_engine.lower() if fallback_engine else None
+        if self.fallback_engine and self.fallback_engine not in self.SUPPORTED_ENGINES:
+            raise ValueError(f"不支持的备用搜索引擎: {fallback_engine}。支持的引擎: {', '.join(self.SUPPORTED_ENGINES)}")
+        
+        # 每个联网搜索引擎一个熔断器 | One circuit breaker per network engine
+        self.circuit_breakers = {
+            engine: CircuitBreaker(engine, breaker_failure_threshold, breaker_recovery_timeout)
+            for engine in self.NETWORK_ENGINES
+        }
+        
+        self.local_index = local_index
+        self.index_fetched_pages = index_fetched_pages
+        self.page_store = page_store
+        self.page_cache_ttl = page_cache_ttl
+        self.url_resolver = url_resolver
+        if content_extractor not in self.CONTENT_EXTRACTORS:
+            raise ValueError(f"Unsupported content extractor: {content_extractor}")
+        self.content_extractor = content_extractor
         
         # 设置默认请求头
         self.headers = {
@@ -58,7 +105,7 @@ class WebSearch:
             "Cache-Control": "max-age=0"
         }
     
-    def search(self, query, num_results=5):
+    def search(self, query, num_results=5, engine=None):
         """
         执行给定查询的网络搜索。
         Perform a web search for the given query.
@@ -66,18 +113,201 @@ class WebSearch:
         参数 | Args:
             query (str): 搜索查询 | The search query
             num_results (int): 返回结果的数量 | Number of results to return
+            engine (str): 本次使用的搜索引擎，默认为实例的 search_engine；并发调用时应显式传入
+                          | Engine for this call, defaults to the instance's search_engine; pass it explicitly from concurrent callers
             
         返回 | Returns:
             list: 包含搜索结果的字典列表 | List of dictionaries containing search results
         """
-        if self.search_engine == "google":
-            return self._google_search(query, num_results)
-        elif self.search_engine == "bing":
-            return self._bing_search(query, num_results)
-        elif self.search_engine == "baidu":
-            return self._baidu_search(query, num_results)
+        return list(self.iter_search(query, num_results, engine))
+    
+    def iter_search(self, query, num_results=5, engine=None):
+        """
+        逐条产出搜索结果：解析器每找到一个结果就立即产出，调用方可以在搜索结果页还在解析时开始抓取网页。
+        熔断、备用引擎和模拟结果的处理与 search() 相同。
+        Yield search results one at a time as the parser finds them, so callers can start fetching
+        pages while the SERP is still being parsed. Breaker, fallback and mock handling match search().
+        """
+        engine = (engine or self.search_engine).lower()
+        if engine == "local":
+            # 本地索引没有命中是正常结果，不计入熔断也不回退 | No local hits is a valid answer: no breaker, no fallback
+            yield from self._local_search(query, num_results)
+            return
+        if engine not in self.circuit_breakers:
+            raise ValueError(f"Unsupported search engine: {engine}")
+        breaker = self.circuit_breakers[engine]
+        
+        if not breaker.allow_request():
+            logger.warning(f"{engine} 熔断器处于打开状态，跳过请求")
+            BREAKER_SHORT_CIRCUITS.inc(engine=engine)
+            yield from self._iter_fallback(query, num_results, engine)
+            return
+        
+        found = yield from self._yield_counted(self._iter_with_engine(engine, query, num_results), breaker)
+        if found:
+            return
+        if deadline.expired():
+            # 时间用完不代表引擎故障，不计入熔断也不回退 | Running out of time is not an engine failure
+            logger.warning(f"请求截止时间已到，{engine} 搜索未完成")
+            return
+        
+        yield from self._iter_fallback(query, num_results, engine)
+    
+    @staticmethod
+    def _yield_counted(results, breaker):
+        """
+        转发一次引擎调用的结果并返回产出的数量，同时按调用的结果记录熔断器：
+        正常结束且有结果，或调用方拿到结果后提前停止时记为成功；引擎出错（已产出的结果保留）
+        或没有结果时记为失败；截止时间已到或调用方在第一个结果前停止时不计，只释放半开试探。
+        Re-yield one engine call's results and return how many there were, recording the call's
+        outcome on the breaker: normal completion with results, or the caller stopping after some,
+        is a success; an engine error (results already yielded are kept) or no results is a
+        failure; running out of time or the caller stopping before the first result only releases
+        the half-open trial.
+        """
+        count = 0
+        try:
+            for result in results:
+                count += 1
+                yield result
+        except GeneratorExit:
+            if count:
+                breaker.record_success()
+            else:
+                breaker.release_probe()
+            raise
+        except Exception as e:
+            logger.warning(f"{breaker.name} 搜索出错（已产出 {count} 个结果）: {e}")
+            breaker.record_failure(f"error: {e}")
+            return count
+        
+        if count:
+            breaker.record_success()
+        elif deadline.expired():
+            breaker.release_probe()
         else:
-            raise ValueError(f"Unsupported search engine: {self.search_engine}")
+            breaker.record_failure("no results")
+        return count
+    
+    def _iter_with_engine(self, engine, query, num_results):
+        """逐条产出指定引擎的结果，失败时不产出任何结果。 | Yield one engine's results; yields nothing on failure."""
+        if engine in self.NETWORK_ENGINES:
+            return self._iter_resolved_links(self._iter_serp(engine, query, num_results), engine)
+        elif engine == "local":
+            return iter(self._local_search(query, num_results))
+        else:
+            raise ValueError(f"Unsupported search engine: {engine}")
+    
+    def _iter_resolved_links(self, results, engine):
+        """
+        把结果链接解析为真实地址并规范化，使抓取、缓存和去重看到的是目标站点而不是跳转链接。
+        跳转链接在解析器继续工作时并发解析，结果按原顺序产出，每个结果的链接一解析完就产出。
+        Resolve redirect links and canonicalise every result URL, so fetching, caching and dedupe see
+        the real host instead of the engine's redirect. Redirects resolve concurrently while the parser
+        keeps going; results keep their order and each is yielded as soon as its link is ready.
+        """
+        pending = deque()
+        error = None
+        try:
+            for result in results:
+                pending.append((result, self._submit_link(result['link'], engine)))
+                # 不阻塞地产出已经解析完的前缀 | Yield the already-resolved prefix without blocking
+                while pending and pending[0][1].done():
+                    yield self._with_link(*pending.popleft())
+        except Exception as e:
+            # 解析中途出错时先产出已经拿到的结果 | On a mid-SERP error, yield the results already parsed first
+            error = e
+        while pending:
+            # 截止时间到后不再等待，保留未解析的跳转链接 | Past the deadline, keep unresolved redirect links as they are
+            yield self._with_link(*pending.popleft(), timeout=deadline.remaining())
+        if error is not None:
+            raise error
+    
+    def _submit_link(self, link, engine):
+        if self.url_resolver is not None:
+            try:
+                return self.url_resolver.submit(link, engine)
+            except Exception as e:
+                logger.warning(f"{engine} 跳转链接解析失败: {e}")
+        future = Future()
+        future.set_result(canonicalize_url(link))
+        return future
+    
+    @staticmethod
+    def _with_link(result, future, timeout=None):
+        try:
+            result['link'] = future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"跳转链接解析失败 {result['link']}: {e}")
+        return result
+    
+    def _local_search(self, query, num_results=5):
+        """
+        在本地全文索引中搜索。
+        Search the local full-text index.
+        """
+        if self.local_index is None:
+            raise ValueError("本地搜索索引未配置 | Local search index is not configured")
+        with time_stage("serp_parse", "local"):
+            return self.local_index.search(query, num_results)
+    
+    def _iter_fallback(self, query, num_results, failed_engine):
+        """
+        主引擎失败或被熔断时，尝试备用引擎，最后回退到模拟结果。
+        Route to the fallback engine when the primary failed or is open, then fall back to mock results.
+        """
+        if deadline.expired():
+            logger.warning("请求截止时间已到，不再尝试备用引擎")
+            return
+        fallback = self.fallback_engine
+        if fallback == "local" and self.local_index is not None:
+            results = self._local_search(query, num_results)
+            if results:
+                logger.info("使用本地索引作为备用搜索引擎")
+                yield from results
+                return
+        elif fallback and fallback != failed_engine:
+            breaker = self.circuit_breakers[fallback]
+            if breaker.allow_request():
+                logger.info(f"使用备用搜索引擎: {fallback}")
+                found = yield from self._yield_counted(self._iter_with_engine(fallback, query, num_results), breaker)
+                if found or deadline.expired():
+                    return
+            else:
+                logger.warning(f"备用搜索引擎 {fallback} 的熔断器也处于打开状态")
+                BREAKER_SHORT_CIRCUITS.inc(engine=fallback)
+        
+        logger.warning("搜索失败，使用模拟结果")
+        MOCK_FALLBACKS.inc(engine=failed_engine)
+        yield from self._mock_search_results(query, num_results)
+    
+    def get_circuit_breaker_status(self):
+        """
+        返回所有搜索引擎熔断器的状态。
+        Return the state of every engine's circuit breaker.
+        """
+        return {engine: breaker.status() for engine, breaker in self.circuit_breakers.items()}
+    
+    # 搜索结果页地址模板 | SERP URL templates
+    SERP_URLS = {
+        "google": "https://www.google.com/search?q={query}&num={num}&hl=zh-CN",
+        "bing": "https://www.bing.com/search?q={query}&count={num}",
+        "baidu": "https://www.baidu.com/s?wd={query}&rn={num}"
+    }
+    
+    # 各引擎最多尝试的次数，每次换一个用户代理 | Attempts per engine, each with a different user agent
+    SERP_MAX_RETRIES = {"google": 3, "bing": 1, "baidu": 3}
+    
+    # 保存搜索结果页 HTML 以便调试的引擎 | Engines whose SERP HTML is saved for debugging
+    SERP_DEBUG_ENGINES = ("google", "baidu")
+    
+    # 尝试不同的用户代理
+    USER_AGENTS = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"
+    ]
     
     def _google_search(self, query, num_results=5):
         """
@@ -89,155 +319,318 @@ class WebSearch:
         Note: This is a simple implementation and might not work reliably due to Google's 
         anti-scraping measures. For production use, consider using official Google Search API.
         """
-        search_url = f"https://www.google.com/search?q={quote_plus(query)}&num={num_results}&hl=zh-CN"
-        
-        # 尝试不同的用户代理
-        user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
-            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"
-        ]
+        return list(self._iter_serp("google", query, num_results))
+    
+    def _iter_serp(self, engine, query, num_results=5):
+        """
+        抓取搜索结果页并逐条产出解析到的结果；没有解析到结果时换一个用户代理重试。
+        已经产出过结果后不再重试，避免重复，此时出错会抛出异常。所有尝试均失败时不产出任何结果，由 search() 决定是否回退。
+        Fetch the SERP and yield results as the parser finds them, retrying with another user agent
+        when nothing parses. Once a result has been yielded there are no more retries, so nothing is
+        duplicated and an error is raised instead. If every attempt fails nothing is yielded and
+        search() decides how to fall back.
+        请求设置了截止时间时，每次请求的超时不超过剩余时间，截止时间到后不再重试。
+        Under a request deadline each attempt's timeout is capped at the time left, and no attempt
+        starts after the deadline.
+        """
+        search_url = self.SERP_URLS[engine].format(query=quote_plus(query), num=num_results)
+        parser = {
+            "google": self._iter_google_html,
+            "bing": self._iter_bing_html,
+            "baidu": self._iter_baidu_html
+        }[engine]
         
-        # 最多尝试3次
-        max_retries = 3
+        max_retries = self.SERP_MAX_RETRIES[engine]
+        count = 0
         for retry in range(max_retries):
+            if deadline.expired():
+                logger.warning(f"请求截止时间已到，停止 {engine} 搜索 (尝试 {retry+1}/{max_retries})")
+                return
             try:
                 # 每次尝试使用不同的用户代理
                 current_headers = self.headers.copy()
-                current_headers["User-Agent"] = user_agents[retry % len(user_agents)]
+                current_headers["User-Agent"] = self.USER_AGENTS[retry % len(self.USER_AGENTS)]
                 
-                print(f"尝试搜索 (尝试 {retry+1}/{max_retries}): {search_url}")
-                print(f"使用用户代理: {current_headers['User-Agent'][:30]}...")
+                logger.info(f"尝试 {engine} 搜索 (尝试 {retry+1}/{max_retries}): {search_url}")
+                logger.debug(f"使用用户代理: {current_headers['User-Agent'][:30]}...")
                 
-                response = requests.get(search_url, headers=current_headers, timeout=self.timeout)
-                response.raise_for_status()
+                if retry > 0:
+                    SEARCH_RETRIES.inc(engine=engine)
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
-                search_results = []
+                with time_stage("serp_fetch", engine):
+                    response = requests.get(search_url, headers=current_headers,
+                                            timeout=deadline.bounded_timeout(self.timeout))
+                    response.raise_for_status()
+                BYTES_DOWNLOADED.inc(len(response.content), kind="serp")
                 
                 # 保存HTML以便调试
-                debug_file = f"google_search_debug_{retry+1}.html"
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(response.text)
-                print(f"已保存响应HTML到 {debug_file}")
-                
-                # 更全面的选择器列表
-                selectors = [
-                    'div.g',                # 传统选择器
-                    'div.Gx5Zad',           # 新版选择器
-                    'div.tF2Cxc',           # 另一种可能的选择器
-                    'div[jscontroller]',    # 更通用的选择器
-                    'div.MjjYud',           # 2023年版选择器
-                    'div.v7W49e',           # 另一个可能的容器
-                    'div.srKDX',            # 2024年版可能的选择器
-                    'div.N54PNb'            # 另一个可能的容器
-                ]
+                if engine in self.SERP_DEBUG_ENGINES:
+                    self._save_debug_html(engine, retry + 1, response.text)
                 
-                # 标题选择器列表
-                title_selectors = [
-                    'h3',
-                    'h3.LC20lb',
-                    'div.vvjwJb',
-                    'div.DKV0Md',
-                    'h3.zBAuLc',
-                    'h3.DKV0Md'
-                ]
+                for result in timed_iter(parser(response.text, num_results), "serp_parse", engine):
+                    count += 1
+                    yield result
                 
-                # 链接选择器列表
-                link_selectors = [
-                    'a',
-                    'a[href]',
-                    'div.yuRUbf > a',
-                    'div.Z26q7c > a',
-                    'div.eKjLze > div > div > a'
-                ]
+                if count:
+                    logger.info(f"成功找到 {count} 个 {engine} 搜索结果")
+                    return
                 
-                # 摘要选择器列表
-                snippet_selectors = [
-                    'div.VwiC3b',
-                    'div.lEBKkf',
-                    'span.aCOpRe',
-                    'div.s3v9rd',
-                    'div.VwiC3b.yXK7lf',
-                    'span.s3v9rd'
-                ]
+                # 如果没有找到结果，尝试下一次重试
+                logger.info(f"未找到 {engine} 搜索结果，尝试不同的方法...")
                 
-                results_found = False
+            except Exception as e:
+                logger.warning(f"{engine} 搜索时出错 (尝试 {retry+1}/{max_retries}): {e}")
+                if count:
+                    # 已产出部分结果，不能重试；交给调用方计入熔断 | Results already out, so no retry; the caller records the failure
+                    raise
+                # 如果不是最后一次尝试，继续下一次
+                if retry < max_retries - 1:
+                    logger.debug("将在1秒后重试...")
+                    left = deadline.remaining()
+                    time.sleep(1 if left is None else min(1, left))
+        
+        logger.warning(f"所有 {engine} 搜索尝试均失败")
+    
+    def parse_serp(self, engine, html, num_results=5):
+        """
+        解析搜索结果页的原始 HTML，不发起任何网络请求。
+        Parse a search results page from raw HTML without any network access.
+        
+        参数 | Args:
+            engine (str): 搜索引擎名 ("google", "bing", "baidu") | Engine whose SERP layout the HTML uses
+            html (str): 搜索结果页 HTML | Raw SERP HTML
+            num_results (int): 最多返回的结果数量 | Maximum number of results to return
+            
+        返回 | Returns:
+            list: 与 search() 相同格式的结果字典列表 | Result dictionaries in the same format as search()
+        """
+        parsers = {
+            "google": self._parse_google_html,
+            "bing": self._parse_bing_html,
+            "baidu": self._parse_baidu_html
+        }
+        if engine not in parsers:
+            raise ValueError(f"Unsupported search engine: {engine}")
+        return parsers[engine](html, num_results)
+    
+    def _save_debug_html(self, engine, attempt, html):
+        """保存搜索结果页 HTML 以便调试。 | Save the SERP HTML for debugging."""
+        debug_file = f"{engine}_search_debug_{attempt}.html"
+        with open(debug_file, "w", encoding="utf-8") as f:
+            f.write(html)
+        logger.debug(f"已保存响应HTML到 {debug_file}")
+    
+    # Google 结果容器选择器列表
+    GOOGLE_RESULT_SELECTORS = [
+        'div.g',                # 传统选择器
+        'div.Gx5Zad',           # 新版选择器
+        'div.tF2Cxc',           # 另一种可能的选择器
+        'div[jscontroller]',    # 更通用的选择器
+        'div.MjjYud',           # 2023年版选择器
+        'div.v7W49e',           # 另一个可能的容器
+        'div.srKDX',            # 2024年版可能的选择器
+        'div.N54PNb'            # 另一个可能的容器
+    ]
+    
+    # 标题选择器列表
+    GOOGLE_TITLE_SELECTORS = [
+        'h3',
+        'h3.LC20lb',
+        'div.vvjwJb',
+        'div.DKV0Md',
+        'h3.zBAuLc',
+        'h3.DKV0Md'
+    ]
+    
+    # 链接选择器列表
+    GOOGLE_LINK_SELECTORS = [
+        'a',
+        'a[href]',
+        'div.yuRUbf > a',
+        'div.Z26q7c > a',
+        'div.eKjLze > div > div > a'
+    ]
+    
+    # 摘要选择器列表
+    GOOGLE_SNIPPET_SELECTORS = [
+        'div.VwiC3b',
+        'div.lEBKkf',
+        'span.aCOpRe',
+        'div.s3v9rd',
+        'div.VwiC3b.yXK7lf',
+        'span.s3v9rd'
+    ]
+    
+    def _parse_google_html(self, html, num_results=5):
+        """解析 Google 搜索结果页 HTML。 | Parse Google SERP HTML."""
+        return list(self._iter_google_html(html, num_results))
+    
+    def _iter_google_html(self, html, num_results=5):
+        """逐条产出 Google 搜索结果。 | Yield Google SERP results one at a time."""
+        soup = BeautifulSoup(html, 'html.parser')
+        count = 0
+        
+        # 首先尝试使用选择器找到结果容器
+        for selector in self.GOOGLE_RESULT_SELECTORS:
+            results = soup.select(selector)
+            if results:
+                logger.debug(f"找到结果使用选择器: {selector}, 数量: {len(results)}")
                 
-                # 首先尝试使用选择器找到结果容器
-                for selector in selectors:
-                    results = soup.select(selector)
-                    if results:
-                        print(f"找到结果使用选择器: {selector}, 数量: {len(results)}")
-                        results_found = True
+                for result in results:
+                    # 尝试找到标题
+                    title_element = None
+                    for title_selector in self.GOOGLE_TITLE_SELECTORS:
+                        title_element = result.select_one(title_selector)
+                        if title_element:
+                            break
+                    
+                    # 尝试找到链接
+                    link_element = None
+                    for link_selector in self.GOOGLE_LINK_SELECTORS:
+                        link_element = result.select_one(link_selector)
+                        if link_element and link_element.has_attr('href'):
+                            break
+                    
+                    # 尝试找到摘要
+                    snippet_element = None
+                    for snippet_selector in self.GOOGLE_SNIPPET_SELECTORS:
+                        snippet_element = result.select_one(snippet_selector)
+                        if snippet_element:
+                            break
+                    
+                    if title_element and link_element:
+                        title = title_element.get_text().strip()
+                        link = link_element['href']
+                        if link.startswith('/url?q='):
+                            link = link.split('/url?q=')[1].split('&')[0]
                         
-                        for result in results:
-                            # 尝试找到标题
-                            title_element = None
-                            for title_selector in title_selectors:
-                                title_element = result.select_one(title_selector)
-                                if title_element:
-                                    break
-                            
-                            # 尝试找到链接
-                            link_element = None
-                            for link_selector in link_selectors:
-                                link_element = result.select_one(link_selector)
-                                if link_element and link_element.has_attr('href'):
-                                    break
-                            
-                            # 尝试找到摘要
-                            snippet_element = None
-                            for snippet_selector in snippet_selectors:
-                                snippet_element = result.select_one(snippet_selector)
-                                if snippet_element:
-                                    break
-                            
-                            if title_element and link_element:
-                                title = title_element.get_text().strip()
-                                link = link_element['href']
-                                if link.startswith('/url?q='):
-                                    link = link.split('/url?q=')[1].split('&')[0]
-                                
-                                # 如果找不到摘要，使用默认文本
-                                snippet = snippet_element.get_text().strip() if snippet_element else "未找到摘要"
-                                
-                                # 过滤掉不相关的结果
-                                if not any(x in link for x in ['google.com/search', 'accounts.google', 'support.google']):
-                                    search_results.append({
-                                        'title': title,
-                                        'link': link,
-                                        'snippet': snippet
-                                    })
-                                
-                                # 只有当我们收集了足够多的结果时才退出循环
-                                if len(search_results) >= num_results:
-                                    break
+                        # 如果找不到摘要，使用默认文本
+                        snippet = snippet_element.get_text().strip() if snippet_element else "未找到摘要"
                         
-                        if search_results:
-                            break
+                        # 过滤掉不相关的结果
+                        if not any(x in link for x in ['google.com/search', 'accounts.google', 'support.google']):
+                            count += 1
+                            yield {
+                                'title': title,
+                                'link': link,
+                                'snippet': snippet
+                            }
+                        
+                        # 只有当我们收集了足够多的结果时才退出循环
+                        if count >= num_results:
+                            return
                 
-                # 如果找到了搜索结果，返回它们
-                if search_results:
-                    print(f"成功找到 {len(search_results)} 个搜索结果")
-                    # 确保只返回请求的结果数量
-                    return search_results[:num_results]
+                if count:
+                    return
+    
+    def _parse_baidu_html(self, html, num_results=5):
+        """解析百度搜索结果页 HTML。 | Parse Baidu SERP HTML."""
+        return list(self._iter_baidu_html(html, num_results))
+    
+    def _iter_baidu_html(self, html, num_results=5):
+        """逐条产出百度搜索结果。 | Yield Baidu SERP results one at a time."""
+        soup = BeautifulSoup(html, 'html.parser')
+        count = 0
+        
+        # 百度搜索结果容器选择器
+        result_containers = soup.select('div.result.c-container')
+        if not result_containers:
+            result_containers = soup.select('div.result-op.c-container')
+        if not result_containers:
+            result_containers = soup.select('div.c-container')
+        
+        if result_containers:
+            logger.debug(f"找到 {len(result_containers)} 个百度搜索结果")
+        
+        for container in result_containers:
+            # 提取标题
+            title_element = container.select_one('h3.t') or container.select_one('h3.c-title')
+            if not title_element:
+                continue
                 
-                # 如果没有找到结果，尝试下一次重试
-                print("未找到搜索结果，尝试不同的方法...")
+            title = title_element.get_text().strip()
+            
+            # 提取链接
+            link_element = title_element.select_one('a')
+            if not link_element or not link_element.has_attr('href'):
+                continue
                 
-            except Exception as e:
-                print(f"搜索时出错 (尝试 {retry+1}/{max_retries}): {e}")
-                # 如果不是最后一次尝试，继续下一次
-                if retry < max_retries - 1:
-                    print("将在1秒后重试...")
-                    import time
-                    time.sleep(1)
+            link = link_element['href']
+            
+            # 百度搜索结果链接通常是重定向链接，需要进一步处理
+            if link.startswith('http'):
+                pass  # 已经是完整URL
+            else:
+                # 如果是相对链接，转换为绝对链接
+                link = f"https://www.baidu.com{link}"
+            
+            # 提取摘要 - 尝试多种选择器
+            snippet = ""
+            
+            # 尝试方法1：查找内容类
+            snippet_element = container.select_one('div.c-abstract') or container.select_one('div.c-span-last')
+            if snippet_element:
+                snippet = snippet_element.get_text().strip()
+            
+            # 尝试方法2：查找内容包装器
+            if not snippet:
+                content_wrappers = container.select('.pure-test-wrap_T03sY .content-right_1THTn')
+                if content_wrappers:
+                    snippet = content_wrappers[0].get_text().strip()
+            
+            # 尝试方法3：查找任何文本内容
+            if not snippet:
+                # 排除标题和链接元素
+                for text_element in container.find_all(string=True, recursive=True):
+                    parent = text_element.parent
+                    if parent and parent.name not in ['h3', 'a', 'script', 'style']:
+                        text = text_element.strip()
+                        if text and len(text) > 20:  # 只考虑较长的文本
+                            snippet = text
+                            break
+            
+            # 如果仍然没有找到摘要，使用占位符
+            if not snippet:
+                snippet = "百度搜索结果摘要不可用"
+            
+            count += 1
+            yield {
+                'title': title,
+                'link': link,
+                'snippet': snippet
+            }
+            
+            if count >= num_results:
+                break
+    
+    def _parse_bing_html(self, html, num_results=5):
+        """解析 Bing 搜索结果页 HTML。 | Parse Bing SERP HTML."""
+        return list(self._iter_bing_html(html, num_results))
+    
+    def _iter_bing_html(self, html, num_results=5):
+        """逐条产出 Bing 搜索结果。 | Yield Bing SERP results one at a time."""
+        soup = BeautifulSoup(html, 'html.parser')
+        count = 0
         
-        # 如果所有尝试都失败，使用模拟结果
-        print("所有搜索尝试均失败，使用模拟结果")
-        return self._mock_search_results(query, num_results)
+        # 提取搜索结果 | Extract search results
+        for result in soup.select('li.b_algo'):
+            title_element = result.select_one('h2 a')
+            snippet_element = result.select_one('div.b_caption p')
+            
+            if title_element and snippet_element:
+                title = title_element.get_text()
+                link = title_element['href']
+                snippet = snippet_element.get_text()
+                
+                count += 1
+                yield {
+                    'title': title,
+                    'link': link,
+                    'snippet': snippet
+                }
+                
+                if count >= num_results:
+                    break
     
     def _mock_search_results(self, query, num_results=5):
         """
@@ -314,126 +707,7 @@ class WebSearch:
         Note: This is a simple implementation. For production use, consider using 
         official Baidu Search API.
         """
-        search_url = f"https://www.baidu.com/s?wd={quote_plus(query)}&rn={num_results}"
-        
-        # 尝试不同的用户代理
-        user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
-            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"
-        ]
-        
-        # 最多尝试3次
-        max_retries = 3
-        for retry in range(max_retries):
-            try:
-                # 每次尝试使用不同的用户代理
-                current_headers = self.headers.copy()
-                current_headers["User-Agent"] = user_agents[retry % len(user_agents)]
-                
-                print(f"尝试百度搜索 (尝试 {retry+1}/{max_retries}): {search_url}")
-                print(f"使用用户代理: {current_headers['User-Agent'][:30]}...")
-                
-                response = requests.get(search_url, headers=current_headers, timeout=self.timeout)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                search_results = []
-                
-                # 保存HTML以便调试
-                debug_file = f"baidu_search_debug_{retry+1}.html"
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(response.text)
-                print(f"已保存响应HTML到 {debug_file}")
-                
-                # 百度搜索结果容器选择器
-                result_containers = soup.select('div.result.c-container')
-                if not result_containers:
-                    result_containers = soup.select('div.result-op.c-container')
-                if not result_containers:
-                    result_containers = soup.select('div.c-container')
-                
-                if result_containers:
-                    print(f"找到 {len(result_containers)} 个百度搜索结果")
-                    
-                    for container in result_containers:
-                        # 提取标题
-                        title_element = container.select_one('h3.t') or container.select_one('h3.c-title')
-                        if not title_element:
-                            continue
-                            
-                        title = title_element.get_text().strip()
-                        
-                        # 提取链接
-                        link_element = title_element.select_one('a')
-                        if not link_element or not link_element.has_attr('href'):
-                            continue
-                            
-                        link = link_element['href']
-                        
-                        # 百度搜索结果链接通常是重定向链接，需要进一步处理
-                        if link.startswith('http'):
-                            pass  # 已经是完整URL
-                        else:
-                            # 如果是相对链接，转换为绝对链接
-                            link = f"https://www.baidu.com{link}"
-                        
-                        # 提取摘要 - 尝试多种选择器
-                        snippet = ""
-                        
-                        # 尝试方法1：查找内容类
-                        snippet_element = container.select_one('div.c-abstract') or container.select_one('div.c-span-last')
-                        if snippet_element:
-                            snippet = snippet_element.get_text().strip()
-                        
-                        # 尝试方法2：查找内容包装器
-                        if not snippet:
-                            content_wrappers = container.select('.pure-test-wrap_T03sY .content-right_1THTn')
-                            if content_wrappers:
-                                snippet = content_wrappers[0].get_text().strip()
-                        
-                        # 尝试方法3：查找任何文本内容
-                        if not snippet:
-                            # 排除标题和链接元素
-                            for text_element in container.find_all(text=True, recursive=True):
-                                parent = text_element.parent
-                                if parent and parent.name not in ['h3', 'a', 'script', 'style']:
-                                    text = text_element.strip()
-                                    if text and len(text) > 20:  # 只考虑较长的文本
-                                        snippet = text
-                                        break
-                        
-                        # 如果仍然没有找到摘要，使用占位符
-                        if not snippet:
-                            snippet = "百度搜索结果摘要不可用"
-                        
-                        search_results.append({
-                            'title': title,
-                            'link': link,
-                            'snippet': snippet
-                        })
-                        
-                        if len(search_results) >= num_results:
-                            break
-                    
-                    if search_results:
-                        print(f"成功找到 {len(search_results)} 个百度搜索结果")
-                        # 确保只返回请求的结果数量
-                        return search_results[:num_results]
-                
-                print("未找到百度搜索结果，尝试不同的方法...")
-                
-            except Exception as e:
-                print(f"百度搜索时出错 (尝试 {retry+1}/{max_retries}): {e}")
-                if retry < max_retries - 1:
-                    print("将在1秒后重试...")
-                    import time
-                    time.sleep(1)
-        
-        # 如果所有尝试都失败，使用模拟结果
-        print("所有百度搜索尝试均失败，使用模拟结果")
-        return self._mock_search_results(query, num_results)
+        return list(self._iter_serp("baidu", query, num_results))
     
     def _bing_search(self, query, num_results=5):
         """
@@ -444,40 +718,7 @@ class WebSearch:
         Note: This is a simple implementation. For production use, consider using 
         official Bing Search API.
         """
-        search_url = f"https://www.bing.com/search?q={quote_plus(query)}&count={num_results}"
-        
-        try:
-            response = requests.get(search_url, headers=self.headers)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            search_results = []
-            
-            # 提取搜索结果 | Extract search results
-            for result in soup.select('li.b_algo'):
-                title_element = result.select_one('h2 a')
-                snippet_element = result.select_one('div.b_caption p')
-                
-                if title_element and snippet_element:
-                    title = title_element.get_text()
-                    link = title_element['href']
-                    snippet = snippet_element.get_text()
-                    
-                    search_results.append({
-                        'title': title,
-                        'link': link,
-                        'snippet': snippet
-                    })
-                    
-                    if len(search_results) >= num_results:
-                        break
-            
-            # 确保只返回请求的结果数量
-            return search_results[:num_results]
-            
-        except Exception as e:
-            print(f"Error during Bing search: {e}")
-            return []
+        return list(self._iter_serp("bing", query, num_results))
     
     def fetch_content(self, url: str, summarize: bool = False, max_length: int = 5000) -> Dict[str, Any]:
         """
@@ -491,16 +732,45 @@ class WebSearch:
             
         返回 | Returns:
             包含从网页提取的内容和元数据的字典 | Dictionary containing extracted content and metadata from the webpage
+        
+        异常 | Raises:
+            DeadlineExceeded: 当前请求设置了截止时间，且在抓取完成前已到 | The request deadline passed before the page was fetched
         """
+        fetch_start = time.perf_counter()
+        
+        # 优先使用存储中足够新的网页 | Reuse a fresh enough copy from the page store
+        if self.page_store is not None and self.page_cache_ttl:
+            try:
+                cached = self.page_store.get(url, max_age=self.page_cache_ttl)
+            except Exception as e:
+                logger.warning(f"读取网页存储失败 {url}: {e}")
+                cached = None
+            record_cache("page_store", cached is not None)
+            if cached:
+                result = self._build_page_result(
+                    url, cached.get("title"), cached.get("author"), cached.get("publish_date"),
+                    cached.get("content", ""), summarize, max_length
+                )
+                result["cached"] = True
+                result["fetched_at"] = cached["fetched_at"]
+                record_timing("total", time.perf_counter() - fetch_start, url=url, aggregate=False)
+                return result
+        
         try:
             # 添加小延迟以避免速率限制 | Add a small delay to avoid rate limiting
-            time.sleep(random.uniform(0.5, 1.5))
+            delay = random.uniform(0.5, 1.5)
+            left = deadline.remaining()
+            time.sleep(delay if left is None else min(delay, left))
             
             # 获取域名以供后续使用 | Get the domain for later use
             domain = urlparse(url).netloc
             
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
+            with time_stage("page_fetch", url=url):
+                response = requests.get(url, headers=self.headers, timeout=deadline.bounded_timeout(self.timeout))
+                response.raise_for_status()
+            BYTES_DOWNLOADED.inc(len(response.content), kind="page")
+            
+            parse_start = time.perf_counter()
             
             # 尝试检测编码 | Try to detect the encoding
             if 'charset' in response.headers.get('Content-Type', ''):
@@ -523,54 +793,47 @@ class WebSearch:
             # 尝试提取作者 | Try to extract author
             author = self._extract_author(soup)
             
-            # 移除不需要的元素 | Remove unwanted elements
-            for element in soup.select('nav, footer, header, aside, .ad, .ads, .advert, .cookie, .sidebar, .comments, .related'):
-                element.extract()
-            
-            # 移除脚本和样式元素 | Remove script and style elements
-            for script in soup(["script", "style", "svg", "noscript", "iframe"]):
-                script.extract()
-            
-            # Focus on main content area if possible
-            main_content = None
-            for selector in ['main', 'article', '.post-content', '.article-content', '.entry-content', '#content', '.content']:
-                main = soup.select_one(selector)
-                if main and len(main.get_text(strip=True)) > 200:
-                    main_content = main
-                    break
+            # 提取正文 | Extract the main text
+            if self.content_extractor == "density":
+                text = extract_main_text(soup)
+            else:
+                text = self._extract_main_text_selectors(soup)
+            observe_stage("page_parse", "", time.perf_counter() - parse_start, url=url)
             
-            # If no main content area was found, use the body
-            if not main_content:
-                main_content = soup.body if soup.body else soup
+            # Clean up the text
+            with time_stage("clean_text", url=url):
+                text = self._clean_text(text)
             
-            # Get text
-            text = main_content.get_text(' ', strip=True)
+            # 写入本地全文索引，供 "local" 引擎使用 | Add the page to the local full-text index
+            if self.local_index is not None and self.index_fetched_pages and text:
+                try:
+                    self.local_index.index_page(url, title, text)
+                except Exception as e:
+                    logger.warning(f"写入本地索引失败 {url}: {e}")
             
-            # Clean up the text
-            text = self._clean_text(text)
+            # 保存完整正文到网页存储 | Keep the full text in the page store
+            if self.page_store is not None and text:
+                try:
+                    self.page_store.put({
+                        "url": url,
+                        "title": title,
+                        "author": author,
+                        "publish_date": publish_date,
+                        "content": text
+                    })
+                except Exception as e:
+                    logger.warning(f"写入网页存储失败 {url}: {e}")
             
-            # Create a result dictionary
-            result = {
-                "url": url,
-                "domain": domain,
-                "title": title,
-                "author": author,
-                "publish_date": publish_date,
-                "content": text[:max_length] + "..." if len(text) > max_length else text,
-                "content_length": len(text)
-            }
+            result = self._build_page_result(url, title, author, publish_date, text, summarize, max_length, domain)
             
-            # Generate a summary if requested
-            if summarize and text:
-                summary = self._generate_summary(text)
-                key_points = self._extract_key_points(text)
-                result["summary"] = summary
-                result["key_points"] = key_points
-                
+            record_timing("total", time.perf_counter() - fetch_start, url=url, aggregate=False)
             return result
             
         except Exception as e:
-            print(f"Error fetching content from {url}: {e}")
+            record_timing("total", time.perf_counter() - fetch_start, url=url, aggregate=False)
+            if deadline.expired():
+                raise deadline.DeadlineExceeded(f"抓取 {url} 时请求截止时间已到") from e
+            logger.warning(f"Error fetching content from {url}: {e}")
             return {
                 "url": url,
                 "domain": urlparse(url).netloc,
@@ -579,6 +842,60 @@ class WebSearch:
                 "content_length": 0
             }
     
+    def _extract_main_text_selectors(self, soup: BeautifulSoup) -> str:
+        """
+        基于选择器的正文提取：删除模板元素后取第一个足够长的常见正文容器（会修改 soup）。
+        Selector-based extraction: strip boilerplate elements, then take the first common content
+        container with enough text (modifies the soup).
+        """
+        # 移除不需要的元素 | Remove unwanted elements
+        for element in soup.select('nav, footer, header, aside, .ad, .ads, .advert, .cookie, .sidebar, .comments, .related'):
+            element.extract()
+        
+        # 移除脚本和样式元素 | Remove script and style elements
+        for script in soup(["script", "style", "svg", "noscript", "iframe"]):
+            script.extract()
+        
+        # Focus on main content area if possible
+        main_content = None
+        for selector in ['main', 'article', '.post-content', '.article-content', '.entry-content', '#content', '.content']:
+            main = soup.select_one(selector)
+            if main and len(main.get_text(strip=True)) > 200:
+                main_content = main
+                break
+        
+        # If no main content area was found, use the body
+        if not main_content:
+            main_content = soup.body if soup.body else soup
+        
+        return main_content.get_text(' ', strip=True)
+    
+    def _build_page_result(self, url: str, title: Optional[str], author: Optional[str], publish_date: Optional[str],
+                           text: str, summarize: bool, max_length: int, domain: Optional[str] = None) -> Dict[str, Any]:
+        """
+        根据提取的正文和元数据构建 fetch_content 的返回结果。
+        Build the fetch_content result from extracted text and metadata.
+        """
+        result = {
+            "url": url,
+            "domain": domain if domain is not None else urlparse(url).netloc,
+            "title": title,
+            "author": author,
+            "publish_date": publish_date,
+            "content": text[:max_length] + "..." if len(text) > max_length else text,
+            "content_length": len(text)
+        }
+        
+        # Generate a summary if requested
+        if summarize and text:
+            with time_stage("summarize", url=url):
+                summary = self._generate_summary(text)
+                key_points = self._extract_key_points(text)
+            result["summary"] = summary
+            result["key_points"] = key_points
+        
+        return result
+    
     def _extract_title(self, soup: BeautifulSoup) -> str:
         """Extract the title of the webpage."""
         # Try to get title from og:title
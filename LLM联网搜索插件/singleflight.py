@@ -0,0 +1,163 @@
+"""
+相同请求的合并（singleflight）。
+Coalescing of identical in-flight requests ("singleflight").
+
+热门查询常在一秒内被很多用户同时提交。同一个键同时只执行一次计算：第一个调用者（leader）执行，
+其余调用者（follower）等待并拿到同一个结果。follower 拿到的是浅拷贝，不会与 leader 共享同一个 dict。
+A trending query often arrives from many users within the same second. Only one computation per
+key runs at a time: the first caller (the leader) runs it and the others (followers) wait for the
+same result. Followers receive shallow copies, so they never share a dict with the leader.
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Type
+
+import deadline
+from metrics import COALESCED_REQUESTS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stream:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        # leader 因自身原因提前停止（截止时间已到或调用方停止迭代），结果可能不完整
+        self.truncated = False
+
+
+class SingleFlight:
+    """
+    按键合并同时进行的相同调用，支持普通调用（do）和逐条产出结果的迭代器（stream）。
+    Coalesces concurrent calls with the same key, for plain calls (do) and for iterators that yield
+    results one at a time (stream).
+    """
+
+    def __init__(self, name: str):
+        """
+        参数 | Args:
+            name: 指标中的分组名 | Group name used in metrics
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _Stream] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           retry_on: Tuple[Type[BaseException], ...] = ()) -> Tuple[Any, bool]:
+        """
+        执行 fn，或等待正在进行的相同调用，返回 (结果, 是否为共享结果)。
+        Run fn, or wait for the identical call already in flight. Returns (result, shared).
+
+        leader 抛出的异常会传给 follower；属于 retry_on 的异常（例如只与 leader 自身有关的截止时间）
+        则由 follower 自己重新执行 fn。
+        The leader's exception is re-raised in followers, except for types in retry_on (errors that
+        only concern the leader, such as its own deadline), where each follower runs fn itself.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        COALESCED_REQUESTS.inc(group=self.name, role="leader" if leader else "follower")
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        call.done.wait()
+        if call.error is not None:
+            if isinstance(call.error, retry_on):
+                return fn(), False
+            raise call.error
+        return copy.copy(call.result), True
+
+    def stream(self, key: Hashable, factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """
+        迭代 factory() 的结果，或跟随正在进行的相同迭代：follower 在 leader 产出每个结果时立即拿到它，
+        流水线不会因为合并而变成批量。follower 的等待受当前请求的截止时间限制。
+        Iterate factory(), or follow the identical iteration already in flight: followers see each
+        item as soon as the leader produces it, so coalescing keeps the pipeline streaming. Followers
+        stop waiting when their own request deadline passes.
+
+        leader 因自身原因提前停止（截止时间已到或调用方停止迭代）时，还有时间的 follower 重新合并执行
+        factory()，跳过已经拿到的前几个结果后继续产出。
+        If the leader stops early for reasons of its own (its deadline passed or its caller stopped
+        iterating), followers with time left coalesce on a fresh run of factory() and continue after
+        the items they already received.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = _Stream()
+                self._streams[key] = shared
+        COALESCED_REQUESTS.inc(group=self.name, role="leader" if leader else "follower")
+
+        if leader:
+            yield from self._lead(key, shared, factory)
+        else:
+            yield from self._follow(key, shared, factory)
+
+    def _lead(self, key: Hashable, shared: _Stream, factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        try:
+            for item in factory():
+                with shared.cond:
+                    shared.items.append(item)
+                    shared.cond.notify_all()
+                yield item
+            # factory 在 leader 的截止时间到后返回的结果可能不完整 | factory may have cut its results short at the leader's deadline
+            shared.truncated = deadline.expired()
+        except (GeneratorExit, deadline.DeadlineExceeded):
+            shared.truncated = True
+            raise
+        except BaseException as e:
+            shared.error = e
+            raise
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            with shared.cond:
+                shared.finished = True
+                shared.cond.notify_all()
+
+    def _follow(self, key: Hashable, shared: _Stream, factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        index = 0
+        while True:
+            with shared.cond:
+                while index >= len(shared.items) and not shared.finished:
+                    if deadline.expired():
+                        return
+                    shared.cond.wait(deadline.remaining())
+                if index >= len(shared.items):
+                    if shared.truncated and not deadline.expired():
+                        break
+                    if isinstance(shared.error, Exception):
+                        raise shared.error
+                    return
+                item = shared.items[index]
+            index += 1
+            yield copy.copy(item)
+
+        # leader 提前停止：和其他 follower 一起重新执行，跳过已经拿到的结果
+        # The leader stopped early: run again, coalesced with the other followers, skipping what we already have
+        for position, item in enumerate(self.stream(key, factory)):
+            if position >= index:
+                yield item
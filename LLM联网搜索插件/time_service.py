@@ -0,0 +1,246 @@
+"""
+本地回答当前时间和日期的问题。
+Local answers to "what time / what date is it" questions.
+
+这类问题不需要模型也不需要搜索：系统时钟加上定期从外部时间源测得的偏差，再换算到配置的时区即可。
+偏差取自时间源 HTTP 响应的 Date 头（只发 HEAD 请求，不解析网页），在后台线程中刷新，回答时不访问网络。
+Questions like these need neither a model nor a search: the system clock, corrected by an offset
+periodically measured against external time sources and converted to the configured timezone, is
+enough. The offset comes from the HTTP Date header of the time sources (HEAD requests only, no page
+parsing) and is refreshed on a background thread, so answering never touches the network.
+"""
+
+import logging
+import re
+import statistics
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+import requests
+
+from metrics import CLOCK_OFFSET
+
+logger = logging.getLogger(__name__)
+
+# 偏差超过该秒数时提示系统时钟不准 | Offsets larger than this many seconds are reported as a skewed system clock
+SKEW_WARNING_SECONDS = 2.0
+
+WEEKDAYS_CN = ("一", "二", "三", "四", "五", "六", "日")
+WEEKDAYS_EN = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+MONTHS_EN = ("January", "February", "March", "April", "May", "June", "July",
+             "August", "September", "October", "November", "December")
+
+# 问题开头的客套话 | Polite lead-ins before the actual question
+_LEAD_IN = re.compile(
+    r"^(?:(?:请问|请告诉我|告诉我|你知道|hi|hey|hello|please|excuse me|"
+    r"(?:can|could) you (?:please )?tell me|do you know|tell me)[\s,，、]*)+"
+)
+_TRAILING = re.compile(r"[\s?？!！.。~～]+$")
+_CJK = re.compile(r"[一-鿿]")
+
+# 整句匹配，"what time does the store open"、"纽约现在几点" 这类问题不会被误判
+# Whole-question patterns, so "what time does the store open" or "纽约现在几点" are not mistaken for them
+_PATTERNS: List[Tuple[str, "re.Pattern[str]"]] = [(kind, re.compile(pattern)) for kind, pattern in [
+    ("datetime", r"(?:what(?:'s| is) )?(?:the )?(?:current )?(?:date and time|time and date)(?: (?:now|today))?"),
+    ("time", r"what time is it(?: now| right now)?"),
+    ("time", r"what(?:'s| is) the (?:current )?time(?: now| right now)?"),
+    ("time", r"(?:the )?(?:current|present) time|time now|what time now"),
+    ("date", r"what(?:'s| is) (?:the )?(?:date|today's date|current date)(?: today)?"),
+    ("date", r"what date is (?:it|today)(?: today)?|(?:today's|todays|current) date"),
+    ("weekday", r"what day(?: of the week)? is (?:it|today)(?: today)?|which day is (?:it|today)"),
+    ("datetime", r"(?:现在|当前|目前)的?(?:日期和时间|时间和日期|日期时间)(?:是多少|是什么)?[呢啊呀]*"),
+    ("time", r"(?:现在|当前|目前|此刻)?是?几点(?:钟)?了?[呢啊呀]*"),
+    ("time", r"(?:现在|当前|目前)的?时间(?:是多少|是几点|是什么)?[呢啊呀]*|现在(?:是)?什么时(?:间|候)了?[呢啊呀]*"),
+    ("weekday", r"今天(?:是)?(?:星期|周|礼拜)几[呢啊呀]*"),
+    ("date", r"今天(?:是)?(?:几月)?几(?:号|日)[呢啊呀]*|今天的?日期(?:是多少|是什么)?[呢啊呀]*"),
+    ("date", r"(?:当前|现在)的?日期(?:是多少|是什么)?[呢啊呀]*|今天(?:是)?什么日期[呢啊呀]*"),
+]]
+
+
+def classify_time_query(text: str) -> Optional[str]:
+    """
+    判断问题是否只是在问当前时间或日期，返回 "time"、"date"、"weekday"、"datetime"，否则返回 None。
+    Whether the question only asks for the current time or date: returns "time", "date", "weekday"
+    or "datetime", else None.
+    """
+    normalized = " ".join((text or "").lower().replace("’", "'").split())
+    normalized = _TRAILING.sub("", _LEAD_IN.sub("", normalized))
+    if _CJK.search(normalized):
+        normalized = normalized.replace(" ", "")
+    for kind, pattern in _PATTERNS:
+        if pattern.fullmatch(normalized):
+            return kind
+    return None
+
+
+def http_date_offset(session: requests.Session, url: str, timeout: float = 5) -> Tuple[float, float]:
+    """
+    用 HEAD 请求的 Date 响应头测量 url 所在服务器与本地时钟的偏差，返回 (偏差秒数, 往返秒数)。
+    Measure the offset between the server behind url and the local clock from the Date header of a
+    HEAD request. Returns (offset seconds, round-trip seconds).
+
+    Date 头只精确到秒，取 +0.5 秒作为估计，误差约为 ±(0.5 + 往返时间 / 2) 秒。
+    The Date header has whole-second resolution, so half a second is added; the error is about
+    ±(0.5 + round trip / 2) seconds.
+    """
+    sent = time.time()
+    response = session.head(url, timeout=timeout, allow_redirects=False)
+    received = time.time()
+    header = response.headers.get("Date")
+    if not header:
+        raise ValueError(f"{url} 的响应没有 Date 头")
+    server_time = parsedate_to_datetime(header).timestamp() + 0.5
+    return server_time - (sent + received) / 2, received - sent
+
+
+class TimeService:
+    """
+    经外部时间源校准的本地时钟，用于直接回答时间和日期问题。
+    Local clock, calibrated against external time sources, that answers time and date questions directly.
+    """
+
+    def __init__(self, timezone: str = "Asia/Shanghai", sources: Optional[List[str]] = None,
+                 refresh_interval: float = 3600, timeout: float = 5, user_agent: Optional[str] = None):
+        """
+        参数 | Args:
+            timezone: 回答使用的时区 | Timezone answers are given in
+            sources: 用于校准的时间源 URL | Time source URLs used for calibration
+            refresh_interval: 后台重新测量偏差的间隔（秒），0 表示不校准、只用系统时钟 |
+                              Seconds between background offset measurements; 0 uses the system clock as is
+            timeout: 每个时间源的请求超时（秒） | Request timeout per time source in seconds
+            user_agent: 请求时间源使用的 User-Agent | User-Agent sent to the time sources
+        """
+        self.sources = list(sources or [])
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._tz = pytz.timezone(timezone)
+
+        self._session = requests.Session()
+        if user_agent:
+            self._session.headers["User-Agent"] = user_agent
+        self._lock = threading.Lock()
+        self._offset = 0.0
+        self._synced_at: Optional[float] = None
+        self._synced_sources = 0
+        self._last_error: Optional[str] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def timezone(self) -> str:
+        return self._tz.zone
+
+    def set_timezone(self, timezone: str):
+        """切换回答使用的时区；未知时区保持原设置。 | Switch the answer timezone; unknown names keep the current one."""
+        try:
+            self._tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            logger.warning(f"未知的时区 {timezone}，继续使用 {self._tz.zone}")
+
+    @property
+    def offset(self) -> float:
+        with self._lock:
+            return self._offset
+
+    def now(self) -> datetime:
+        """校准后的当前时间（带时区）。 | The calibrated current time, timezone-aware."""
+        return datetime.fromtimestamp(time.time() + self.offset, self._tz)
+
+    def refresh(self) -> Optional[float]:
+        """
+        测量所有时间源，用偏差的中位数更新本地偏差；全部失败时保留原偏差并返回 None。
+        Measure every time source and adopt the median offset; if all fail the previous offset is
+        kept and None is returned.
+        """
+        offsets = []
+        errors = []
+        for url in list(self.sources):
+            try:
+                offsets.append(http_date_offset(self._session, url, self.timeout)[0])
+            except Exception as e:
+                errors.append(f"{url}: {e}")
+        if not offsets:
+            error = "; ".join(errors) or "没有配置时间源"
+            with self._lock:
+                changed = error != self._last_error
+                self._last_error = error
+            if changed:
+                logger.warning(f"校准时钟失败，继续使用原偏差: {error}")
+            return None
+
+        offset = statistics.median(offsets)
+        with self._lock:
+            self._offset = offset
+            self._synced_at = time.time()
+            self._synced_sources = len(offsets)
+            self._last_error = None
+        CLOCK_OFFSET.set(offset)
+        if abs(offset) > SKEW_WARNING_SECONDS:
+            logger.warning(f"系统时钟与外部时间源相差 {offset:+.1f} 秒，回答时间问题时已自动校正")
+        return offset
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(self.refresh_interval)
+
+    def start(self):
+        """启动后台校准线程（refresh_interval 为 0 时不启动）。 | Start the background calibration thread (not when refresh_interval is 0)."""
+        if self._thread is not None or not self.refresh_interval:
+            return
+        self._thread = threading.Thread(target=self._run, name="clock-offset", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def answer(self, query: str) -> Optional[str]:
+        """
+        问题只是在问当前时间或日期时返回回答（中文问题用中文回答，否则用英文），否则返回 None。
+        Answer the question if it only asks for the current time or date (in Chinese for Chinese
+        questions, English otherwise); otherwise return None.
+        """
+        kind = classify_time_query(query)
+        if kind is None:
+            return None
+        now = self.now()
+        utc_offset = now.strftime("%z")
+        utc_offset = f"UTC{utc_offset[:3]}:{utc_offset[3:]}"
+        clock = now.strftime("%H:%M:%S")
+
+        if _CJK.search(query):
+            date = f"{now.year}年{now.month}月{now.day}日"
+            weekday = f"星期{WEEKDAYS_CN[now.weekday()]}"
+            if kind == "time":
+                return f"现在是 {clock}（{date} {weekday}，{self.timezone}，{utc_offset}）。"
+            if kind == "date":
+                return f"今天是 {date} {weekday}（{self.timezone}）。"
+            if kind == "weekday":
+                return f"今天是{weekday}（{date}，{self.timezone}）。"
+            return f"现在是 {date} {weekday} {clock}（{self.timezone}，{utc_offset}）。"
+
+        date = f"{MONTHS_EN[now.month - 1]} {now.day}, {now.year}"
+        weekday = WEEKDAYS_EN[now.weekday()]
+        if kind == "time":
+            return f"It is {clock} on {weekday}, {date} ({self.timezone}, {utc_offset})."
+        if kind == "date":
+            return f"Today is {weekday}, {date} ({self.timezone})."
+        if kind == "weekday":
+            return f"Today is {weekday} ({date}, {self.timezone})."
+        return f"It is {weekday}, {date}, {clock} ({self.timezone}, {utc_offset})."
+
+    def status(self) -> Dict[str, Any]:
+        """返回时钟校准状态，用于 /health。 | Clock calibration status for /health."""
+        with self._lock:
+            return {
+                "timezone": self.timezone,
+                "offset_seconds": round(self._offset, 3),
+                "synced_at": datetime.fromtimestamp(self._synced_at).isoformat() if self._synced_at else None,
+                "synced_sources": self._synced_sources,
+                "refresh_interval": self.refresh_interval,
+                "last_error": self._last_error
+            }
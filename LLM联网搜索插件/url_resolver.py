@@ -0,0 +1,262 @@
+import base64
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, unquote, unquote_plus, urljoin, urlsplit, urlunsplit
+
+import requests
+
+from metrics import record_cache, time_stage
+
+logger = logging.getLogger(__name__)
+
+# 常见的跟踪参数，规范化时删除 | Common tracking parameters removed during canonicalisation
+TRACKING_PARAMS = {
+    "gclid", "dclid", "gbraid", "wbraid", "fbclid", "msclkid", "yclid", "igshid", "twclid", "ttclid",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "mkt_tok", "ref_src", "ref_url", "spm", "scm",
+    "share_source", "share_medium", "share_from", "vd_source", "bd_source_light",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hmsr", "hmpl", "hmcu", "hmkw", "hmci")
+
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# 百度落地页在不返回 Location 时用脚本或 meta refresh 跳转 | Baidu sometimes redirects via script or meta refresh instead of Location
+_BODY_REDIRECT = re.compile(
+    r"""(?:location\.replace\(|location\.href\s*=\s*|URL=)\s*['"]?([^'")\s>]+)""",
+    re.IGNORECASE
+)
+
+
+def _completed(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    规范化 URL：补全协议、小写协议和主机名、去掉默认端口、片段和跟踪参数，并解开 Google 的 /url?q= 包装。
+    Canonicalise a URL: default the scheme, lowercase scheme and host, drop default ports, fragments
+    and tracking parameters, and unwrap Google's /url?q= links.
+
+    路径、用户信息和其余查询参数都原样保留（包括编码方式和顺序），规范化后的 URL 与原 URL 指向同一资源。
+    Path, userinfo and the remaining query parameters are kept byte for byte (encoding and order
+    included), so the result points at the same resource as the original.
+
+    无法解析的 URL（例如端口越界或 IPv6 方括号不完整）原样返回（只去掉首尾空白）。
+    URLs that cannot be parsed (e.g. an out-of-range port or an unterminated IPv6 bracket) are
+    returned as they are, only stripped.
+    """
+    if not url:
+        return url
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    elif "://" not in url and re.match(r"^https?%3A", url, re.IGNORECASE):
+        # 从 /url?q= 截取出的链接仍是百分号编码的 | Links cut out of /url?q= are still percent-encoded
+        url = unquote(url)
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        return url
+
+    host = (parts.hostname or "").rstrip(".")
+    if not host:
+        return url
+    if (host == "google.com" or host.endswith(".google.com")) and parts.path == "/url":
+        params = dict(parse_qsl(parts.query))
+        target = params.get("q") or params.get("url")
+        if target and target.startswith("http"):
+            return canonicalize_url(target)
+
+    netloc = f"[{host}]" if ":" in host else host
+    if port and str(port) != _DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    userinfo, at, _ = parts.netloc.rpartition("@")
+    if at:
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path or "/"
+    # 只按名称删除跟踪参数，其余片段不重新编码（?foo 不会变成 ?foo=，%20 和 + 保持不变）
+    # Drop tracking parameters by name only; other segments are not re-encoded (?foo stays ?foo, %20 and + are untouched)
+    query = "&".join(
+        segment for segment in parts.query.split("&")
+        if not _is_tracking_param(unquote_plus(segment.partition("=")[0]))
+    ) if parts.query else ""
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def decode_bing_link(url: str) -> Optional[str]:
+    """
+    离线解码 Bing 的 /ck/a 点击跟踪链接（u 参数为 "a1" + base64url）。
+    Decode Bing /ck/a click-tracking links offline (the u parameter is "a1" + base64url).
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if not (parts.hostname or "").endswith("bing.com") or not parts.path.startswith("/ck/"):
+        return None
+    encoded = dict(parse_qsl(parts.query)).get("u", "")
+    if not encoded.startswith("a1"):
+        return None
+    encoded = encoded[2:]
+    try:
+        target = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode("utf-8")
+    except Exception:
+        return None
+    return target if target.startswith("http") else None
+
+
+def is_redirect_link(url: str) -> bool:
+    """判断链接是否为需要请求才能得到目标地址的搜索引擎跳转链接。 | Whether a link is an engine redirect that needs a request to resolve."""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    host = (parts.hostname or "").lower()
+    return (host == "baidu.com" or host.endswith(".baidu.com")) and parts.path in ("/link", "/baidu.php")
+
+
+class RedirectResolver:
+    """
+    搜索引擎跳转链接解析器，并发解析并把结果持久化缓存在 SQLite 中。
+    Resolves search-engine redirect links concurrently and caches the mapping persistently in SQLite.
+
+    解析失败时保留原始链接，且不写入缓存。
+    Links that fail to resolve are returned unchanged and are not cached.
+    """
+
+    def __init__(self, cache_path: str = "redirect_cache.db", timeout: float = 5, max_workers: int = 8,
+                 ttl: float = 30 * 86400, headers: Optional[Dict[str, str]] = None):
+        """
+        参数 | Args:
+            cache_path: SQLite 缓存文件路径 | Path of the SQLite cache
+            timeout: 单个跳转请求的超时（秒） | Timeout of one redirect request in seconds
+            max_workers: 并发解析的线程数 | Threads used to resolve links concurrently
+            ttl: 缓存条目的有效期（秒） | Seconds a cached mapping stays valid
+            headers: 请求头 | Request headers
+        """
+        self.timeout = timeout
+        self.ttl = ttl
+        self.headers = headers or {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="redirect")
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS redirects (
+                source TEXT PRIMARY KEY,
+                target TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _cached(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        cutoff = time.time() - self.ttl
+        placeholders = ",".join("?" * len(urls))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT source, target FROM redirects WHERE resolved_at >= ? AND source IN ({placeholders})",
+                [cutoff] + urls
+            ).fetchall()
+        return dict(rows)
+
+    def _store(self, mapping: Dict[str, str]):
+        if not mapping:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO redirects (source, target, resolved_at) VALUES (?, ?, ?)",
+                [(source, target, now) for source, target in mapping.items()]
+            )
+            self._conn.commit()
+
+    def _resolve_one(self, url: str) -> Optional[str]:
+        """请求跳转链接但不跟随，读取 Location 或页面中的跳转地址。 | Request the link without following it and read Location or the in-page redirect."""
+        try:
+            response = requests.get(url, headers=self.headers, timeout=self.timeout,
+                                    allow_redirects=False, stream=True)
+            try:
+                location = response.headers.get("Location")
+                if not location and response.status_code == 200:
+                    body = response.raw.read(8192, decode_content=True).decode("utf-8", "ignore")
+                    match = _BODY_REDIRECT.search(body)
+                    location = match.group(1) if match else None
+            finally:
+                response.close()
+        except Exception as e:
+            logger.debug(f"解析跳转链接失败 {url}: {e}")
+            return None
+        if not location:
+            return None
+        target = urljoin(url, location)
+        return target if target.startswith("http") else None
+
+    def _resolve_and_store(self, url: str, engine: str) -> str:
+        with time_stage("resolve_redirects", engine):
+            target = self._resolve_one(url)
+        if not target:
+            return url
+        target = canonicalize_url(target)
+        self._store({url: target})
+        return target
+
+    def submit(self, url: str, engine: str = "") -> Future:
+        """
+        异步解析一个链接，返回结果为规范化目标链接的 Future；不需要请求的链接返回已完成的 Future。
+        Resolve one link asynchronously. The Future's result is the canonical target; links that need
+        no request come back as an already-completed Future.
+        """
+        bing_target = decode_bing_link(url)
+        if bing_target:
+            return _completed(canonicalize_url(bing_target))
+        if not is_redirect_link(url):
+            return _completed(canonicalize_url(url))
+
+        cached = self._cached([url])
+        record_cache("redirects", url in cached)
+        if url in cached:
+            return _completed(cached[url])
+        return self._executor.submit(self._resolve_and_store, url, engine)
+
+    def resolve_many(self, urls: Iterable[str], engine: str = "") -> Dict[str, str]:
+        """
+        并发解析一组链接，返回 {原链接: 规范化后的目标链接}。无法解析的链接映射到自身。
+        Resolve a batch of links concurrently, returning {original: canonical target}. Unresolvable
+        links map to themselves.
+        """
+        futures = {url: self.submit(url, engine) for url in dict.fromkeys(urls)}
+        return {url: future.result() for url, future in futures.items()}
+
+    def resolve(self, url: str) -> str:
+        """解析单个链接。 | Resolve a single link."""
+        return self.resolve_many([url])[url]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,338 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from transformers import (
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopPLogitsWarper,
+)
+
+try:
+    from transformers import DynamicCache
+except ImportError:
+    # 旧版本 transformers 直接使用元组形式的 past_key_values
+    DynamicCache = None
+
+logger = logging.getLogger(__name__)
+
+
+def to_legacy_cache(cache):
+    """把模型返回的缓存转换成 ((key, value), ...) 元组，每个张量形状为 [batch, heads, seq, head_dim]"""
+    return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+
+
+def to_model_cache(legacy):
+    """把元组形式的缓存转换成模型需要的格式"""
+    return DynamicCache.from_legacy_cache(legacy) if DynamicCache is not None else legacy
+
+
+def _left_pad(tensor, length, dim):
+    """在 dim 维的左侧补零，使长度达到 length"""
+    pad = length - tensor.shape[dim]
+    if pad <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = pad
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+class _Sequence:
+    """批次中的一个请求"""
+
+    def __init__(self, input_ids, future, streamer=None, past=None, keep_cache=False):
+        self.input_ids = input_ids
+        self.future = future
+        self.streamer = streamer
+        self.past = past
+        self.keep_cache = keep_cache
+        self.cache = None
+        self.generated = []
+
+    def finish(self, error=None):
+        """设置结果或异常，并结束流式输出"""
+        if error is None:
+            self.future.set_result((self.generated, self.cache) if self.keep_cache else self.generated)
+        else:
+            self.future.set_exception(error)
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class _Batch:
+    """
+    正在解码的批次：所有序列左侧填充到同一长度，共享一份 KV 缓存。
+    positions 为每个序列下一个 token 的位置（即序列中真实 token 的数量），logits 为下一个 token 的分数。
+    """
+
+    def __init__(self, cache, attention_mask, positions, logits):
+        self.cache = cache
+        self.attention_mask = attention_mask
+        self.positions = positions
+        self.logits = logits
+
+    def merge(self, other):
+        """把新预填充的批次并入当前批次，较短的一方在左侧补齐"""
+        length = max(self.attention_mask.shape[1], other.attention_mask.shape[1])
+        cache = tuple(
+            (torch.cat([_left_pad(k1, length, 2), _left_pad(k2, length, 2).to(k1.device)]),
+             torch.cat([_left_pad(v1, length, 2), _left_pad(v2, length, 2).to(v1.device)]))
+            for (k1, v1), (k2, v2) in zip(self.cache, other.cache)
+        )
+        return _Batch(
+            cache,
+            torch.cat([_left_pad(self.attention_mask, length, 1), _left_pad(other.attention_mask, length, 1)]),
+            torch.cat([self.positions, other.positions]),
+            torch.cat([self.logits, other.logits])
+        )
+
+    def select(self, keep):
+        """只保留 keep 中的序列，并去掉所有序列都是填充的前导列"""
+        index = torch.tensor(keep, device=self.attention_mask.device)
+        attention_mask = self.attention_mask.index_select(0, index)
+        # 每个序列至少有一个真实 token，所以 nonzero 不会为空
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        cache = tuple(
+            (k.index_select(0, index.to(k.device))[:, :, start:], v.index_select(0, index.to(v.device))[:, :, start:])
+            for k, v in self.cache
+        )
+        return _Batch(cache, attention_mask[:, start:], self.positions.index_select(0, index),
+                      self.logits.index_select(0, index))
+
+    def row_cache(self, row):
+        """复制出第 row 个序列的缓存（去掉左侧填充），不引用整个批次的张量"""
+        start = self.attention_mask.shape[1] - int(self.positions[row])
+        return tuple((k[row:row + 1, :, start:].clone(), v[row:row + 1, :, start:].clone()) for k, v in self.cache)
+
+
+class BatchScheduler:
+    """
+    连续批处理调度器：后台线程收集等待中的请求，左侧填充后批量预填充，再逐个 token 批量解码。
+    生成结束的序列立即移出批次，空出的位置在下一步解码前由新到的请求补上，不必等整个批次生成完。
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait=0.02, max_new_tokens=512,
+                 temperature=0.7, top_p=0.9, repetition_penalty=1.1, do_sample=None):
+        """
+        max_batch_size: 同时解码的最大序列数
+        max_wait: 空闲时收到第一个请求后，最多等待多少秒凑齐一个批次
+        do_sample: 是否采样，None 表示沿用模型 generation_config 的设置（与 model.generate 一致）
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_new_tokens = max_new_tokens
+
+        generation_config = getattr(model, "generation_config", None)
+        eos_token_id = getattr(generation_config, "eos_token_id", None)
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        if do_sample is None:
+            do_sample = bool(getattr(generation_config, "do_sample", False))
+        self.do_sample = do_sample
+
+        # 与 model.generate 相同的顺序：先重复惩罚，采样时再做温度缩放和 top-p 截断
+        self.logits_processor = LogitsProcessorList()
+        if repetition_penalty and repetition_penalty != 1.0:
+            self.logits_processor.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+        if do_sample:
+            if temperature and temperature != 1.0:
+                self.logits_processor.append(TemperatureLogitsWarper(temperature))
+            if top_p is not None and top_p < 1.0:
+                self.logits_processor.append(TopPLogitsWarper(top_p))
+
+        # 统计信息，用于基准测试
+        self.steps = 0
+        self.sequences_per_step = 0
+
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids, streamer=None, past=None, keep_cache=False):
+        """
+        提交一个已编码的提示词，返回 Future，结果为新生成的 token 列表。
+        streamer 为可选的 TextIteratorStreamer 等流式输出对象，调用方式与 model.generate 相同：
+        先传入提示词，之后每生成一个 token 传入一次，结束时调用 end()。
+        past 为提示词前面一部分 token 已经算好的缓存（元组形式，batch 为 1），只预填充其余的 token；
+        keep_cache 为 True 时结果为 (新生成的 token, 缓存)，缓存包含提示词和除最后一个以外的新 token
+        """
+        sequence = _Sequence(list(input_ids), Future(), streamer, past, keep_cache)
+        if not input_ids:
+            sequence.finish(ValueError("提示词为空"))
+            return sequence.future
+        if past is not None and past[0][0].shape[2] >= len(input_ids):
+            # 缓存必须比提示词短，至少留一个 token 用于计算下一个 token 的分数
+            sequence.past = None
+        if streamer is not None:
+            streamer.put(torch.tensor(sequence.input_ids))
+        self._pending.put(sequence)
+        return sequence.future
+
+    def average_batch_size(self):
+        """平均每步解码的序列数"""
+        return self.sequences_per_step / self.steps if self.steps else 0.0
+
+    def _collect(self, limit, wait):
+        """从等待队列中最多取出 limit 个请求，最多等待 wait 秒"""
+        sequences = []
+        deadline = time.monotonic() + wait
+        while len(sequences) < limit:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    sequences.append(self._pending.get(timeout=timeout))
+                else:
+                    sequences.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        return sequences
+
+    def _run(self):
+        active = []
+        batch = None
+        while True:
+            if not active:
+                # 空闲时阻塞等待第一个请求，再短暂等待更多请求组成批次
+                first = self._pending.get()
+                admitted = [first] + self._collect(self.max_batch_size - 1, self.max_wait)
+            else:
+                # 解码过程中只接纳已经在等待的请求，不为此停下正在进行的批次
+                admitted = self._collect(self.max_batch_size - len(active), 0)
+
+            if admitted:
+                active, batch = self._admit(active, batch, admitted)
+                if not active:
+                    continue
+
+            try:
+                tokens = self._sample(active, batch.logits)
+                keep = []
+                for i, (sequence, token) in enumerate(zip(active, tokens)):
+                    sequence.generated.append(token)
+                    if sequence.streamer is not None:
+                        sequence.streamer.put(torch.tensor([token]))
+                    if token in self.eos_token_ids or len(sequence.generated) >= self.max_new_tokens:
+                        if sequence.keep_cache:
+                            sequence.cache = batch.row_cache(i)
+                        sequence.finish()
+                    else:
+                        keep.append(i)
+                self.steps += 1
+                self.sequences_per_step += len(active)
+
+                if not keep:
+                    active, batch = [], None
+                    continue
+                if len(keep) < len(active):
+                    batch = batch.select(keep)
+                    active = [active[i] for i in keep]
+                batch = self._decode(batch, [tokens[i] for i in keep])
+
+            except Exception as e:
+                logger.error(f"批量生成时发生错误: {str(e)}")
+                for sequence in active:
+                    if not sequence.future.done():
+                        sequence.finish(e)
+                active, batch = [], None
+
+    def _admit(self, active, batch, admitted):
+        """
+        预填充新接纳的请求并并入正在解码的批次，返回新的 (active, batch)。
+        没有缓存的请求一起预填充，有缓存的请求逐个只预填充缓存之后的部分。
+        预填充出错（例如提示词过长导致显存不足）时只有出错的请求失败，正在解码的请求不受影响；
+        一起预填充的一组请求出错时改为逐个预填充，找出出错的请求
+        """
+        fresh = [s for s in admitted if s.past is None]
+        parts = [(fresh, lambda: self._prefill(fresh))] if fresh else []
+        parts += [([s], lambda s=s: self._prefill_cached(s)) for s in admitted if s.past is not None]
+        added = 0
+        for sequences, prefill in parts:
+            try:
+                part = prefill()
+                merged = part if batch is None else batch.merge(part)
+            except Exception as e:
+                if len(sequences) > 1:
+                    logger.warning(f"一起预填充 {len(sequences)} 个新请求时发生错误，改为逐个预填充: {str(e)}")
+                    parts += [([s], lambda s=s: self._prefill([s])) for s in sequences]
+                    continue
+                logger.error(f"预填充新请求时发生错误: {str(e)}")
+                sequences[0].finish(e)
+                continue
+            batch = merged
+            active = active + sequences
+            added += len(sequences)
+        if added and len(active) > added:
+            logger.debug(f"批次中加入 {added} 个新请求，当前 {len(active)} 个")
+        return active, batch
+
+    @torch.inference_mode()
+    def _prefill(self, sequences):
+        """左侧填充后一次性预填充一组新请求"""
+        length = max(len(sequence.input_ids) for sequence in sequences)
+        input_ids = torch.full((len(sequences), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+        for i, sequence in enumerate(sequences):
+            input_ids[i, length - len(sequence.input_ids):] = torch.tensor(sequence.input_ids)
+            attention_mask[i, length - len(sequence.input_ids):] = 1
+        input_ids = input_ids.to(self.model.device)
+        attention_mask = attention_mask.to(self.model.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                             position_ids=position_ids, use_cache=True)
+        return _Batch(to_legacy_cache(outputs.past_key_values), attention_mask,
+                      attention_mask.sum(-1), outputs.logits[:, -1, :].float())
+
+    @torch.inference_mode()
+    def _prefill_cached(self, sequence):
+        """在已有缓存的基础上只预填充提示词中缓存之后的 token"""
+        cache = sequence.past
+        cached = cache[0][0].shape[2]
+        device = self.model.device
+        input_ids = torch.tensor([sequence.input_ids[cached:]], device=device)
+        attention_mask = torch.ones((1, len(sequence.input_ids)), dtype=torch.long, device=device)
+        position_ids = torch.arange(cached, len(sequence.input_ids), device=device).unsqueeze(0)
+
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=to_model_cache(cache), use_cache=True)
+        # 缓存已并入批次，不再单独持有
+        sequence.past = None
+        return _Batch(to_legacy_cache(outputs.past_key_values), attention_mask,
+                      attention_mask.sum(-1), outputs.logits[:, -1, :].float())
+
+    @torch.inference_mode()
+    def _decode(self, batch, tokens):
+        """把每个序列上一步采样的 token 送入模型，得到下一个 token 的分数"""
+        device = batch.attention_mask.device
+        attention_mask = torch.cat([batch.attention_mask, batch.attention_mask.new_ones((len(tokens), 1))], dim=1)
+        outputs = self.model(
+            input_ids=torch.tensor(tokens, device=device).unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=batch.positions.unsqueeze(-1),
+            past_key_values=to_model_cache(batch.cache),
+            use_cache=True
+        )
+        return _Batch(to_legacy_cache(outputs.past_key_values), attention_mask,
+                      batch.positions + 1, outputs.logits[:, -1, :].float())
+
+    @torch.inference_mode()
+    def _sample(self, sequences, logits):
+        """按每个序列自己的历史 token 处理分数（重复惩罚不受填充影响），再采样或取最大值"""
+        tokens = []
+        for i, sequence in enumerate(sequences):
+            history = torch.tensor([sequence.input_ids + sequence.generated], device=logits.device)
+            scores = self.logits_processor(history, logits[i:i + 1])
+            if self.do_sample:
+                token = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+            else:
+                token = scores.argmax(dim=-1)
+            tokens.append(int(token.item()))
+        return tokens
@@ -0,0 +1,89 @@
+"""
+连续批处理吞吐量基准：同样的一组提示词分别逐个生成（与原来 Gradio 逐个处理请求相同）
+和由多个线程并发提交给 BatchScheduler，比较每秒请求数、每秒生成的 token 数和请求延迟。
+
+使用方法:
+    python benchmark_batching.py [--requests 16] [--concurrency 8] [--max-batch-size 8] [--max-new-tokens 128]
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import BatchScheduler
+from run_model import generate_tokens, model, tokenizer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "你好，请介绍一下你自己",
+    "请帮我写一个Python的Hello World程序",
+    "解释一下什么是人工智能",
+    "用三句话概括量子计算的基本原理",
+    "列出学习机器学习需要掌握的数学知识",
+    "What is the difference between a process and a thread?",
+    "写一首关于秋天的短诗",
+    "Explain how HTTPS keeps a connection secure.",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def report(name, wall, latencies, tokens):
+    print(f"{name:8s} 总耗时 {wall:7.2f}s  {len(latencies) / wall:6.2f} 请求/秒  {tokens / wall:8.1f} token/秒  "
+          f"延迟 p50 {percentile(latencies, 50):6.2f}s p95 {percentile(latencies, 95):6.2f}s")
+    return {"wall_seconds": wall, "requests_per_sec": len(latencies) / wall, "tokens_per_sec": tokens / wall}
+
+
+def run_serial(prompts, max_new_tokens):
+    """逐个生成：每个请求都要等前面的请求全部生成完（延迟从开始提交时算起）"""
+    latencies = []
+    tokens = 0
+    start = time.perf_counter()
+    for input_ids in prompts:
+        tokens += len(generate_tokens(input_ids, max_new_tokens))
+        latencies.append(time.perf_counter() - start)
+    return report("serial", time.perf_counter() - start, latencies, tokens)
+
+
+def run_batched(prompts, max_new_tokens, concurrency, max_batch_size, max_wait):
+    """多个线程并发提交给批处理调度器"""
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=max_batch_size, max_wait=max_wait,
+                               max_new_tokens=max_new_tokens)
+
+    def request(input_ids):
+        submitted = time.perf_counter()
+        generated = scheduler.submit(input_ids).result()
+        return time.perf_counter() - submitted, len(generated)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, prompts))
+    wall = time.perf_counter() - start
+    stats = report("batched", wall, [latency for latency, _ in results], sum(count for _, count in results))
+    stats["average_batch_size"] = scheduler.average_batch_size()
+    print(f"{'':8s} 平均每步解码 {stats['average_batch_size']:.2f} 个序列")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="连续批处理吞吐量基准")
+    parser.add_argument("--requests", type=int, default=16, help="请求数 (默认: 16)")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发提交的线程数 (默认: 8)")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="最大批次 (默认: 8)")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="组成批次的最长等待时间（毫秒，默认: 20）")
+    parser.add_argument("--max-new-tokens", type=int, default=128, help="每个请求最多生成的 token 数 (默认: 128)")
+    args = parser.parse_args()
+
+    prompts = [tokenizer(PROMPTS[i % len(PROMPTS)]).input_ids for i in range(args.requests)]
+    # 预热，避免首次调用的初始化开销计入结果
+    generate_tokens(prompts[0], 8)
+
+    serial = run_serial(prompts, args.max_new_tokens)
+    batched = run_batched(prompts, args.max_new_tokens, args.concurrency, args.max_batch_size, args.max_wait_ms / 1000)
+    print(f"\n批处理吞吐量为逐个生成的 {batched['tokens_per_sec'] / serial['tokens_per_sec']:.2f} 倍")
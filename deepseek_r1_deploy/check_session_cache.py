@@ -0,0 +1,68 @@
+"""
+检查多轮对话是否复用了会话 KV 缓存：两轮对话之间的历史经过真实的 gr.Chatbot 显示与回传
+（postprocess / preprocess，其中会对消息做 inspect.cleandoc），第二轮应当命中缓存，
+只预填充新的用户消息。
+
+使用方法:
+    python check_session_cache.py
+"""
+
+import logging
+
+import gradio as gr
+
+import run_model
+from run_model import stream_chat
+
+SESSION_ID = "check-session-cache"
+MESSAGES = [
+    # 首尾空白和多行缩进会被 cleandoc 改写，用来检查两边的规范化是否一致
+    "  请用两行缩进的列表\n    列出三种水果  ",
+    "再加一种蔬菜",
+]
+
+
+class _PrefillLog(logging.Handler):
+    """记录 run_model 日志中每一轮的提示词和预填充 token 数"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if "预填充" in message:
+            prompt = int(message.split("提示词 ")[1].split(" ")[0])
+            prefill = int(message.split("预填充 ")[1].split(" ")[0])
+            self.records.append((prompt, prefill))
+
+
+def chatbot_round_trip(chatbot, history):
+    """模拟界面：历史先显示在 Chatbot 中，再在下一轮作为输入传回"""
+    return chatbot.preprocess(chatbot.postprocess(history))
+
+
+if __name__ == "__main__":
+    if run_model.session_cache is None:
+        raise SystemExit("KV_CACHE_MAX_MB 为 0，会话 KV 缓存未启用")
+
+    handler = _PrefillLog()
+    run_model.logger.addHandler(handler)
+    chatbot = gr.Chatbot()
+    history = []
+    for message in MESSAGES:
+        previous = chatbot_round_trip(chatbot, history)
+        reply = ""
+        for reply in stream_chat(message, previous, session_id=SESSION_ID):
+            pass
+        history = previous + [[message, reply]]
+        print(f"用户: {message!r}\n回复: {reply!r}\n")
+    run_model.forget_session(SESSION_ID)
+
+    assert len(handler.records) == len(MESSAGES), f"预期 {len(MESSAGES)} 条预填充日志，实际 {handler.records}"
+    (first_prompt, first_prefill), (second_prompt, second_prefill) = handler.records
+    print(f"第一轮: 提示词 {first_prompt} 个 token，预填充 {first_prefill} 个")
+    print(f"第二轮: 提示词 {second_prompt} 个 token，预填充 {second_prefill} 个")
+    assert first_prefill == first_prompt, "第一轮不应有缓存"
+    assert second_prefill <= second_prompt - first_prompt, "第二轮没有复用会话 KV 缓存"
+    print("第二轮复用了会话 KV 缓存")
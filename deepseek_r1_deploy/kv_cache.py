@@ -0,0 +1,80 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def cache_nbytes(cache):
+    """元组形式的 past_key_values 占用的字节数"""
+    return sum(t.numel() * t.element_size() for layer in cache for t in layer)
+
+
+class SessionEntry:
+    """
+    一个会话上一轮结束时的状态：对话历史、对话的全部 token 和其中前一部分 token 的 past_key_values
+    """
+
+    def __init__(self, history, input_ids, cache):
+        # 缓存对应的对话历史 [(用户消息, 回复), ...]，只有下一轮传入的历史与之相同时才能复用
+        self.history = history
+        self.input_ids = input_ids
+        self.cache = cache
+        self.cached_tokens = cache[0][0].shape[2]
+        self.nbytes = cache_nbytes(cache)
+
+
+class SessionKVCache:
+    """
+    按会话保存 KV 缓存，下一轮对话只需预填充新的用户消息。
+    总大小超过 max_bytes 时淘汰最久未使用的会话。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._nbytes = 0
+
+    def take(self, session_id):
+        """
+        取出会话的缓存（同时从缓存中移除），没有时返回 None。
+        生成期间缓存归调用方所有，同一会话的并发请求不会共用同一份缓存；生成结束后再用 put 放回。
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._nbytes -= entry.nbytes
+            return entry
+
+    def put(self, session_id, entry):
+        """保存会话的缓存，并按 LRU 淘汰其他会话直到总大小不超过上限"""
+        if entry.nbytes > self.max_bytes:
+            logger.info(f"会话 KV 缓存 {entry.nbytes / 2 ** 20:.1f}MB 超过上限，不再缓存")
+            self.forget(session_id)
+            return
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+            self._entries[session_id] = entry
+            self._nbytes += entry.nbytes
+            while self._nbytes > self.max_bytes:
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+                logger.info(f"淘汰会话 {evicted_id} 的 KV 缓存（{evicted.cached_tokens} 个 token，{evicted.nbytes / 2 ** 20:.1f}MB）")
+        stats = self.stats()
+        logger.info(f"缓存会话 {session_id} 的 KV（{entry.cached_tokens} 个 token，{entry.nbytes / 2 ** 20:.1f}MB），"
+                    f"共 {stats['sessions']} 个会话 {stats['bytes'] / 2 ** 20:.1f}/{stats['max_bytes'] / 2 ** 20:.0f}MB")
+
+    def forget(self, session_id):
+        """删除会话的缓存，例如用户清空了对话"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._nbytes -= entry.nbytes
+
+    def stats(self):
+        """当前缓存的会话数和占用的字节数"""
+        with self._lock:
+            return {"sessions": len(self._entries), "bytes": self._nbytes, "max_bytes": self.max_bytes}
@@ -1,6 +1,14 @@
 from modelscope import snapshot_download, AutoModelForCausalLM, AutoTokenizer
 import torch
 import logging
+import inspect
+import os
+import time
+from concurrent.futures import Future
+from threading import Thread
+from transformers import TextIteratorStreamer
+from batching import BatchScheduler, to_legacy_cache, to_model_cache
+from kv_cache import SessionEntry, SessionKVCache
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -119,24 +127,180 @@ except Exception as e:
     logger.error(f"加载模型时发生错误: {str(e)}")
     raise
 
+MAX_NEW_TOKENS = 512
+
+# 连续批处理：并发请求合并成批次生成，BATCH_MAX_SIZE=1 时逐个生成
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+# 空闲时收到请求后等待更多请求组成批次的最长时间（毫秒）
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 20))
+
+scheduler = None
+if BATCH_MAX_SIZE > 1:
+    scheduler = BatchScheduler(
+        model,
+        tokenizer,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait=BATCH_MAX_WAIT_MS / 1000,
+        max_new_tokens=MAX_NEW_TOKENS,
+        temperature=0.7,
+        top_p=0.9,
+        repetition_penalty=1.1
+    )
+    logger.info(f"启用连续批处理，最大批次 {BATCH_MAX_SIZE}，最长等待 {BATCH_MAX_WAIT_MS} 毫秒")
+
+# 按会话缓存 KV，下一轮对话只预填充新的用户消息；超过上限（MB）时淘汰最久未使用的会话，0 表示不缓存
+KV_CACHE_MAX_MB = float(os.environ.get("KV_CACHE_MAX_MB", 512))
+session_cache = SessionKVCache(int(KV_CACHE_MAX_MB * 2 ** 20)) if KV_CACHE_MAX_MB > 0 else None
+
+CHAT_HEADER = "让我们进行一次友好的对话。\n\n"
+
+def generate_tokens(input_ids, max_new_tokens=MAX_NEW_TOKENS, streamer=None, past=None, keep_cache=False):
+    """
+    逐个生成（不经过批处理），返回新生成的 token；streamer 不为空时每生成一个 token 就交给它。
+    past 与 keep_cache 的含义与 BatchScheduler.submit 相同
+    """
+    inputs = torch.tensor([input_ids], device=device)
+    extra = {}
+    if past is not None:
+        extra["past_key_values"] = to_model_cache(past)
+    outputs = model.generate(
+        input_ids=inputs,
+        attention_mask=torch.ones_like(inputs),
+        max_new_tokens=max_new_tokens,
+        temperature=0.7,
+        top_p=0.9,
+        repetition_penalty=1.1,
+        streamer=streamer,
+        return_dict_in_generate=keep_cache,
+        **extra
+    )
+    if not keep_cache:
+        return outputs[0][len(input_ids):].tolist()
+    return outputs.sequences[0][len(input_ids):].tolist(), to_legacy_cache(outputs.past_key_values)
+
+def _generate_in_thread(input_ids, streamer, past=None, keep_cache=False):
+    """在工作线程中逐个生成，返回 Future；出错时同样结束流式输出，避免调用方一直等待"""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(generate_tokens(input_ids, streamer=streamer, past=past, keep_cache=keep_cache))
+        except Exception as e:
+            future.set_exception(e)
+            streamer.end()
+
+    Thread(target=run, name="generate", daemon=True).start()
+    return future
+
+def _stream(input_ids, past=None, keep_cache=False):
+    """
+    流式生成：每生成一段文本就产出一次目前为止的回复（不含提示词），并记录首个 token 的延迟；
+    生成器的返回值为 (完整的回复, generate_tokens 的结果)
+    """
+    start = time.perf_counter()
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    
+    # 生成在调度器或工作线程中进行，当前线程只从 streamer 读取文本
+    if scheduler is not None:
+        future = scheduler.submit(input_ids, streamer=streamer, past=past, keep_cache=keep_cache)
+    else:
+        future = _generate_in_thread(input_ids, streamer, past, keep_cache)
+    
+    prefill_tokens = len(input_ids) - (past[0][0].shape[2] if past is not None else 0)
+    response = ""
+    first_token_seconds = None
+    for text in streamer:
+        if first_token_seconds is None and text:
+            first_token_seconds = time.perf_counter() - start
+            logger.info(f"首个 token 延迟: {first_token_seconds:.2f}秒（提示词 {len(input_ids)} 个 token，预填充 {prefill_tokens} 个）")
+        response += text
+        yield response
+    
+    # 生成出错时在这里抛出异常
+    result = future.result()
+    generated = result[0] if keep_cache else result
+    logger.info(f"回复生成完成，共 {len(generated)} 个 token，耗时 {time.perf_counter() - start:.2f}秒")
+    return response, result
+
+def stream_response(prompt):
+    """
+    流式生成回复：每生成一段文本就产出一次目前为止的回复（不含提示词）
+    """
+    yield from _stream(tokenizer(prompt).input_ids)
+
+def _encode(text):
+    return tokenizer(text, add_special_tokens=False).input_ids
+
+def encode_chat(history, message):
+    """
+    按轮次分段编码对话，每一轮的编码不受后面内容影响，
+    因此上一轮缓存的 token 正好是这一轮的前缀
+    """
+    input_ids = tokenizer(CHAT_HEADER).input_ids
+    for user_message, reply in history:
+        input_ids += _encode(f"Human: {user_message}\nAssistant: ") + _encode(reply) + _encode("\n")
+    return input_ids + _encode(f"Human: {message}\nAssistant: ")
+
+def normalize_history(history):
+    """
+    按 Gradio Chatbot 显示消息的方式（inspect.cleandoc）规范化对话历史，
+    使缓存中保存的历史与下一轮界面传回的历史可以直接比较
+    """
+    return [(inspect.cleandoc(str(user_message)), inspect.cleandoc(str(reply))) for user_message, reply in history]
+
+def stream_chat(message, history, session_id=None):
+    """
+    流式生成多轮对话的回复，产出目前为止的回复文本。
+    指定 session_id 时复用该会话上一轮的 KV 缓存，只预填充上一轮回复之后的内容；
+    传入的历史与缓存时不同（例如用户清空或修改了对话）时从头编码
+    """
+    history = normalize_history(history)
+    use_cache = session_cache is not None and session_id is not None
+    entry = session_cache.take(session_id) if use_cache else None
+    
+    if entry is not None and entry.history == history:
+        # 上一轮的 token 加上换行和新的用户消息，与 encode_chat 的分段方式相同
+        input_ids = entry.input_ids + _encode("\n") + _encode(f"Human: {message}\nAssistant: ")
+        past = entry.cache
+        logger.info(f"复用会话 {session_id} 的 KV 缓存（{entry.cached_tokens} 个 token）")
+    else:
+        if entry is not None:
+            logger.info(f"会话 {session_id} 的对话历史与缓存不一致，重新编码整个对话")
+        input_ids = encode_chat(history, message)
+        past = None
+    
+    reply, result = yield from _stream(input_ids, past, keep_cache=use_cache)
+    if not use_cache:
+        return
+    
+    generated, cache = result
+    # 结尾的结束符不属于对话内容
+    if generated and generated[-1] in tokenizer.all_special_ids:
+        generated = generated[:-1]
+    # 历史按界面显示的方式规范化后保存，下一轮传回的历史与之比较
+    entry = SessionEntry(history + normalize_history([(message, reply)]), input_ids + generated, cache)
+    session_cache.put(session_id, entry)
+
+def forget_session(session_id):
+    """删除会话的 KV 缓存（用户清空对话时调用）"""
+    if session_cache is not None:
+        session_cache.forget(session_id)
+
 def generate_response(prompt):
     try:
         logger.info("开始处理输入...")
         # 对输入进行编码
-        inputs = tokenizer(prompt, return_tensors="pt").to(device)
+        input_ids = tokenizer(prompt).input_ids
         
         logger.info("开始生成回复...")
-        # 生成回复
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=512,
-            temperature=0.7,
-            top_p=0.9,
-            repetition_penalty=1.1
-        )
+        # 生成回复：启用批处理时与其他并发请求一起生成
+        if scheduler is not None:
+            generated = scheduler.submit(input_ids).result()
+        else:
+            generated = generate_tokens(input_ids)
         
         # 解码并返回回复
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        response = tokenizer.decode(input_ids + generated, skip_special_tokens=True)
         logger.info("回复生成完成")
         return response
     
@@ -1,28 +1,33 @@
 import gradio as gr
-from run_model import generate_response
+from run_model import stream_chat, forget_session, BATCH_MAX_SIZE
 import logging
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def chat(message, history):
-    """处理聊天消息"""
+def chat(message, history, request: gr.Request):
+    """处理聊天消息，回复随生成逐步显示；同一浏览器会话的多轮对话复用模型的 KV 缓存"""
+    previous = list(history)
+    
+    # 直接返回元组列表格式，最后一条的回复随生成不断更新
+    history.append((message, ""))
     try:
-        context = "让我们进行一次友好的对话。\n\n"
-        for hist in history:
-            context += f"Human: {hist[0]}\nAssistant: {hist[1]}\n"
-        context += f"Human: {message}\n"
-        
-        response = generate_response(context)
-        
-        # 直接返回元组列表格式
-        history.append((message, response))
-        return history
+        for response in stream_chat(message, previous, session_id=request.session_hash):
+            history[-1] = (message, response)
+            yield history
+        # 没有生成任何文本时也要显示这一轮对话
+        yield history
         
     except Exception as e:
         logger.error(f"生成回复时发生错误: {str(e)}")
-        return history + [(message, f"抱歉，发生了错误: {str(e)}")]
+        history[-1] = (message, f"抱歉，发生了错误: {str(e)}")
+        yield history
+
+def clear_chat(request: gr.Request):
+    """清空对话，同时删除该会话的 KV 缓存"""
+    forget_session(request.session_hash)
+    return []
 
 def create_ui():
     with gr.Blocks(title="DeepSeek Chat", theme=gr.themes.Soft()) as demo:
@@ -72,7 +77,7 @@ def create_ui():
             show_progress=False,
         )
         
-        clear.click(lambda: [], None, chatbot, queue=False)  # 修改清空对话的返回值
+        clear.click(clear_chat, None, chatbot, queue=False)  # 修改清空对话的返回值
         
         # 添加示例问题
         gr.Examples(
@@ -89,7 +94,8 @@ def create_ui():
 if __name__ == "__main__":
     # 启动 Gradio 服务
     demo = create_ui()
-    demo.queue()
+    # 允许多个对话同时进入 generate_response，由批处理调度器合并生成
+    demo.queue(default_concurrency_limit=BATCH_MAX_SIZE)
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,